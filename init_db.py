@@ -1,40 +1,46 @@
 #!/usr/bin/env python
 # initialize an XAS Spectral Library DB
 # with a small amount of data, suitable for testing
+#
+#   init_db.py [dbname] [--incremental]
+#
+# with --incremental, an existing database is kept, and only files
+# that are new or changed since they were last read are added.
 
 import sys
 import os
-import glob
 import xaslib
 import sqlalchemy
 
-dbname = sys.argv[1] if len(sys.argv) > 1 else 'xaslib.db'
+args = [a for a in sys.argv[1:] if not a.startswith('--')]
+incremental = '--incremental' in sys.argv[1:]
+dbname = args[0] if len(args) > 0 else 'xaslib.db'
+email = 'xaslib@xrayabsorption.org'
 
-if os.path.exists(dbname):
-    os.unlink(dbname)
+if incremental and os.path.exists(dbname):
+    db = xaslib.connect_xaslib(dbname)
+    db.upgrade_schema()
+    print( 'Updating database %s' % dbname)
+else:
+    if os.path.exists(dbname):
+        os.unlink(dbname)
 
-xaslib.create_xaslib(dbname)
-print( 'Created database %s' % dbname)
+    xaslib.create_xaslib(dbname)
+    print( 'Created database %s' % dbname)
 
-db = xaslib.connect_xaslib(dbname)
-print( 'Verified that database %s can be accessed.' % dbname)
+    db = xaslib.connect_xaslib(dbname)
+    print( 'Verified that database %s can be accessed.' % dbname)
 
-db.add_person('xaslib admin', 'xaslib@xrayabsorption.org', affiliation='IXAS')
-person = db.set_person_password('xaslib@xrayabsorption.org',
-                                'b@d_p@ssw0rd!',
-                                auto_confirm=True)
-email  = db.get_person('xaslib@xrayabsorption.org').email
+    db.add_person('xaslib admin', email, affiliation='IXAS')
+    person = db.set_person_password(email, 'b@d_p@ssw0rd!',
+                                    auto_confirm=True)
 
 datadir = 'data'
-subdirs = sorted(os.listdir(datadir))
-# subdirs = ('Pb', 'Sr')
-
-n = 0
-for sdir in subdirs:
-    sdirname = os.path.join(datadir, sdir)
-    for f in sorted(glob.glob("%s/*.xdi"  % sdirname)):
-        if 'nonxafs' in f or 'upload' in f:
-            continue
-        db.add_xdifile(f, person=email, verbose=True)
-        n += 1
-print("'%s' has %d spectra" % (dbname, n))
+
+out = db.ingest_directory(datadir, person=email, workers=os.cpu_count(),
+                          incremental=incremental, progress=True)
+for fname, msg in out['failed']:
+    print("could not add %s: %s" % (fname, msg))
+print("'%s': %d spectra added, %d updated, %d files unchanged, in %.1f s" %
+      (dbname, len(out['added']), len(out['updated']), out['skipped'],
+       out['elapsed']))
@@ -1,13 +1,14 @@
-
+PRAGMA foreign_keys=OFF;
+BEGIN TRANSACTION;
 CREATE TABLE info (
 	"key" TEXT NOT NULL,
 	value TEXT,
 	PRIMARY KEY ("key"),
 	UNIQUE ("key")
 );
-INSERT INTO "info" VALUES('version','1.1.0');
-INSERT INTO "info" VALUES('create_date','2015-08-25T09:09:36.785775');
-INSERT INTO "info" VALUES('modify_date','2015-08-25T09:09:36.785775');
+INSERT INTO info VALUES('version','1.2.0');
+INSERT INTO info VALUES('create_date','2026-10-18T06:31:02.523380');
+INSERT INTO info VALUES('modify_date','2026-10-18T06:31:02.523380');
 CREATE TABLE ligand (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
@@ -15,41 +16,80 @@ CREATE TABLE ligand (
 	PRIMARY KEY (id),
 	UNIQUE (name)
 );
-CREATE TABLE facility (
+CREATE TABLE mode (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
-	fullname TEXT,
-	laboratory TEXT,
-	city TEXT,
-	region TEXT,
-	country TEXT NOT NULL,
 	PRIMARY KEY (id),
 	UNIQUE (name)
 );
-INSERT INTO "facility" VALUES(1,'SSRL',NULL,'Stanford Synchrotron Radiation Laboratory','SLAC','Palo Alto','CA','US');
-INSERT INTO "facility" VALUES(2,'SRS',NULL,'Synchrotron Radiation Source','Daresbury Laboratory','Cheshire','','UK');
-INSERT INTO "facility" VALUES(3,'NSLS',NULL,'National Synchrotron Light Source','BNL','Upton','NY','US');
-INSERT INTO "facility" VALUES(4,'PF',NULL,'Photon Factory','KEK','Tsukuba','','Japan');
-INSERT INTO "facility" VALUES(5,'ESRF',NULL,'European Synchrotron Radiation Facility','','Grenoble','','France');
-INSERT INTO "facility" VALUES(6,'APS',NULL,'Advanced Photon Source','ANL','Argonne','IL','US');
-INSERT INTO "facility" VALUES(7,'ALS',NULL,'Advanced Light Source','LBNL','Berkeley','CA','US');
-INSERT INTO "facility" VALUES(8,'DLS',NULL,'Diamond Light Source','','Didcot','','UK');
-INSERT INTO "facility" VALUES(9,'SOLEIL',NULL,'Synchrotron SOLEIL','','GIF-sur-YVETTE','','France');
-CREATE TABLE citation (
+INSERT INTO mode VALUES(1,'transmission','transmission intensity through sample');
+INSERT INTO mode VALUES(2,'fluorescence','X-ray fluorescence (non-specified)');
+INSERT INTO mode VALUES(3,'fluorescence, total yield','X-ray fluorescence, no energy analysis');
+INSERT INTO mode VALUES(4,'fluorescence, energy analyzed','X-ray fluorescence with an energy dispersive detector');
+INSERT INTO mode VALUES(5,'herfd','high-energy resolution fluorescence, with a crystal analyzer');
+INSERT INTO mode VALUES(6,'raman','non-resonant X-ray inelastic scattering');
+INSERT INTO mode VALUES(7,'xeol','visible or uv light emission');
+INSERT INTO mode VALUES(8,'electron emission','emitted electrons from sample');
+CREATE TABLE reference_mode (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
-	journal TEXT,
-	authors TEXT,
-	title TEXT,
-	volume TEXT,
-	pages TEXT,
-	year TEXT,
-	doi TEXT,
 	PRIMARY KEY (id),
 	UNIQUE (name)
 );
+INSERT INTO reference_mode VALUES(1,'none','no reference spectra');
+INSERT INTO reference_mode VALUES(2,'murefer','murefer');
+INSERT INTO reference_mode VALUES(3,'transmission','transmission, downstream of itrans (murefer=-log(irefer/itrans))');
+INSERT INTO reference_mode VALUES(4,'fluorescence, i0','flouresence, upstream of sample (murefer=irefer/i0)');
+INSERT INTO reference_mode VALUES(5,'flouresence, itrans','fluorescence downstream of itrans (murefer=irefer/itrans)');
+CREATE TABLE facility (
+	id INTEGER NOT NULL,
+	name TEXT NOT NULL,
+	notes TEXT,
+	fullname TEXT,
+	laboratory TEXT,
+	city TEXT,
+	country TEXT NOT NULL,
+	PRIMARY KEY (id),
+	UNIQUE (name)
+);
+INSERT INTO facility VALUES(1,'SSRL',NULL,'Stanford Synchrotron Radiation Laboratory','SLAC','Palo Alto','US');
+INSERT INTO facility VALUES(2,'NSLS',NULL,'National Synchrotron Light Source','BNL','Upton','US');
+INSERT INTO facility VALUES(3,'NSLS-II',NULL,'National Synchrotron Light Source II','BNL','Upton','US');
+INSERT INTO facility VALUES(4,'APS',NULL,'Advanced Photon Source','ANL','Argonne','US');
+INSERT INTO facility VALUES(5,'ALS',NULL,'Advanced Light Source','LBNL','Berkeley','US');
+INSERT INTO facility VALUES(6,'CAMD',NULL,'Center for Advanced Microstructures and Devices','Louisiana State U','Baton Rouge','US');
+INSERT INTO facility VALUES(7,'CHESS',NULL,'Cornell High Energy Synchrotron Source','Cornell U','Ithaca','US');
+INSERT INTO facility VALUES(8,'CLS',NULL,'Canadian Light Source','U Saskatchewan','Saskatoon','Canada');
+INSERT INTO facility VALUES(9,'LNLS',NULL,'Laboratório Nacional de Luz Síncrotron','CNPEM','Campinas','Brasil');
+INSERT INTO facility VALUES(10,'DLS',NULL,'Diamond Light Source','','Didcot','UK');
+INSERT INTO facility VALUES(11,'SRS',NULL,'Synchrotron Radiation Source','Daresbury Laboratory','Cheshire','UK');
+INSERT INTO facility VALUES(12,'ESRF',NULL,'European Synchrotron Radiation Facility','','Grenoble','France');
+INSERT INTO facility VALUES(13,'SOLEIL',NULL,'Synchrotron SOLEIL','','GIF-sur-YVETTE','France');
+INSERT INTO facility VALUES(14,'ALBA',NULL,'ALBA','','Barcelona','Spain');
+INSERT INTO facility VALUES(15,'ANKA',NULL,'Angstromquelle Karlsruhe','','Karlsruhe','Germany');
+INSERT INTO facility VALUES(16,'BESSY II',NULL,'Berliner Elektronenspeicherring-Gesellschaft für Synchrotronstrahlun','Helmholtz-Zentrum Berlin','Berlin','Germany');
+INSERT INTO facility VALUES(17,'DAFNE',NULL,'DAFNE-Light','  Laboratori Nazionali di Frascati','Frascati','Italy');
+INSERT INTO facility VALUES(18,'DELSY',NULL,'Dubna Electron Synchrotron','','Dubna','Russia');
+INSERT INTO facility VALUES(19,'SLS',NULL,'Swiss Light Source','','Villingen','Switzerland');
+INSERT INTO facility VALUES(20,'ELETTRA',NULL,'Elettra Synchrotron Light Laboratory','','Trieste','Italy');
+INSERT INTO facility VALUES(21,'DORIS III',NULL,'DORIS III','DESY','Hamburg','Germany');
+INSERT INTO facility VALUES(22,'PETRA III',NULL,'PETRA III','DESY','Hamburg','Germany');
+INSERT INTO facility VALUES(23,'MAX IV',NULL,'',' MAX-lab','Lund','Sweden');
+INSERT INTO facility VALUES(24,'SLRI',NULL,'Synchrotron Light Research Institute','Siam Photon','Nakhon Ratchasima','Thailand');
+INSERT INTO facility VALUES(25,'PF',NULL,'Photon Factory','KEK','Tsukuba','Japan');
+INSERT INTO facility VALUES(26,'AS',NULL,'Australia Synchrotron','','Victoria','Australia');
+INSERT INTO facility VALUES(27,'SESAME',NULL,'Synchrotron-light for Experimental Science and Applications in the Middle East','','Allaan','Jordan');
+INSERT INTO facility VALUES(28,'INDUS-2',NULL,'','','Indore','India');
+INSERT INTO facility VALUES(29,'BSRF',NULL,'Beijing Synchrotron Radiation Facility','','Beijing','China');
+INSERT INTO facility VALUES(30,'NSRL',NULL,'National Synchrotron Radiation Laboratory','','Hfei','China');
+INSERT INTO facility VALUES(31,'NSRRC',NULL,'National Synchrotron Radiation Research Center','','Hsinshu','Taiwan');
+INSERT INTO facility VALUES(32,'PLS',NULL,'Pohang Light Source','','Pohang','Korea');
+INSERT INTO facility VALUES(33,'SPring-8',NULL,'SPring-8','RIKEN','Hyogo','Japan');
+INSERT INTO facility VALUES(34,'SSLS',NULL,'Singapore Synchrotron Light Source','','','Singapore');
+INSERT INTO facility VALUES(35,'SSRC',NULL,'Siberian Synchrotron Research Centre','','Novosibirsk','Russia');
+INSERT INTO facility VALUES(36,'SSRF',NULL,'Shanghai Synchrotron Radiation Facility','','Shangai','China');
 CREATE TABLE element (
 	z INTEGER NOT NULL,
 	name TEXT NOT NULL,
@@ -58,128 +98,118 @@ CREATE TABLE element (
 	UNIQUE (name),
 	UNIQUE (symbol)
 );
-INSERT INTO "element" VALUES(1,'hydrogen','H');
-INSERT INTO "element" VALUES(2,'helium','He');
-INSERT INTO "element" VALUES(3,'lithium','Li');
-INSERT INTO "element" VALUES(4,'beryllium','Be');
-INSERT INTO "element" VALUES(5,'boron','B');
-INSERT INTO "element" VALUES(6,'carbon','C');
-INSERT INTO "element" VALUES(7,'nitrogen','N');
-INSERT INTO "element" VALUES(8,'oxygen','O');
-INSERT INTO "element" VALUES(9,'fluorine','F');
-INSERT INTO "element" VALUES(10,'neon','Ne');
-INSERT INTO "element" VALUES(11,'sodium','Na');
-INSERT INTO "element" VALUES(12,'magnesium','Mg');
-INSERT INTO "element" VALUES(13,'aluminum','Al');
-INSERT INTO "element" VALUES(14,'silicon','Si');
-INSERT INTO "element" VALUES(15,'phosphorus','P');
-INSERT INTO "element" VALUES(16,'sulfur','S');
-INSERT INTO "element" VALUES(17,'chlorine','Cl');
-INSERT INTO "element" VALUES(18,'argon','Ar');
-INSERT INTO "element" VALUES(19,'potassium','K');
-INSERT INTO "element" VALUES(20,'calcium','Ca');
-INSERT INTO "element" VALUES(21,'scandium','Sc');
-INSERT INTO "element" VALUES(22,'titanium','Ti');
-INSERT INTO "element" VALUES(23,'vanadium','V');
-INSERT INTO "element" VALUES(24,'chromium','Cr');
-INSERT INTO "element" VALUES(25,'manganese','Mn');
-INSERT INTO "element" VALUES(26,'iron','Fe');
-INSERT INTO "element" VALUES(27,'cobalt','Co');
-INSERT INTO "element" VALUES(28,'nickel','Ni');
-INSERT INTO "element" VALUES(29,'copper','Cu');
-INSERT INTO "element" VALUES(30,'zinc','Zn');
-INSERT INTO "element" VALUES(31,'gallium','Ga');
-INSERT INTO "element" VALUES(32,'germanium','Ge');
-INSERT INTO "element" VALUES(33,'arsenic','As');
-INSERT INTO "element" VALUES(34,'selenium','Se');
-INSERT INTO "element" VALUES(35,'bromine','Br');
-INSERT INTO "element" VALUES(36,'krypton','Kr');
-INSERT INTO "element" VALUES(37,'rubidium','Rb');
-INSERT INTO "element" VALUES(38,'strontium','Sr');
-INSERT INTO "element" VALUES(39,'yttrium','Y');
-INSERT INTO "element" VALUES(40,'zirconium','Zr');
-INSERT INTO "element" VALUES(41,'niobium','Nb');
-INSERT INTO "element" VALUES(42,'molybdenum','Mo');
-INSERT INTO "element" VALUES(43,'technetium','Tc');
-INSERT INTO "element" VALUES(44,'ruthenium','Ru');
-INSERT INTO "element" VALUES(45,'rhodium','Rh');
-INSERT INTO "element" VALUES(46,'palladium','Pd');
-INSERT INTO "element" VALUES(47,'silver','Ag');
-INSERT INTO "element" VALUES(48,'cadmium','Cd');
-INSERT INTO "element" VALUES(49,'indium','In');
-INSERT INTO "element" VALUES(50,'tin','Sn');
-INSERT INTO "element" VALUES(51,'antimony','Sb');
-INSERT INTO "element" VALUES(52,'tellurium','Te');
-INSERT INTO "element" VALUES(53,'iodine','I');
-INSERT INTO "element" VALUES(54,'xenon','Xe');
-INSERT INTO "element" VALUES(55,'cesium','Cs');
-INSERT INTO "element" VALUES(56,'barium','Ba');
-INSERT INTO "element" VALUES(57,'lanthanum','La');
-INSERT INTO "element" VALUES(58,'cerium','Ce');
-INSERT INTO "element" VALUES(59,'praseodymium','Pr');
-INSERT INTO "element" VALUES(60,'neodymium','Nd');
-INSERT INTO "element" VALUES(61,'promethium','Pm');
-INSERT INTO "element" VALUES(62,'samarium','Sm');
-INSERT INTO "element" VALUES(63,'europium','Eu');
-INSERT INTO "element" VALUES(64,'gadolinium','Gd');
-INSERT INTO "element" VALUES(65,'terbium','Tb');
-INSERT INTO "element" VALUES(66,'dysprosium','Dy');
-INSERT INTO "element" VALUES(67,'holmium','Ho');
-INSERT INTO "element" VALUES(68,'erbium','Er');
-INSERT INTO "element" VALUES(69,'thulium','Tm');
-INSERT INTO "element" VALUES(70,'ytterbium','Yb');
-INSERT INTO "element" VALUES(71,'lutetium','Lu');
-INSERT INTO "element" VALUES(72,'hafnium','Hf');
-INSERT INTO "element" VALUES(73,'tantalum','Ta');
-INSERT INTO "element" VALUES(74,'tungsten','W');
-INSERT INTO "element" VALUES(75,'rhenium','Re');
-INSERT INTO "element" VALUES(76,'osmium','Os');
-INSERT INTO "element" VALUES(77,'iridium','Ir');
-INSERT INTO "element" VALUES(78,'platinum','Pt');
-INSERT INTO "element" VALUES(79,'gold','Au');
-INSERT INTO "element" VALUES(80,'mercury','Hg');
-INSERT INTO "element" VALUES(81,'thallium','Tl');
-INSERT INTO "element" VALUES(82,'lead','Pb');
-INSERT INTO "element" VALUES(83,'bismuth','Bi');
-INSERT INTO "element" VALUES(84,'polonium','Po');
-INSERT INTO "element" VALUES(85,'astatine','At');
-INSERT INTO "element" VALUES(86,'radon','Rn');
-INSERT INTO "element" VALUES(87,'francium','Fr');
-INSERT INTO "element" VALUES(88,'radium','Ra');
-INSERT INTO "element" VALUES(89,'actinium','Ac');
-INSERT INTO "element" VALUES(90,'thorium','Th');
-INSERT INTO "element" VALUES(91,'protactinium','Pa');
-INSERT INTO "element" VALUES(92,'uranium','U');
-INSERT INTO "element" VALUES(93,'neptunium','Np');
-INSERT INTO "element" VALUES(94,'plutonium','Pu');
-INSERT INTO "element" VALUES(95,'americium','Am');
-INSERT INTO "element" VALUES(96,'curium','Cm');
-INSERT INTO "element" VALUES(97,'berkelium','Bk');
-INSERT INTO "element" VALUES(98,'californium','Cf');
-INSERT INTO "element" VALUES(99,'einsteinium','Es');
-INSERT INTO "element" VALUES(100,'fermium','Fm');
-INSERT INTO "element" VALUES(101,'mendelevium','Md');
-INSERT INTO "element" VALUES(102,'nobelium','No');
-INSERT INTO "element" VALUES(103,'lawerencium','Lw');
-INSERT INTO "element" VALUES(104,'rutherfordium','Rf');
-INSERT INTO "element" VALUES(105,'dubnium','Ha');
-INSERT INTO "element" VALUES(106,'seaborgium','Sg');
-INSERT INTO "element" VALUES(107,'bohrium','Bh');
-INSERT INTO "element" VALUES(108,'hassium','Hs');
-INSERT INTO "element" VALUES(109,'meitnerium','Mt');
-INSERT INTO "element" VALUES(110,'darmstadtium','Ds');
-INSERT INTO "element" VALUES(111,'roentgenium','Rg');
-INSERT INTO "element" VALUES(112,'copernicium','Cn');
-CREATE TABLE person (
-	id INTEGER NOT NULL,
-	email TEXT NOT NULL,
-	notes TEXT,
-	name TEXT NOT NULL,
-	password TEXT,
-	affiliation TEXT,
-	PRIMARY KEY (id),
-	UNIQUE (email)
-);
+INSERT INTO element VALUES(1,'hydrogen','H');
+INSERT INTO element VALUES(2,'helium','He');
+INSERT INTO element VALUES(3,'lithium','Li');
+INSERT INTO element VALUES(4,'beryllium','Be');
+INSERT INTO element VALUES(5,'boron','B');
+INSERT INTO element VALUES(6,'carbon','C');
+INSERT INTO element VALUES(7,'nitrogen','N');
+INSERT INTO element VALUES(8,'oxygen','O');
+INSERT INTO element VALUES(9,'fluorine','F');
+INSERT INTO element VALUES(10,'neon','Ne');
+INSERT INTO element VALUES(11,'sodium','Na');
+INSERT INTO element VALUES(12,'magnesium','Mg');
+INSERT INTO element VALUES(13,'aluminum','Al');
+INSERT INTO element VALUES(14,'silicon','Si');
+INSERT INTO element VALUES(15,'phosphorus','P');
+INSERT INTO element VALUES(16,'sulfur','S');
+INSERT INTO element VALUES(17,'chlorine','Cl');
+INSERT INTO element VALUES(18,'argon','Ar');
+INSERT INTO element VALUES(19,'potassium','K');
+INSERT INTO element VALUES(20,'calcium','Ca');
+INSERT INTO element VALUES(21,'scandium','Sc');
+INSERT INTO element VALUES(22,'titanium','Ti');
+INSERT INTO element VALUES(23,'vanadium','V');
+INSERT INTO element VALUES(24,'chromium','Cr');
+INSERT INTO element VALUES(25,'manganese','Mn');
+INSERT INTO element VALUES(26,'iron','Fe');
+INSERT INTO element VALUES(27,'cobalt','Co');
+INSERT INTO element VALUES(28,'nickel','Ni');
+INSERT INTO element VALUES(29,'copper','Cu');
+INSERT INTO element VALUES(30,'zinc','Zn');
+INSERT INTO element VALUES(31,'gallium','Ga');
+INSERT INTO element VALUES(32,'germanium','Ge');
+INSERT INTO element VALUES(33,'arsenic','As');
+INSERT INTO element VALUES(34,'selenium','Se');
+INSERT INTO element VALUES(35,'bromine','Br');
+INSERT INTO element VALUES(36,'krypton','Kr');
+INSERT INTO element VALUES(37,'rubidium','Rb');
+INSERT INTO element VALUES(38,'strontium','Sr');
+INSERT INTO element VALUES(39,'yttrium','Y');
+INSERT INTO element VALUES(40,'zirconium','Zr');
+INSERT INTO element VALUES(41,'niobium','Nb');
+INSERT INTO element VALUES(42,'molybdenum','Mo');
+INSERT INTO element VALUES(43,'technetium','Tc');
+INSERT INTO element VALUES(44,'ruthenium','Ru');
+INSERT INTO element VALUES(45,'rhodium','Rh');
+INSERT INTO element VALUES(46,'palladium','Pd');
+INSERT INTO element VALUES(47,'silver','Ag');
+INSERT INTO element VALUES(48,'cadmium','Cd');
+INSERT INTO element VALUES(49,'indium','In');
+INSERT INTO element VALUES(50,'tin','Sn');
+INSERT INTO element VALUES(51,'antimony','Sb');
+INSERT INTO element VALUES(52,'tellurium','Te');
+INSERT INTO element VALUES(53,'iodine','I');
+INSERT INTO element VALUES(54,'xenon','Xe');
+INSERT INTO element VALUES(55,'cesium','Cs');
+INSERT INTO element VALUES(56,'barium','Ba');
+INSERT INTO element VALUES(57,'lanthanum','La');
+INSERT INTO element VALUES(58,'cerium','Ce');
+INSERT INTO element VALUES(59,'praseodymium','Pr');
+INSERT INTO element VALUES(60,'neodymium','Nd');
+INSERT INTO element VALUES(61,'promethium','Pm');
+INSERT INTO element VALUES(62,'samarium','Sm');
+INSERT INTO element VALUES(63,'europium','Eu');
+INSERT INTO element VALUES(64,'gadolinium','Gd');
+INSERT INTO element VALUES(65,'terbium','Tb');
+INSERT INTO element VALUES(66,'dysprosium','Dy');
+INSERT INTO element VALUES(67,'holmium','Ho');
+INSERT INTO element VALUES(68,'erbium','Er');
+INSERT INTO element VALUES(69,'thulium','Tm');
+INSERT INTO element VALUES(70,'ytterbium','Yb');
+INSERT INTO element VALUES(71,'lutetium','Lu');
+INSERT INTO element VALUES(72,'hafnium','Hf');
+INSERT INTO element VALUES(73,'tantalum','Ta');
+INSERT INTO element VALUES(74,'tungsten','W');
+INSERT INTO element VALUES(75,'rhenium','Re');
+INSERT INTO element VALUES(76,'osmium','Os');
+INSERT INTO element VALUES(77,'iridium','Ir');
+INSERT INTO element VALUES(78,'platinum','Pt');
+INSERT INTO element VALUES(79,'gold','Au');
+INSERT INTO element VALUES(80,'mercury','Hg');
+INSERT INTO element VALUES(81,'thallium','Tl');
+INSERT INTO element VALUES(82,'lead','Pb');
+INSERT INTO element VALUES(83,'bismuth','Bi');
+INSERT INTO element VALUES(84,'polonium','Po');
+INSERT INTO element VALUES(85,'astatine','At');
+INSERT INTO element VALUES(86,'radon','Rn');
+INSERT INTO element VALUES(87,'francium','Fr');
+INSERT INTO element VALUES(88,'radium','Ra');
+INSERT INTO element VALUES(89,'actinium','Ac');
+INSERT INTO element VALUES(90,'thorium','Th');
+INSERT INTO element VALUES(91,'protactinium','Pa');
+INSERT INTO element VALUES(92,'uranium','U');
+INSERT INTO element VALUES(93,'neptunium','Np');
+INSERT INTO element VALUES(94,'plutonium','Pu');
+INSERT INTO element VALUES(95,'americium','Am');
+INSERT INTO element VALUES(96,'curium','Cm');
+INSERT INTO element VALUES(97,'berkelium','Bk');
+INSERT INTO element VALUES(98,'californium','Cf');
+INSERT INTO element VALUES(99,'einsteinium','Es');
+INSERT INTO element VALUES(100,'fermium','Fm');
+INSERT INTO element VALUES(101,'mendelevium','Md');
+INSERT INTO element VALUES(102,'nobelium','No');
+INSERT INTO element VALUES(103,'lawerencium','Lw');
+INSERT INTO element VALUES(104,'rutherfordium','Rf');
+INSERT INTO element VALUES(105,'dubnium','Ha');
+INSERT INTO element VALUES(106,'seaborgium','Sg');
+INSERT INTO element VALUES(107,'bohrium','Bh');
+INSERT INTO element VALUES(108,'hassium','Hs');
+INSERT INTO element VALUES(109,'meitnerium','Mt');
+INSERT INTO element VALUES(110,'darmstadtium','Ds');
+INSERT INTO element VALUES(111,'roentgenium','Rg');
+INSERT INTO element VALUES(112,'copernicium','Cn');
 CREATE TABLE edge (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
@@ -188,11 +218,29 @@ CREATE TABLE edge (
 	UNIQUE (name),
 	UNIQUE (level)
 );
-INSERT INTO "edge" VALUES(1,'K','1s');
-INSERT INTO "edge" VALUES(2,'L3','2p3/2');
-INSERT INTO "edge" VALUES(3,'L2','2p1/2');
-INSERT INTO "edge" VALUES(4,'L1','2s');
-INSERT INTO "edge" VALUES(5,'M4,5','3d3/2,5/2');
+INSERT INTO edge VALUES(1,'K','1s');
+INSERT INTO edge VALUES(2,'L3','2p3/2');
+INSERT INTO edge VALUES(3,'L2','2p1/2');
+INSERT INTO edge VALUES(4,'L1','2s');
+INSERT INTO edge VALUES(5,'M4,5','3d3/2,5/2');
+INSERT INTO edge VALUES(6,'M5','3d5/2');
+INSERT INTO edge VALUES(7,'M4','3d3/2');
+INSERT INTO edge VALUES(8,'M3','3p_3/2');
+INSERT INTO edge VALUES(9,'M2','3p_1/2');
+INSERT INTO edge VALUES(10,'M1','3s');
+INSERT INTO edge VALUES(11,'N7','4f_7/2');
+INSERT INTO edge VALUES(12,'N6','4f_5/2');
+INSERT INTO edge VALUES(13,'N5','4d_5/2');
+INSERT INTO edge VALUES(14,'N4','4d_3/2');
+INSERT INTO edge VALUES(15,'N3','4p_3/2');
+INSERT INTO edge VALUES(16,'N2','4p_1/2');
+INSERT INTO edge VALUES(17,'N1','4s');
+INSERT INTO edge VALUES(18,'O3','5p_3/2');
+INSERT INTO edge VALUES(19,'O2','5p_1/2');
+INSERT INTO edge VALUES(20,'O1','5s');
+INSERT INTO edge VALUES(21,'P3','6p_3/2');
+INSERT INTO edge VALUES(22,'P2','6p_1/2');
+INSERT INTO edge VALUES(23,'P1','6s');
 CREATE TABLE energy_units (
 	id INTEGER NOT NULL,
 	units TEXT NOT NULL,
@@ -200,30 +248,45 @@ CREATE TABLE energy_units (
 	PRIMARY KEY (id),
 	UNIQUE (units)
 );
-INSERT INTO "energy_units" VALUES(1,'eV','electronVolts');
-INSERT INTO "energy_units" VALUES(2,'keV','kiloelectronVolts');
-INSERT INTO "energy_units" VALUES(3,'degrees','angle in degrees for Bragg monochromator.  Needs mono d_spacing');
-CREATE TABLE mode (
+INSERT INTO energy_units VALUES(1,'eV','electronVolts');
+INSERT INTO energy_units VALUES(2,'keV','kiloelectronVolts');
+INSERT INTO energy_units VALUES(3,'degrees','angle in degrees for Bragg monochromator.  Needs mono d_spacing');
+CREATE TABLE crystal_structure (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
+	format TEXT,
+	data TEXT,
 	PRIMARY KEY (id),
 	UNIQUE (name)
 );
-INSERT INTO "mode" VALUES(1,'transmission','transmission intensity through sample');
-INSERT INTO "mode" VALUES(2,'fluorescence','X-ray fluorescence, no further details');
-INSERT INTO "mode" VALUES(3,'fluorescence, total yield','X-ray fluorescence, no energy analysis');
-INSERT INTO "mode" VALUES(4,'fluorescence, energy analyzed','X-ray fluorescence with an energy dispersive detector');
-INSERT INTO "mode" VALUES(5,'xeol','visible or uv light emission');
-INSERT INTO "mode" VALUES(6,'electron emission','emitted electrons from sample');
-CREATE TABLE crystal_structure (
+CREATE TABLE person (
+	id INTEGER NOT NULL,
+	email TEXT NOT NULL,
+	notes TEXT,
+	name TEXT NOT NULL,
+	password TEXT,
+	affiliation TEXT,
+	confirmed TEXT,
+	admin_level INTEGER,
+	PRIMARY KEY (id),
+	UNIQUE (email)
+);
+CREATE TABLE citation (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
-	format TEXT,
-	data TEXT,
+	journal TEXT,
+	authors TEXT,
+	title TEXT,
+	volume TEXT,
+	pages TEXT,
+	year TEXT,
+	doi TEXT,
+	person_id INTEGER,
 	PRIMARY KEY (id),
-	UNIQUE (name)
+	UNIQUE (name),
+	FOREIGN KEY(person_id) REFERENCES person (id)
 );
 CREATE TABLE sample (
 	id INTEGER NOT NULL,
@@ -232,113 +295,237 @@ CREATE TABLE sample (
 	formula TEXT,
 	material_source TEXT,
 	preparation TEXT,
+	cas_number TEXT,
+	image_data TEXT,
+	xrd_data TEXT,
+	extra_data TEXT,
 	person_id INTEGER,
 	crystal_structure_id INTEGER,
 	PRIMARY KEY (id),
 	FOREIGN KEY(person_id) REFERENCES person (id),
 	FOREIGN KEY(crystal_structure_id) REFERENCES crystal_structure (id)
 );
-CREATE TABLE beamline (
-	id INTEGER NOT NULL,
-	name TEXT NOT NULL,
-	notes TEXT,
-	xray_source TEXT,
-	facility_id INTEGER,
-	PRIMARY KEY (id),
-	UNIQUE (name),
-	FOREIGN KEY(facility_id) REFERENCES facility (id)
-);
-INSERT INTO "beamline" VALUES(1,'13ID','GSECARS 13-ID','APS Undulator A',6);
-INSERT INTO "beamline" VALUES(2,'13BM','GSECARS 13-BM','APS bending magnet',6);
-INSERT INTO "beamline" VALUES(3,'10ID','MR-CAT  10-ID','APS Undulator A',6);
-INSERT INTO "beamline" VALUES(4,'10BM','MR-CAT  10-BM','APS Bending Magnet',6);
-INSERT INTO "beamline" VALUES(5,'20ID','PNC/XOR 20-ID','APS Undulator A',6);
-INSERT INTO "beamline" VALUES(6,'20BM','PNC/XOR 20-BM','APS Bending Magnet',6);
-INSERT INTO "beamline" VALUES(7,'X11A','NSLS X11-A','NSLS bending magnet',3);
-INSERT INTO "beamline" VALUES(8,'2-3','SSRL, 2-3','',1);
-INSERT INTO "beamline" VALUES(9,'4-3','SSRL, 4-3','',1);
-INSERT INTO "beamline" VALUES(10,'4-1','SSRL, 4-1','',1);
 CREATE TABLE suite (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
 	person_id INTEGER,
+	rating_summary TEXT,
 	PRIMARY KEY (id),
 	UNIQUE (name),
 	FOREIGN KEY(person_id) REFERENCES person (id)
 );
-CREATE TABLE suite_rating (
+CREATE TABLE beamline (
 	id INTEGER NOT NULL,
-	score INTEGER,
-	datetime DATETIME,
-	comments TEXT,
-	person_id INTEGER,
-	suite_id INTEGER,
+	name TEXT NOT NULL,
+	notes TEXT,
+	xray_source TEXT,
+	nickname TEXT,
+	energy_range TEXT,
+	facility_id INTEGER,
 	PRIMARY KEY (id),
-	FOREIGN KEY(person_id) REFERENCES person (id),
-	FOREIGN KEY(suite_id) REFERENCES suite (id)
+	UNIQUE (name),
+	FOREIGN KEY(facility_id) REFERENCES facility (id)
 );
+INSERT INTO beamline VALUES(1,'ALS 10.3.2',NULL,NULL,'10.3.2','2.5 - 17',5);
+INSERT INTO beamline VALUES(2,'APS 10-BM-B',NULL,NULL,'MRCAT','3 - 200',4);
+INSERT INTO beamline VALUES(3,'APS 10-ID-B',NULL,NULL,'MRCAT','4.3- 90',4);
+INSERT INTO beamline VALUES(4,'APS 11-ID-D',NULL,NULL,'11-ID-D','4 - 40',4);
+INSERT INTO beamline VALUES(5,'APS 12-BM-B',NULL,NULL,'12-BM-B','4.5 - 24',4);
+INSERT INTO beamline VALUES(6,'APS 13-BM-D',NULL,NULL,'GSECARS','4.5 - 70',4);
+INSERT INTO beamline VALUES(7,'APS 13-ID-C,D',NULL,NULL,'GSECARS','4 - 45',4);
+INSERT INTO beamline VALUES(8,'APS 13-ID-E',NULL,NULL,'GSECARS','2.4 - 26',4);
+INSERT INTO beamline VALUES(9,'APS 16-BM-D',NULL,NULL,'HPCAT','6 - 70',4);
+INSERT INTO beamline VALUES(10,'APS 18-ID-D',NULL,NULL,'BIOCAT','3.5 - 35',4);
+INSERT INTO beamline VALUES(11,'APS 2-ID-D',NULL,NULL,'2-ID-D','5 - 30',4);
+INSERT INTO beamline VALUES(12,'APS 20-BM-B',NULL,NULL,'20-BM-B','2.7- 30',4);
+INSERT INTO beamline VALUES(13,'APS 20-ID-B,C',NULL,NULL,'20-ID-B,C','3 - 50',4);
+INSERT INTO beamline VALUES(14,'APS 4-ID-C',NULL,NULL,'4-ID-C','0.5 - 3',4);
+INSERT INTO beamline VALUES(15,'APS 4-ID-D',NULL,NULL,'4-ID-D','0.5 - 50',4);
+INSERT INTO beamline VALUES(16,'APS 5-BM-D',NULL,NULL,'DNDCAT','4.5 - 80',4);
+INSERT INTO beamline VALUES(17,'APS 7-ID-B,C,D',NULL,NULL,'7-ID-B,C,D','6 - 21',4);
+INSERT INTO beamline VALUES(18,'APS 9-BM-B,C',NULL,NULL,'9-BM-B,C','2.1 - 23',4);
+INSERT INTO beamline VALUES(19,'CAMD DCM',NULL,NULL,'DCM','0.9 - 20',6);
+INSERT INTO beamline VALUES(20,'CLS HXMA',NULL,NULL,'HXMA','5 - 40',8);
+INSERT INTO beamline VALUES(21,'CLS REIXS',NULL,NULL,'REIXS','0.08 - 2',8);
+INSERT INTO beamline VALUES(22,'CLS SGM',NULL,NULL,'SGM','0.25 - 2',8);
+INSERT INTO beamline VALUES(23,'CLS SXRMB',NULL,NULL,'SXRMB','1.7 - 10',8);
+INSERT INTO beamline VALUES(24,'CLS VESPERS',NULL,NULL,'VESPERS','6 - 30',8);
+INSERT INTO beamline VALUES(25,'LNLS DXAS',NULL,NULL,'DXAS','5 - 14',9);
+INSERT INTO beamline VALUES(26,'LNLS XAFS1',NULL,NULL,'XAFS1','4 -24',9);
+INSERT INTO beamline VALUES(27,'LNLS XAFS2',NULL,NULL,'XAFS2','4 - 17',9);
+INSERT INTO beamline VALUES(28,'NSLS X10C',NULL,NULL,'X10C','4 - 24',2);
+INSERT INTO beamline VALUES(29,'NSLS X11A',NULL,NULL,'X11A','4.5 - 40',2);
+INSERT INTO beamline VALUES(30,'NSLS X11B',NULL,NULL,'X11B','5 - 23',2);
+INSERT INTO beamline VALUES(31,'NSLS X15B',NULL,NULL,'X15B','1.2 - 8',2);
+INSERT INTO beamline VALUES(32,'NSLS X18B',NULL,NULL,'X18B','4.8 - 40',2);
+INSERT INTO beamline VALUES(33,'NSLS X19A',NULL,NULL,'X19A','2.1 - 17',2);
+INSERT INTO beamline VALUES(34,'NSLS X23A2',NULL,NULL,'X23A2','4.7 - 30',2);
+INSERT INTO beamline VALUES(35,'NSLS X24A',NULL,NULL,'X24A','1.8 - 6',2);
+INSERT INTO beamline VALUES(36,'NSLS X3B',NULL,NULL,'X3B','3.8-13.3',2);
+INSERT INTO beamline VALUES(37,'NSLS-II 4-BM',NULL,NULL,'XFM','2.05 - 23',3);
+INSERT INTO beamline VALUES(38,'NSLS-II 5-ID',NULL,NULL,'SRX','4.5 - 20',3);
+INSERT INTO beamline VALUES(39,'NSLS-II 6-BM',NULL,NULL,'BMM','4.5 - 23',3);
+INSERT INTO beamline VALUES(40,'NSLS-II 7-BM',NULL,NULL,'QAS','4.7 - 31',3);
+INSERT INTO beamline VALUES(41,'NSLS-II 7-ID',NULL,NULL,'SST','0.1 - 7.5',3);
+INSERT INTO beamline VALUES(42,'NSLS-II 8-BM',NULL,NULL,'TES','1.6 - 5.0',3);
+INSERT INTO beamline VALUES(43,'NSLS-II 8-ID',NULL,NULL,'ISS','4.8 - 31',3);
+INSERT INTO beamline VALUES(44,'SSRL 10-1',NULL,NULL,'10-1','0.25 - 1.2',1);
+INSERT INTO beamline VALUES(45,'SSRL 10-2a',NULL,NULL,'10-2a','4.5 - 45',1);
+INSERT INTO beamline VALUES(46,'SSRL 11-2',NULL,NULL,'11-2','4.5 - 37',1);
+INSERT INTO beamline VALUES(47,'SSRL 13-2',NULL,NULL,'13-2','0.25 - 1.1',1);
+INSERT INTO beamline VALUES(48,'SSRL 14-3',NULL,NULL,'14-3','2 - 5',1);
+INSERT INTO beamline VALUES(49,'SSRL 2-3',NULL,NULL,'2-3','4.5 - 24',1);
+INSERT INTO beamline VALUES(50,'SSRL 4-1',NULL,NULL,'4-1','5.5 - 38',1);
+INSERT INTO beamline VALUES(51,'SSRL 4-3',NULL,NULL,'4-3','2.4 - 14',1);
+INSERT INTO beamline VALUES(52,'SSRL 6-2a',NULL,NULL,'6-2a','2.3 - 17',1);
+INSERT INTO beamline VALUES(53,'SSRL 7-3',NULL,NULL,'7-3','4.6 - 37',1);
+INSERT INTO beamline VALUES(54,'SSRL 8-2',NULL,NULL,'8-2','0.1 - 1.3',1);
+INSERT INTO beamline VALUES(55,'SSRL 9-3',NULL,NULL,'9-3','5 - 30',1);
+INSERT INTO beamline VALUES(56,'AS XAS',NULL,NULL,'XAS','4 - 50',26);
+INSERT INTO beamline VALUES(57,'BSRF 4W1B',NULL,NULL,'4W1B','4 - 22',29);
+INSERT INTO beamline VALUES(58,'NSRL U19',NULL,NULL,'U19','0.01 - 0.2',30);
+INSERT INTO beamline VALUES(59,'NSRL U7C',NULL,NULL,'U7C','4 - 13',30);
+INSERT INTO beamline VALUES(60,'NSRRC BL01C1',NULL,NULL,'BL01C1','6 - 33',31);
+INSERT INTO beamline VALUES(61,'NSRRC BL16A1',NULL,NULL,'BL16A1','2 - 8',31);
+INSERT INTO beamline VALUES(62,'NSRRC BL17C1',NULL,NULL,'BL17C1','4.8 - 14.2',31);
+INSERT INTO beamline VALUES(63,'PF AR-NW10A',NULL,NULL,'AR-NW10A','8 - 42',25);
+INSERT INTO beamline VALUES(64,'PF AR-NW14A',NULL,NULL,'AR-NW14A','5 - 20',25);
+INSERT INTO beamline VALUES(65,'PF AR-NW2A',NULL,NULL,'AR-NW2A','5 - 20',25);
+INSERT INTO beamline VALUES(66,'PF BL-11A',NULL,NULL,'BL-11A','0.07 - 1.9',25);
+INSERT INTO beamline VALUES(67,'PF BL-11B',NULL,NULL,'BL-11B','1.7 - 5',25);
+INSERT INTO beamline VALUES(68,'PF BL-12C',NULL,NULL,'BL-12C','6 - 23',25);
+INSERT INTO beamline VALUES(69,'PF BL-27B',NULL,NULL,'BL-27B','4 - 20',25);
+INSERT INTO beamline VALUES(70,'PF BL-2A',NULL,NULL,'BL-2A','1.7 - 5',25);
+INSERT INTO beamline VALUES(71,'PF BL-2C',NULL,NULL,'BL-2C','0.25 - 1.5',25);
+INSERT INTO beamline VALUES(72,'PF BL-4A',NULL,NULL,'BL-4A','4 - 20',25);
+INSERT INTO beamline VALUES(73,'PF BL-7A',NULL,NULL,'BL-7A','0.1 - 1.5',25);
+INSERT INTO beamline VALUES(74,'PF BL-7C',NULL,NULL,'BL-7C','4 - 20',25);
+INSERT INTO beamline VALUES(75,'PF BL-9A',NULL,NULL,'BL-9A','2.1 - 15',25);
+INSERT INTO beamline VALUES(76,'PF BL-9C',NULL,NULL,'BL-9C','4 - 23',25);
+INSERT INTO beamline VALUES(77,'PLS 10B',NULL,NULL,'10B','3.5 - 16',32);
+INSERT INTO beamline VALUES(78,'PLS 3C1',NULL,NULL,'3C1','2.3 - 32',32);
+INSERT INTO beamline VALUES(79,'PLS 7C1',NULL,NULL,'7C1','5 - 30',32);
+INSERT INTO beamline VALUES(80,'PLS 8C1',NULL,NULL,'8C1','3 - 22',32);
+INSERT INTO beamline VALUES(81,'SESAME A1',NULL,NULL,'A1','3 - 30',27);
+INSERT INTO beamline VALUES(82,'SLRI BL4',NULL,NULL,'BL4','2.5 - 8',24);
+INSERT INTO beamline VALUES(83,'SLRI BL8',NULL,NULL,'BL8','1.25 - 10',24);
+INSERT INTO beamline VALUES(84,'SPring-8 BL01B1',NULL,NULL,'BL01B1','3.8 - 113',33);
+INSERT INTO beamline VALUES(85,'SPring-8 BL14B2',NULL,NULL,'BL14B2','3.8 - 72',33);
+INSERT INTO beamline VALUES(86,'SPring-8 BL28B2',NULL,NULL,'BL28B2','8 - 40',33);
+INSERT INTO beamline VALUES(87,'SPring-8 BL37XU',NULL,NULL,'BL37XU','5 - 37',33);
+INSERT INTO beamline VALUES(88,'SPring-8 BL39XU',NULL,NULL,'BL39XU','5 - 38',33);
+INSERT INTO beamline VALUES(89,'SPring-8 BL40XU',NULL,NULL,'BL40XU','8 - 17',33);
+INSERT INTO beamline VALUES(90,'SSLS XDD',NULL,NULL,'XDD','2.3 - 10',34);
+INSERT INTO beamline VALUES(91,'SSRC EXAFS',NULL,NULL,'EXAFS','.',35);
+INSERT INTO beamline VALUES(92,'SSRC Soft EXAFS',NULL,NULL,'Soft EXAFS','.',35);
+INSERT INTO beamline VALUES(93,'SSRF BL08U1-A',NULL,NULL,'BL08U1-A','0.25 - 2',36);
+INSERT INTO beamline VALUES(94,'SSRF BL14W1',NULL,NULL,'BL14W1','3.5 - 50',36);
+INSERT INTO beamline VALUES(95,'ALBA CLAESS',NULL,NULL,'CLAESS','2.4 - 65',14);
+INSERT INTO beamline VALUES(96,'ANKA INE',NULL,NULL,'INE','2.1 - 26',15);
+INSERT INTO beamline VALUES(97,'ANKA SUL-X',NULL,NULL,'SUL-X','1.5 - 22',15);
+INSERT INTO beamline VALUES(98,'ANKA XAS',NULL,NULL,'XAS','2.4 - 25',15);
+INSERT INTO beamline VALUES(99,'DAFNE DXR-1',NULL,NULL,'DXR-1','1.3 - 3',17);
+INSERT INTO beamline VALUES(100,'DLS B18',NULL,NULL,'Core XAFS','2 - 35',10);
+INSERT INTO beamline VALUES(101,'DLS I06',NULL,NULL,'Nanoscience','0.1 - 2',10);
+INSERT INTO beamline VALUES(102,'DLS I09',NULL,NULL,'Surface & Interface Structural Analysis','0.15 - 2.1 or 2 - 20',10);
+INSERT INTO beamline VALUES(103,'DLS I10',NULL,NULL,'BLADE','0.4 - 2',10);
+INSERT INTO beamline VALUES(104,'DLS I18',NULL,NULL,'Microfocus spectroscopy','2 - 20',10);
+INSERT INTO beamline VALUES(105,'DLS I20',NULL,NULL,'LOLA: X-ray spectroscopy','4 - 34',10);
+INSERT INTO beamline VALUES(106,'ELETTRA ALOISA',NULL,NULL,'ALOISA','0.12 - 2',20);
+INSERT INTO beamline VALUES(107,'ELETTRA BACH',NULL,NULL,'BACH','0.035 - 1.6',20);
+INSERT INTO beamline VALUES(108,'ELETTRA BEAR',NULL,NULL,'BEAR','0.004 - 1.4',20);
+INSERT INTO beamline VALUES(109,'ELETTRA POLAR',NULL,NULL,'POLAR','0.005 - 1',20);
+INSERT INTO beamline VALUES(110,'ELETTRA TWINMIC',NULL,NULL,'TWINMIC','0.25 - 2',20);
+INSERT INTO beamline VALUES(111,'ELETTRA XAFS',NULL,NULL,'XAFS','2.3 - 25',20);
+INSERT INTO beamline VALUES(112,'ESRF BM2',NULL,NULL,'D2AM','5 - 25',12);
+INSERT INTO beamline VALUES(113,'ESRF BM20',NULL,NULL,'ROBL','6 - 33',12);
+INSERT INTO beamline VALUES(114,'ESRF BM23',NULL,NULL,'BM23','5 - 75',12);
+INSERT INTO beamline VALUES(115,'ESRF BM25A',NULL,NULL,'SPLINE','5 - 45',12);
+INSERT INTO beamline VALUES(116,'ESRF BM26A',NULL,NULL,'DUBBLE','4 - 40',12);
+INSERT INTO beamline VALUES(117,'ESRF BM30B',NULL,NULL,'FAME','4 - 40',12);
+INSERT INTO beamline VALUES(118,'ESRF BM8',NULL,NULL,'GILDA','5 - 85',12);
+INSERT INTO beamline VALUES(119,'ESRF ID08',NULL,NULL,'ID08','0.4 - 1.5',12);
+INSERT INTO beamline VALUES(120,'ESRF ID12',NULL,NULL,'ID12','2.0 - 20',12);
+INSERT INTO beamline VALUES(121,'ESRF ID21',NULL,NULL,'ID21','0.2 - 8',12);
+INSERT INTO beamline VALUES(122,'ESRF ID22',NULL,NULL,'ID22','6.5 - 18',12);
+INSERT INTO beamline VALUES(123,'ESRF ID24',NULL,NULL,'ID24','5 - 28',12);
+INSERT INTO beamline VALUES(124,'ESRF ID26',NULL,NULL,'ID26','2.4 - 27',12);
+INSERT INTO beamline VALUES(125,'MAX IV I811',NULL,NULL,'I811','2.3 - 20',23);
+INSERT INTO beamline VALUES(126,'PETRA III P04',NULL,NULL,'Variable polarization XUV','0.25 - 3',22);
+INSERT INTO beamline VALUES(127,'PETRA III P06',NULL,NULL,'Hard X-ray micro-nano probe','2.4 - 50',22);
+INSERT INTO beamline VALUES(128,'SLS MicroXAS',NULL,NULL,'MicroXAS','5 - 20',19);
+INSERT INTO beamline VALUES(129,'SLS SuperXAS',NULL,NULL,'SuperXAS','4.5 - 35',19);
+INSERT INTO beamline VALUES(130,'SOLEIL DIFFABS',NULL,NULL,'DIFFABS','3 - 23',13);
+INSERT INTO beamline VALUES(131,'SOLEIL LUCIA',NULL,NULL,'LUCIA','0.8 - 8',13);
+INSERT INTO beamline VALUES(132,'SOLEIL ODE',NULL,NULL,'ODE','3.5 - 25',13);
+INSERT INTO beamline VALUES(133,'SOLEIL PROXIMA 1',NULL,NULL,'PROXIMA 1','5 - 15',13);
+INSERT INTO beamline VALUES(134,'SOLEIL SAMBA',NULL,NULL,'SAMBA','4 - 40',13);
 CREATE TABLE spectrum (
 	id INTEGER NOT NULL,
 	name TEXT NOT NULL,
 	notes TEXT,
-	energy TEXT,
-	i0 TEXT,
-	itrans TEXT,
-	ifluor TEXT,
-	irefer TEXT,
-	energy_stderr TEXT,
-	i0_stderr TEXT,
-	itrans_stderr TEXT,
-	ifluor_stderr TEXT,
-	irefer_stderr TEXT,
+	energy BLOB,
+	energy_ev BLOB,
+	description TEXT,
+	i0 BLOB,
+	itrans BLOB,
+	ifluor BLOB,
+	irefer BLOB,
+	energy_stderr BLOB,
+	i0_stderr BLOB,
+	itrans_stderr BLOB,
+	ifluor_stderr BLOB,
+	irefer_stderr BLOB,
 	energy_notes TEXT,
+	energy_resolution TEXT,
 	i0_notes TEXT,
 	itrans_notes TEXT,
 	ifluor_notes TEXT,
 	irefer_notes TEXT,
 	temperature TEXT,
-	filetext TEXT,
+	filetext BLOB,
+	fileheader TEXT,
+	content_hash VARCHAR(64),
+	data_fingerprint VARCHAR(64),
 	comments TEXT,
 	d_spacing FLOAT,
 	submission_date DATETIME,
 	collection_date DATETIME,
-	reference_used INTEGER,
+	modify_date DATETIME,
+	reference_sample TEXT,
+	rating_summary TEXT,
+	rating FLOAT,
 	energy_units_id INTEGER,
 	person_id INTEGER,
 	edge_id INTEGER,
+	mode_id INTEGER,
 	element_z INTEGER,
 	sample_id INTEGER,
 	beamline_id INTEGER,
 	citation_id INTEGER,
 	reference_mode_id INTEGER,
-	reference_id INTEGER,
 	PRIMARY KEY (id),
 	FOREIGN KEY(energy_units_id) REFERENCES energy_units (id),
 	FOREIGN KEY(person_id) REFERENCES person (id),
 	FOREIGN KEY(edge_id) REFERENCES edge (id),
+	FOREIGN KEY(mode_id) REFERENCES mode (id),
 	FOREIGN KEY(element_z) REFERENCES element (z),
 	FOREIGN KEY(sample_id) REFERENCES sample (id),
 	FOREIGN KEY(beamline_id) REFERENCES beamline (id),
 	FOREIGN KEY(citation_id) REFERENCES citation (id),
-	FOREIGN KEY(reference_mode_id) REFERENCES mode (id),
-	FOREIGN KEY(reference_id) REFERENCES sample (id)
+	FOREIGN KEY(reference_mode_id) REFERENCES reference_mode (id)
 );
-CREATE TABLE spectrum_suite (
+CREATE TABLE suite_rating (
 	id INTEGER NOT NULL,
+	score INTEGER,
+	datetime DATETIME,
+	comments TEXT,
+	person_id INTEGER,
 	suite_id INTEGER,
-	spectrum_id INTEGER,
-	PRIMARY KEY (id),
-	FOREIGN KEY(suite_id) REFERENCES suite (id),
-	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
-);
-CREATE TABLE spectrum_mode (
-	id INTEGER NOT NULL,
-	mode_id INTEGER,
-	spectrum_id INTEGER,
 	PRIMARY KEY (id),
-	FOREIGN KEY(mode_id) REFERENCES mode (id),
-	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
+	FOREIGN KEY(person_id) REFERENCES person (id),
+	FOREIGN KEY(suite_id) REFERENCES suite (id)
 );
 CREATE TABLE spectrum_rating (
 	id INTEGER NOT NULL,
@@ -351,6 +538,14 @@ CREATE TABLE spectrum_rating (
 	FOREIGN KEY(person_id) REFERENCES person (id),
 	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
 );
+CREATE TABLE spectrum_suite (
+	id INTEGER NOT NULL,
+	suite_id INTEGER,
+	spectrum_id INTEGER,
+	PRIMARY KEY (id),
+	FOREIGN KEY(suite_id) REFERENCES suite (id),
+	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
+);
 CREATE TABLE spectrum_ligand (
 	id INTEGER NOT NULL,
 	ligand_id INTEGER,
@@ -359,4 +554,48 @@ CREATE TABLE spectrum_ligand (
 	FOREIGN KEY(ligand_id) REFERENCES ligand (id),
 	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
 );
+CREATE TABLE spectrum_product (
+	id INTEGER NOT NULL,
+	spectrum_id INTEGER,
+	kind VARCHAR(64) NOT NULL,
+	param_hash VARCHAR(64) NOT NULL,
+	params TEXT,
+	result TEXT,
+	xdata BLOB,
+	ydata BLOB,
+	create_date DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
+);
+CREATE TABLE ingest_manifest (
+	id INTEGER NOT NULL,
+	path TEXT NOT NULL,
+	size INTEGER,
+	mtime FLOAT,
+	sha256 VARCHAR(64),
+	status VARCHAR(16),
+	message TEXT,
+	spectrum_id INTEGER,
+	ingest_date DATETIME,
+	PRIMARY KEY (id),
+	UNIQUE (path),
+	FOREIGN KEY(spectrum_id) REFERENCES spectrum (id)
+);
+CREATE VIRTUAL TABLE spectrum_fts
+     using fts5(name, description, sample, comments, beamline, person, metadata, tokenize='unicode61');
+CREATE INDEX ix_ingest_manifest_spectrum_id ON ingest_manifest (spectrum_id);
+CREATE INDEX ix_spectrum_beamline_id ON spectrum (beamline_id);
+CREATE INDEX ix_spectrum_citation_id ON spectrum (citation_id);
+CREATE INDEX ix_spectrum_content_hash ON spectrum (content_hash);
+CREATE INDEX ix_spectrum_data_fingerprint ON spectrum (data_fingerprint);
+CREATE INDEX ix_spectrum_edge_id ON spectrum (edge_id);
+CREATE INDEX ix_spectrum_element_z ON spectrum (element_z);
+CREATE INDEX ix_spectrum_person_id ON spectrum (person_id);
+CREATE INDEX ix_spectrum_rating ON spectrum (rating);
+CREATE INDEX ix_spectrum_sample_id ON spectrum (sample_id);
+CREATE INDEX ix_spectrum_product_spectrum_id_kind_param_hash ON spectrum_product (spectrum_id, kind, param_hash);
+CREATE INDEX ix_spectrum_rating_spectrum_id ON spectrum_rating (spectrum_id);
+CREATE INDEX ix_spectrum_suite_spectrum_id ON spectrum_suite (spectrum_id);
+CREATE INDEX ix_spectrum_suite_suite_id_spectrum_id ON spectrum_suite (suite_id, spectrum_id);
+CREATE INDEX ix_suite_rating_suite_id ON suite_rating (suite_id);
 COMMIT;
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""Benchmark of spectrum lookups with and without secondary indexes.
+
+Creates a synthetic library in a temporary sqlite file, drops the
+secondary indexes, times some common lookups, then restores the
+indexes with XASDataLibrary.ensure_indexes() and times them again.
+
+usage:  python bench_indexes.py [nspectra]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+from sqlalchemy import text
+
+from xaslib import XASDataLibrary
+from xaslib.creator import create_xaslib, INDEXES
+
+NSPECTRA = 50000
+NSAMPLES = 2000
+NSUITES = 200
+NLOOKUPS = 200
+
+def fill_library(db, nspectra):
+    "bulk insert synthetic samples, spectra, suite links and ratings"
+    tabs = db.tables
+    with db.engine.begin() as conn:
+        conn.execute(tabs['person'].insert(),
+                     [{'email': 'bench@xaslib', 'name': 'bench mark',
+                       'password': '', 'confirmed': 'true'}])
+        conn.execute(tabs['sample'].insert(),
+                     [{'name': 'sample %d' % i, 'person_id': 1}
+                      for i in range(NSAMPLES)])
+        conn.execute(tabs['suite'].insert(),
+                     [{'name': 'suite %d' % i, 'person_id': 1}
+                      for i in range(NSUITES)])
+        conn.execute(tabs['spectrum'].insert(),
+                     [{'name': 'spectrum %d' % i,
+                       'element_z': random.randint(20, 90),
+                       'edge_id': random.randint(1, 4),
+                       'beamline_id': 1, 'person_id': 1,
+                       'sample_id': random.randint(1, NSAMPLES)}
+                      for i in range(nspectra)])
+        conn.execute(tabs['spectrum_suite'].insert(),
+                     [{'suite_id': random.randint(1, NSUITES),
+                       'spectrum_id': random.randint(1, nspectra)}
+                      for i in range(nspectra//2)])
+        conn.execute(tabs['spectrum_rating'].insert(),
+                     [{'person_id': 1, 'score': random.randint(0, 5),
+                       'spectrum_id': random.randint(1, nspectra)}
+                      for i in range(nspectra//2)])
+
+def drop_indexes(db):
+    with db.engine.begin() as conn:
+        for tname, colnames in INDEXES:
+            name = 'ix_%s_%s' % (tname, '_'.join(colnames))
+            conn.execute(text('DROP INDEX IF EXISTS %s' % name))
+
+def time_lookups(db, nspectra, label):
+    queries = (('spectrum', 'sample_id', NSAMPLES),
+               ('spectrum', 'element_z', 90),
+               ('spectrum_suite', 'suite_id', NSUITES),
+               ('spectrum_rating', 'spectrum_id', nspectra))
+    print("## %s" % label)
+    for tname, colname, maxval in queries:
+        random.seed(1)
+        t0 = time.time()
+        for i in range(NLOOKUPS):
+            db.get_rows(tname, where={colname: random.randint(1, maxval)},
+                        columns=('id',))
+        dt = time.time() - t0
+        print("  %-16s %-12s  %8.3f ms/lookup" % (tname, colname,
+                                                  1000*dt/NLOOKUPS))
+
+def main(nspectra=NSPECTRA):
+    tmpdir = tempfile.mkdtemp()
+    dbname = os.path.join(tmpdir, 'bench_indexes.db')
+    random.seed(0)
+    create_xaslib(dbname)
+    db = XASDataLibrary(dbname)
+    t0 = time.time()
+    fill_library(db, nspectra)
+    print("inserted %d spectra in %.2f s" % (nspectra, time.time()-t0))
+
+    drop_indexes(db)
+    time_lookups(db, nspectra, 'without indexes')
+
+    t0 = time.time()
+    created = db.ensure_indexes()
+    print("created %d indexes in %.2f s" % (len(created), time.time()-t0))
+    time_lookups(db, nspectra, 'with indexes')
+    db.close()
+    shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    nspectra = NSPECTRA
+    if len(sys.argv) > 1:
+        nspectra = int(sys.argv[1])
+    main(nspectra)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Benchmark of E0 detection in xafs_preedge, comparing the vectorized
+find_e0_index() with the earlier loop, for all data/*/*.xdi files as
+measured and interpolated onto 16384 points, as for quick-EXAFS scans,
+and of normalizing all of these with preedge() or with preedge_batch().
+Exits with an error if the results differ.
+
+usage:  python bench_preedge.py
+"""
+import os
+import glob
+import time
+import numpy as np
+from larch.io import read_ascii
+
+from xaslib.xafs_preedge import (find_e0_index, remove_dups, preedge,
+                                 preedge_batch, index_of, index_nearest)
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+NQUICK = 16384
+# tolerance for edge_step, pre_edge and post_edge above E0 of preedge_batch()
+# vs preedge(), relative to the range of mu: polyfit() on raw energies is
+# poorly conditioned, so for tiny edge steps the two differ by more than
+# this relative to the step, and so in norm
+TOL = 1.e-4
+
+def e0_index_loop(dmu):
+    "E0 detection as done before find_e0_index()"
+    high_deriv_pts = np.where(dmu >  max(dmu)*0.05)[0]
+    idmu_max, dmu_max = 0, 0
+    for i in high_deriv_pts:
+        if (dmu[i] > dmu_max and
+            (i+1 in high_deriv_pts) and
+            (i-1 in high_deriv_pts)):
+            idmu_max, dmu_max = i, dmu[i]
+    return idmu_max
+
+def read_mu(fname):
+    "return energy, mu for an XDI file, or None"
+    try:
+        dat = read_ascii(fname)
+    except Exception:
+        return None
+    labels = [l.lower() for l in dat.array_labels]
+    if 'energy' not in labels or 'i0' not in labels:
+        return None
+    arr = {l: dat.data[i] for i, l in enumerate(labels)}
+    if 'itrans' in arr:
+        mu = -np.log(arr['itrans']/arr['i0'])
+    elif 'mutrans' in arr:
+        mu = arr['mutrans']
+    elif 'ifluor' in arr:
+        mu = arr['ifluor']/arr['i0']
+    elif 'mufluor' in arr:
+        mu = arr['mufluor']
+    else:
+        return None
+    energy = remove_dups(arr['energy'].copy())
+    if not np.all(np.isfinite(mu)):
+        return None
+    return energy, mu
+
+def time_e0(spectra, label):
+    nsame, t_loop, t_vec = 0, 0.0, 0.0
+    for energy, mu in spectra:
+        dmu = np.gradient(mu)/np.gradient(energy)
+        t0 = time.perf_counter()
+        iloop = e0_index_loop(dmu)
+        t1 = time.perf_counter()
+        ivec = int(find_e0_index(dmu))
+        t2 = time.perf_counter()
+        t_loop += t1 - t0
+        t_vec += t2 - t1
+        if iloop == ivec:
+            nsame += 1
+    print("%-22s %4d spectra, %4d same E0:  loop %9.2f ms   vectorized %7.2f ms  (x %.0f)" %
+          (label, len(spectra), nsame, 1000*t_loop, 1000*t_vec,
+           t_loop/max(t_vec, 1.e-9)))
+    return nsame == len(spectra)
+
+def fit_points(energy, pre):
+    "number of points in the post-edge fit of preedge()"
+    p1 = index_of(energy, pre['norm1'] + pre['e0'])
+    p2 = index_nearest(energy, pre['norm2'] + pre['e0'])
+    if p2-p1 < 2:
+        p2 = min(len(energy), p1 + 2)
+    return p2 - p1
+
+def main():
+    spectra = []
+    for fname in sorted(glob.glob(os.path.join(TOPDIR, 'data', '*', '*.xdi'))):
+        dat = read_mu(fname)
+        if dat is not None:
+            spectra.append(dat)
+
+    quick = []
+    for energy, mu in spectra:
+        qen = np.linspace(energy[0], energy[-1], NQUICK)
+        quick.append((qen, np.interp(qen, energy, mu)))
+
+    ok = time_e0(spectra, 'as measured')
+    ok = time_e0(quick, '%d points' % NQUICK) and ok
+
+    for group, label in ((spectra, 'as measured'), (quick, '%d points' % NQUICK)):
+        t0 = time.perf_counter()
+        single = [preedge(energy, mu) for energy, mu in group]
+        t1 = time.perf_counter()
+        out = preedge_batch([g[0] for g in group], [g[1] for g in group])
+        t2 = time.perf_counter()
+        nsame, nfree = 0, 0
+        for i, pre in enumerate(single):
+            if fit_points(group[i][0], pre) <= pre['nnorm']:
+                # too few points for the post-edge polynomial: polyfit()
+                # and preedge_batch() give different, arbitrary solutions
+                nfree += 1
+                continue
+            npts = out['npts'][i]
+            atol = TOL*np.ptp(group[i][1])
+            above = group[i][0] >= pre['e0']
+            if (pre['e0'] == out['e0'][i] and
+                abs(pre['edge_step'] - out['edge_step'][i]) <= atol and
+                np.allclose(pre['pre_edge'], out['pre_edge'][i][:npts],
+                            rtol=0, atol=atol) and
+                np.allclose(pre['post_edge'][above],
+                            out['post_edge'][i][:npts][above],
+                            rtol=0, atol=atol)):
+                nsame += 1
+        print("%-22s %4d spectra, %4d same:     preedge() %7.2f ms   preedge_batch() %7.2f ms" %
+              (label, len(group)-nfree, nsame, 1000*(t1-t0), 1000*(t2-t1)))
+        ok = ok and nsame + nfree == len(group)
+    if not ok:
+        raise SystemExit("E0 or normalization differs for some spectra")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""shared fixtures: an empty XAS Data Library made with create_xaslib(),
+and copies of a few of the XDI files in data/"""
+import os
+import glob
+import shutil
+import pytest
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+@pytest.fixture
+def xdl(tmp_path):
+    "empty XASDataLibrary, with one person, 'tester@example.org'"
+    from xaslib.creator import create_xaslib
+    from xaslib.xaslib import XASDataLibrary
+    fname = str(tmp_path / 'xdl.db')
+    create_xaslib(fname)
+    db = XASDataLibrary(fname)
+    db.add_person('Tester', 'tester@example.org', password='secret')
+    yield db
+    db.engine.dispose()
+
+@pytest.fixture
+def xdi_dir(tmp_path):
+    "folder with copies of the Fe XDI files in data/"
+    dest = tmp_path / 'xdi'
+    dest.mkdir()
+    for fname in sorted(glob.glob(os.path.join(TOPDIR, 'data', 'Fe', '*.xdi')))[:6]:
+        shutil.copy(fname, dest)
+    return dest
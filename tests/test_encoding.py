@@ -0,0 +1,91 @@
+"""encoding of spectrum arrays and file text for storage"""
+import json
+import numpy as np
+import pytest
+
+from xaslib.xaslib import (encode_array, decode_array, encode_text,
+                           decode_text, text_header, ARRAY_MAGIC, TEXT_MAGIC)
+
+XDI_TEXT = """# XDI/1.0
+# Element.symbol: Fe
+# Element.edge: K
+# Column.1: energy eV
+# Column.2: i0
+# ///
+# Fe foil, with a non-ASCII comment: Ångström
+#----
+# energy i0
+7100.0  1000.0
+7110.0  1010.0
+"""
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('arr', [np.linspace(7000, 7500, 501),
+                                 np.arange(12, dtype=np.int32),
+                                 np.arange(12.0).reshape(3, 4),
+                                 np.array([1.5, np.nan, np.inf])])
+def test_array_roundtrip(arr, compress):
+    blob = encode_array(arr, compress=compress)
+    assert blob[:4] == ARRAY_MAGIC
+    out = decode_array(blob)
+    assert out.dtype == arr.dtype
+    assert out.shape == arr.shape
+    np.testing.assert_array_equal(out, arr)
+
+def test_array_from_list_and_memoryview():
+    blob = encode_array([1, 2.5, 3])
+    out = decode_array(memoryview(blob))
+    assert out.dtype == np.float64
+    np.testing.assert_array_equal(out, [1, 2.5, 3])
+
+def test_array_encoded_unchanged():
+    blob = encode_array(np.arange(5.0))
+    assert encode_array(blob) is blob
+
+def test_array_none_and_empty():
+    assert encode_array(None) is None
+    assert decode_array(None) is None
+    assert decode_array('') is None
+    assert decode_array(b'  ') is None
+
+def test_array_legacy_json():
+    vals = [7100.0, 7100.5, 7101.25]
+    np.testing.assert_array_equal(decode_array(json.dumps(vals)), vals)
+    np.testing.assert_array_equal(decode_array(json.dumps(vals).encode()), vals)
+
+@pytest.mark.parametrize('compress', ['zlib', 'none'])
+def test_text_roundtrip(compress):
+    blob = encode_text(XDI_TEXT, compress=compress)
+    assert blob[:4] == TEXT_MAGIC
+    assert decode_text(blob) == XDI_TEXT
+    assert decode_text(memoryview(blob)) == XDI_TEXT
+
+def test_text_zlib_smaller():
+    text = XDI_TEXT * 50
+    assert len(encode_text(text)) < len(encode_text(text, compress='none'))
+
+def test_text_zstd():
+    pytest.importorskip('zstandard')
+    assert decode_text(encode_text(XDI_TEXT, compress='zstd')) == XDI_TEXT
+
+def test_text_encoded_unchanged():
+    blob = encode_text(XDI_TEXT)
+    assert encode_text(blob) is blob
+
+def test_text_unknown_compression():
+    with pytest.raises(ValueError):
+        encode_text(XDI_TEXT, compress='lzma')
+
+def test_text_legacy_plain():
+    assert encode_text(None) is None
+    assert decode_text(None) is None
+    assert decode_text(XDI_TEXT) == XDI_TEXT
+    assert decode_text(XDI_TEXT.encode('utf-8')) == XDI_TEXT
+
+def test_text_header():
+    header = text_header(XDI_TEXT)
+    lines = header.split('\n')
+    assert lines[0] == '# XDI/1.0'
+    assert lines[-1] == '# energy i0'
+    assert all(line.startswith('#') for line in lines)
+    assert text_header(None) is None
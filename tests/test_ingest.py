@@ -0,0 +1,157 @@
+"""adding many XDI files with XASDataLibrary.ingest_files()"""
+import os
+import shutil
+import pytest
+
+PERSON = 'tester@example.org'
+
+def quiet(status):
+    "progress function that prints nothing"
+    pass
+
+def xdi_files(folder):
+    return sorted(str(f) for f in folder.glob('*.xdi'))
+
+def ingest(xdl, fnames, **kws):
+    kws.setdefault('progress', quiet)
+    return xdl.ingest_files(fnames, PERSON, **kws)
+
+def test_ingest_adds_spectra(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    out = ingest(xdl, fnames, batch_size=4)
+    assert len(out['added']) == len(fnames)
+    assert out['failed'] == [] and out['linked'] == []
+    names = [row.name for row in xdl.get_rows('spectrum', order_by='id')]
+    assert names == [os.path.basename(f)[:-4] for f in fnames]
+    manifest = xdl.get_manifest([os.path.abspath(f) for f in fnames])
+    assert sorted(row.spectrum_id for row in manifest.values()) == sorted(out['added'])
+
+def test_ingest_needs_person(xdl, xdi_dir):
+    with pytest.raises(ValueError):
+        xdl.ingest_files(xdi_files(xdi_dir), 'nobody@example.org', progress=quiet)
+
+def test_ingest_bad_file(xdl, xdi_dir):
+    bad = xdi_dir / 'bad.xdi'
+    bad.write_text('not an XDI file\n')
+    out = ingest(xdl, xdi_files(xdi_dir))
+    assert [fname for fname, msg in out['failed']] == [str(bad)]
+    assert len(out['added']) == len(xdi_files(xdi_dir)) - 1
+
+def test_incremental_skips_unchanged(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    first = ingest(xdl, fnames, incremental=True)
+    assert len(first['added']) == len(fnames)
+    again = ingest(xdl, fnames, incremental=True)
+    assert again['added'] == [] and again['updated'] == []
+    assert again['skipped'] == len(fnames)
+
+    # a new modification time, but the same text, is not read again
+    stat = os.stat(fnames[0])
+    os.utime(fnames[0], (stat.st_atime, stat.st_mtime + 100))
+    touched = ingest(xdl, fnames, incremental=True)
+    assert touched['added'] == [] and touched['updated'] == []
+    assert touched['skipped'] == len(fnames)
+    row = xdl.get_manifest([os.path.abspath(fnames[0])])[os.path.abspath(fnames[0])]
+    assert row.mtime == os.stat(fnames[0]).st_mtime
+
+def test_incremental_updates_in_place(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    ingest(xdl, fnames, incremental=True)
+    nspectra = len(xdl.get_rows('spectrum'))
+    path = os.path.abspath(fnames[1])
+    spectrum_id = xdl.get_manifest([path])[path].spectrum_id
+    before = xdl.get_spectrum(spectrum_id)
+
+    with open(fnames[1], 'a') as fh:
+        fh.write('\n')
+    shutil.copy(fnames[2], xdi_dir / 'zz_new.xdi')
+    out = ingest(xdl, xdi_files(xdi_dir), incremental=True)
+    assert out['updated'] == [spectrum_id]
+    assert len(out['added']) == 1
+    assert out['skipped'] == len(fnames) - 1
+
+    after = xdl.get_spectrum(spectrum_id)
+    assert after.name == before.name
+    assert after.filetext != before.filetext
+    assert after.content_hash != before.content_hash
+    assert len(xdl.get_rows('spectrum')) == nspectra + 1
+
+def test_duplicates_added(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    ingest(xdl, fnames)
+    out = ingest(xdl, fnames[:2])
+    assert len(out['added']) == 2 and out['linked'] == []
+    assert len(xdl.get_rows('spectrum')) == len(fnames) + 2
+
+def test_duplicates_linked(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    first = ingest(xdl, fnames)
+    ids = dict(zip(fnames, first['added']))
+
+    # the same file text, and the same data with a different header
+    shutil.copy(fnames[0], xdi_dir / 'copy.xdi')
+    with open(fnames[1], 'r') as fh:
+        text = fh.read().replace('# ///', '# Extra.note: re-export\n# ///', 1)
+    with open(xdi_dir / 'header.xdi', 'w') as fh:
+        fh.write(text)
+    extra = [str(xdi_dir / 'copy.xdi'), str(xdi_dir / 'header.xdi')]
+    out = ingest(xdl, extra, on_duplicate='link')
+    assert out['added'] == []
+    assert out['linked'] == [(extra[0], ids[fnames[0]]),
+                             (extra[1], ids[fnames[1]])]
+    assert len(xdl.get_rows('spectrum')) == len(fnames)
+
+def test_duplicates_within_ingest(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    shutil.copy(fnames[0], xdi_dir / 'zz_copy.xdi')
+    out = ingest(xdl, xdi_files(xdi_dir), on_duplicate='link', batch_size=2)
+    assert len(out['added']) == len(fnames)
+    assert out['linked'] == [(str(xdi_dir / 'zz_copy.xdi'), out['added'][0])]
+
+def test_duplicates_error(xdl, xdi_dir):
+    fnames = xdi_files(xdi_dir)
+    ingest(xdl, fnames[:1])
+    out = ingest(xdl, fnames, on_duplicate='error')
+    assert len(out['added']) == len(fnames) - 1
+    assert [fname for fname, msg in out['failed']] == [fnames[0]]
+    assert out['linked'] == []
+
+def test_bad_duplicate_action(xdl, xdi_dir):
+    with pytest.raises(ValueError):
+        ingest(xdl, xdi_files(xdi_dir), on_duplicate='replace')
+
+def test_ingest_quiet_by_default(xdl, xdi_dir, capsys):
+    xdl.ingest_files(xdi_files(xdi_dir), PERSON)
+    assert capsys.readouterr().out == ''
+
+def test_ingest_workers(xdl, xdi_dir, tmp_path):
+    from xaslib.creator import create_xaslib
+    from xaslib.xaslib import XASDataLibrary
+    fnames = xdi_files(xdi_dir)
+    serial = ingest(xdl, fnames, chunk_size=2)
+
+    fname = str(tmp_path / 'workers.db')
+    create_xaslib(fname)
+    other = XASDataLibrary(fname)
+    other.add_person('Tester', PERSON, password='secret')
+    pooled = ingest(other, fnames, workers=2, chunk_size=2)
+    assert len(pooled['added']) == len(serial['added'])
+    assert pooled['failed'] == []
+    for sid1, sid2 in zip(serial['added'], pooled['added']):
+        assert (xdl.get_spectrum(sid1).content_hash ==
+                other.get_spectrum(sid2).content_hash)
+    other.engine.dispose()
+
+def test_read_xdi_chunks_known(xdi_dir):
+    from xaslib.ingest import read_xdi_chunks, file_stamp
+    fnames = xdi_files(xdi_dir)
+    known = {fnames[3]: file_stamp(fnames[3])['sha256']}
+    chunks = [(fnames[i:i+2], None,
+               {f: known[f] for f in fnames[i:i+2] if f in known})
+              for i in range(0, len(fnames), 2)]
+    results = list(read_xdi_chunks(chunks, workers=2))
+    assert [[rec['fname'] for rec in recs] for recs in results] == [
+        chunk[0] for chunk in chunks]
+    unchanged = [rec['fname'] for recs in results for rec in recs
+                 if rec.get('unchanged', False)]
+    assert unchanged == [fnames[3]]
@@ -0,0 +1,36 @@
+"""linear combination fits of spectra to standards in the library"""
+import numpy as np
+import pytest
+
+PERSON = 'tester@example.org'
+
+@pytest.fixture
+def standards(xdl, xdi_dir):
+    "ids of spectra of the Fe XDI files, by file name"
+    fnames = sorted(str(f) for f in xdi_dir.glob('*.xdi'))
+    ids = xdl.ingest_files(fnames, PERSON)['added']
+    return {f.split('/')[-1][:-4]: spid for f, spid in zip(fnames, ids)}
+
+def mixture(xdl, ids, weights):
+    """normalized mu(E) of a mixture of spectra, on the energies of the
+    first, with e0 of each aligned to that of the first"""
+    groups = xdl.get_preedges(ids)
+    first = groups[ids[0]]
+    energy = first['energy']
+    mu = np.zeros(len(energy))
+    for spid, weight in zip(ids, weights):
+        group = groups[spid]
+        mu += weight*np.interp(energy - first['e0'],
+                               group['energy'] - group['e0'], group['norm'])
+    return energy, mu
+
+def test_lcf_two_standards(xdl, standards):
+    ids = [standards['Fe2O3_rt_01'], standards['FeO_rt_01']]
+    fits = xdl.lcf(mixture(xdl, ids, (0.3, 0.7)),
+                   candidates=list(standards.values()), max_components=2)
+    best = fits[0]
+    weights = dict(zip(best['ids'], best['weights']))
+    assert sorted(weights) == sorted(ids)
+    assert weights[ids[0]] == pytest.approx(0.3, abs=0.02)
+    assert weights[ids[1]] == pytest.approx(0.7, abs=0.02)
+    assert best['rfactor'] < 1.e-3
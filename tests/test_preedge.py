@@ -0,0 +1,62 @@
+"""preedge_batch() gives the same results as preedge() for each spectrum"""
+import numpy as np
+import pytest
+
+from xaslib.xafs_preedge import preedge, preedge_batch
+
+def model_spectrum(e0, npts, seed):
+    "mu(E) with a sloped pre-edge, an arctan edge, and EXAFS-like wiggles"
+    rng = np.random.default_rng(seed)
+    energy = np.linspace(e0 - 200, e0 + 800, npts)
+    energy = energy + rng.uniform(-0.05, 0.05, npts)
+    energy.sort()
+    step = rng.uniform(0.5, 2.0)
+    kval = np.sqrt(np.clip(energy - e0, 0, None) / 3.81)
+    mu = (0.2 - 1.e-4*(energy - e0) +
+          step*(0.5 + np.arctan((energy - e0)/1.5)/np.pi) +
+          0.05*step*np.sin(2*2.5*kval)*np.exp(-0.01*kval**2)*(energy > e0))
+    return energy, mu
+
+@pytest.fixture
+def spectra():
+    return [model_spectrum(e0, npts, seed)
+            for seed, (e0, npts) in enumerate([(7112, 700), (8979, 850),
+                                               (7112, 700), (9659, 600),
+                                               (11867, 1000)])]
+
+def check_same(batch, singles):
+    for i, single in enumerate(singles):
+        npts = batch['npts'][i]
+        assert batch['e0'][i] == pytest.approx(single['e0'])
+        assert batch['edge_step'][i] == pytest.approx(single['edge_step'], rel=1.e-6)
+        np.testing.assert_allclose(batch['norm'][i][:npts], single['norm'],
+                                   rtol=1.e-6, atol=1.e-8)
+        np.testing.assert_allclose(batch['pre_edge'][i][:npts],
+                                   single['pre_edge'], rtol=1.e-6, atol=1.e-8)
+        assert np.all(np.isnan(batch['norm'][i][npts:]))
+
+def test_batch_matches_preedge(spectra):
+    singles = [preedge(en.copy(), mu) for en, mu in spectra]
+    batch = preedge_batch([en for en, mu in spectra], [mu for en, mu in spectra])
+    check_same(batch, singles)
+
+@pytest.mark.parametrize('nnorm', [1, 2, 3])
+def test_batch_matches_preedge_params(spectra, nnorm):
+    kws = {'nnorm': nnorm, 'pre1': -150, 'pre2': -40, 'norm1': 80, 'norm2': 600}
+    singles = [preedge(en.copy(), mu, **kws) for en, mu in spectra]
+    batch = preedge_batch([en for en, mu in spectra],
+                          [mu for en, mu in spectra], **kws)
+    check_same(batch, singles)
+
+def test_batch_given_e0(spectra):
+    e0s = [7110.0, 8980.0, 7113.0, 9660.0, 11866.0]
+    singles = [preedge(en.copy(), mu, e0=e0) for e0, (en, mu) in zip(e0s, spectra)]
+    batch = preedge_batch([en for en, mu in spectra], [mu for en, mu in spectra],
+                          e0=e0s)
+    check_same(batch, singles)
+
+def test_batch_shared_grid():
+    energy, mu0 = model_spectrum(7112, 800, 0)
+    mus = np.array([mu0, 2*mu0 + 0.1, 0.5*mu0])
+    singles = [preedge(energy.copy(), mu) for mu in mus]
+    check_same(preedge_batch(energy, mus), singles)
@@ -0,0 +1,44 @@
+"""stored pre-edge results match larch's preedge()"""
+import numpy as np
+import pytest
+
+from larch.math import remove_dups
+from larch.xafs.pre_edge import preedge, TINY_ENERGY
+from xaslib.xaslib import hash_params, preedge_params
+
+PERSON = 'tester@example.org'
+
+def larch_preedge(xdl, spectrum_id):
+    "larch's preedge() for the arrays of a spectrum"
+    arrays = xdl.row_arrays(xdl.get_spectrum(spectrum_id))
+    valid = arrays.valid()
+    energy = remove_dups(arrays.energy[valid], tiny=TINY_ENERGY)
+    return energy, preedge(energy, arrays.mu()[valid])
+
+def test_preedge_matches_larch(xdl, xdi_dir):
+    fnames = sorted(str(f) for f in xdi_dir.glob('*.xdi'))
+    out = xdl.ingest_files(fnames, PERSON)
+    assert len(out['added']) == len(fnames)
+    params = hash_params(preedge_params())
+    assert len(xdl.get_products(out['added'], 'preedge', params)) == len(fnames)
+    stored = xdl.get_preedges(out['added'])
+    assert sorted(stored) == sorted(out['added'])
+    for spectrum_id in out['added']:
+        result = stored[spectrum_id]
+        energy, expected = larch_preedge(xdl, spectrum_id)
+        assert result['edge_step'] > 0
+        assert result['e0'] == pytest.approx(expected['e0'])
+        assert result['edge_step'] == pytest.approx(expected['edge_step'], rel=1.e-9)
+        np.testing.assert_allclose(result['energy'], energy)
+        np.testing.assert_allclose(result['norm'], expected['norm'],
+                                   rtol=1.e-9, atol=1.e-12)
+
+def test_computed_preedge_matches_stored(xdl, xdi_dir):
+    fnames = sorted(str(f) for f in xdi_dir.glob('*.xdi'))
+    ids = xdl.ingest_files(fnames, PERSON)['added']
+    stored = xdl.get_preedges(ids)
+    computed = xdl.compute_preedge(ids)
+    for spectrum_id in ids:
+        assert computed[spectrum_id]['e0'] == stored[spectrum_id]['e0']
+        assert (computed[spectrum_id]['edge_step'] ==
+                pytest.approx(stored[spectrum_id]['edge_step'], rel=1.e-12))
@@ -0,0 +1,128 @@
+"""transactions, bulk inserts, and keyset pagination of SimpleDB"""
+import sqlite3
+import pytest
+from sqlalchemy import select
+
+from xaslib.simpledb import SimpleDB, keyset_clause, keyset_order
+
+# sort keys with NULLs and ties, by id
+VALUES = [3.0, None, 1.0, 3.0, None, 2.0, 1.0, None, 5.0]
+
+@pytest.fixture
+def sdb(tmp_path):
+    fname = str(tmp_path / 'simple.db')
+    conn = sqlite3.connect(fname)
+    conn.executescript("""
+    create table info (key text primary key, value text);
+    create table item (id integer primary key, name text, value float);
+    """)
+    conn.close()
+    db = SimpleDB(fname)
+    yield db
+    db.engine.dispose()
+
+def item_names(db):
+    return [row.name for row in db.get_rows('item', order_by='id')]
+
+def test_transaction_commits(sdb):
+    with sdb.transaction():
+        sdb.add_row('item', name='a')
+        sdb.add_row('item', name='b')
+    assert item_names(sdb) == ['a', 'b']
+    assert sdb.get_rows('info', where={'key': 'modify_date'},
+                        none_if_empty=True) is not None
+
+def test_transaction_rollback(sdb):
+    sdb.add_row('item', name='kept')
+    with pytest.raises(RuntimeError):
+        with sdb.transaction():
+            sdb.add_row('item', name='lost')
+            sdb.update('item', where={'name': 'kept'}, value=1.0)
+            raise RuntimeError('abort')
+    rows = sdb.get_rows('item')
+    assert [(r.name, r.value) for r in rows] == [('kept', None)]
+
+def test_transaction_nested(sdb):
+    with sdb.transaction() as outer:
+        sdb.add_row('item', name='outer')
+        with sdb.transaction() as inner:
+            assert inner is outer
+            sdb.add_row('item', name='inner')
+        # the inner block does not commit by itself
+        assert sdb._txn.session is outer
+    assert item_names(sdb) == ['outer', 'inner']
+    assert sdb._txn.session is None
+
+def test_transaction_nested_rollback(sdb):
+    with pytest.raises(RuntimeError):
+        with sdb.transaction():
+            sdb.add_row('item', name='outer')
+            with sdb.transaction():
+                sdb.add_row('item', name='inner')
+                raise RuntimeError('abort')
+    assert item_names(sdb) == []
+    # and the next transaction starts afresh
+    with sdb.transaction():
+        sdb.add_row('item', name='after')
+    assert item_names(sdb) == ['after']
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_add_rows_order(sdb, monkeypatch, returning):
+    attr = 'insert_executemany_returning_sort_by_parameter_order'
+    if returning:
+        if not getattr(sdb.engine.dialect, attr, False):
+            pytest.skip('database does not support INSERT .. RETURNING')
+    else:
+        monkeypatch.setattr(sdb.engine.dialect, attr, False, raising=False)
+    sdb.add_row('item', name='first')
+    rows = [{'name': f'row{i:d}', 'value': float(i)} for i in range(50)]
+    ids = sdb.add_rows('item', rows)
+    assert len(ids) == len(rows)
+    for pk, row in zip(ids, rows):
+        assert sdb.get_rows('item', where={'id': pk}, limit_one=True).name == row['name']
+
+def test_add_rows_mixed_columns(sdb):
+    ids = sdb.add_rows('item', [{'name': 'a'}, {'name': 'b', 'value': 2.0}])
+    assert [sdb.get_rows('item', where={'id': i}, limit_one=True).name
+            for i in ids] == ['a', 'b']
+
+def test_add_rows_no_ids(sdb):
+    modified = []
+    sdb.table_modified = modified.append
+    assert sdb.add_rows('item', [{'name': 'a'}, {'name': 'b'}],
+                        return_ids=False) is None
+    assert sdb.add_rows('item', []) == []
+    assert item_names(sdb) == ['a', 'b']
+    assert modified == ['item']
+
+def paginate(db, reverse, page_size=2):
+    "read all items a page at a time, returning (value, id) pairs"
+    tab = db.tables['item']
+    out = []
+    last = None
+    while True:
+        query = select(tab.c.value, tab.c.id)
+        if last is not None:
+            query = query.where(keyset_clause(tab.c.value, tab.c.id,
+                                              last[0], last[1], reverse=reverse))
+        query = query.order_by(*keyset_order(tab.c.value, tab.c.id,
+                                             reverse=reverse))
+        rows = [tuple(r) for r in db.execute(query.limit(page_size)).fetchall()]
+        if len(rows) == 0:
+            return out
+        out.extend(rows)
+        last = rows[-1]
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_keyset_nulls(sdb, reverse):
+    sdb.add_rows('item', [{'name': f'v{i:d}', 'value': v}
+                          for i, v in enumerate(VALUES)])
+    pairs = [(v, i+1) for i, v in enumerate(VALUES)]
+    nulls = [p for p in pairs if p[0] is None]
+    others = sorted(p for p in pairs if p[0] is not None)
+    if reverse:
+        expected = others[::-1] + nulls[::-1]
+    else:
+        expected = nulls + others
+    for page_size in (1, 2, 4, 20):
+        assert paginate(sdb, reverse, page_size=page_size) == expected
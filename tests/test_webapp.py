@@ -0,0 +1,16 @@
+"""page cursors of the spectrum browser"""
+import pytest
+
+pytest.importorskip('flask')
+from xaslib.webapp import page_cursor
+
+def test_page_cursor():
+    assert page_cursor(None) is None
+    assert page_cursor('["Fe_foil", 12]') == ['Fe_foil', 12]
+    assert page_cursor('[null, "7"]') == [None, 7]
+    assert page_cursor('[26, 3]') == [26, 3]
+
+@pytest.mark.parametrize('value', ['', '[1', '{"a": 1}', '5', '[1, 2, 3]',
+                                   '[[1], 2]', '["x", "y"]', '["x", null]'])
+def test_page_cursor_malformed(value):
+    assert page_cursor(value) is None
@@ -0,0 +1,61 @@
+"""the single pass XDI reader gives the same results as larch's XDIFile"""
+import os
+import glob
+import numpy as np
+import pytest
+
+from xaslib.xdifile import parse_xdi, read_xdi
+
+XDIFile = pytest.importorskip('larch.io').XDIFile
+
+TOPDIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+XDI_FILES = sorted(glob.glob(os.path.join(TOPDIR, 'data', '**', '*.xdi'),
+                             recursive=True))
+
+def as_str(val):
+    if isinstance(val, bytes):
+        val = val.decode('utf-8')
+    return val
+
+@pytest.mark.parametrize('fname', XDI_FILES,
+                         ids=[os.path.relpath(f, TOPDIR) for f in XDI_FILES])
+def test_matches_larch(fname):
+    try:
+        ref = XDIFile(fname)
+    except Exception:
+        with pytest.raises(ValueError):
+            read_xdi(fname)
+        return
+    dat = read_xdi(fname)
+    assert dat.labels == [label.lower() for label in ref.array_labels]
+    assert dat.units == list(ref.array_units)
+    assert dat.data.shape == ref.data.shape
+    np.testing.assert_allclose(dat.data, ref.data, equal_nan=True)
+    assert dat.element == as_str(ref.element)
+    assert dat.edge == as_str(ref.edge)
+    assert dat.dspacing == ref.dspacing
+    attrs = {family.lower(): {field.lower(): val for field, val in fields.items()}
+             for family, fields in ref.attrs.items()}
+    assert dat.attrs == attrs
+    for label in dat.labels:
+        np.testing.assert_array_equal(dat.get(label),
+                                      ref.data[dat.labels.index(label)])
+
+def test_not_xdi():
+    with pytest.raises(ValueError):
+        parse_xdi('# energy  mu\n7100 1.0\n')
+
+def test_no_data():
+    with pytest.raises(ValueError):
+        parse_xdi('# XDI/1.0\n# Column.1: energy eV\n#----\n')
+
+def test_unlabeled_columns():
+    dat = parse_xdi('# XDI/1.0 test/1\n# Column.1: angle degrees\n'
+                    '# ///\n# a comment\n#----\n10.0 1.0 2.0\n10.1 1.5 2.5\n')
+    assert dat.version == '1.0 test/1'
+    assert dat.labels == ['angle', 'col2', 'col3']
+    assert dat.energy_label == 'angle'
+    assert dat.energy_units == 'degrees'
+    assert dat.comments == 'a comment'
+    assert dat.get('energy') is None
+    np.testing.assert_array_equal(dat.get('col3'), [2.0, 2.5])
@@ -8,14 +8,75 @@ import time
 import shutil
 from datetime import datetime
 
-from sqlalchemy.orm import sessionmaker, create_session
-from sqlalchemy import (MetaData, create_engine, Table, Column, Integer,
-                        Float, String, Text, DateTime, ForeignKey)
+from sqlalchemy import (MetaData, create_engine, Table, Column, Index,
+                        Integer, Float, String, Text, DateTime, LargeBinary,
+                        ForeignKey, text)
 
 from sqlalchemy.pool import SingletonThreadPool
 
 from . import initialdata
 
+# secondary indexes: (table name, column names)
+INDEXES = (('spectrum', ('element_z',)),
+           ('spectrum', ('edge_id',)),
+           ('spectrum', ('beamline_id',)),
+           ('spectrum', ('person_id',)),
+           ('spectrum', ('sample_id',)),
+           ('spectrum', ('citation_id',)),
+           ('spectrum', ('rating',)),
+           ('spectrum', ('content_hash',)),
+           ('spectrum', ('data_fingerprint',)),
+           ('spectrum_suite', ('suite_id', 'spectrum_id')),
+           ('spectrum_suite', ('spectrum_id',)),
+           ('spectrum_rating', ('spectrum_id',)),
+           ('spectrum_product', ('spectrum_id', 'kind', 'param_hash')),
+           ('ingest_manifest', ('spectrum_id',)),
+           ('suite_rating', ('suite_id',)))
+
+# columns added after the first release: (table name, column name, type),
+# so that XASDataLibrary.upgrade_schema() can add them to older libraries
+ADDED_COLUMNS = (('spectrum', 'rating', Float),
+                 ('spectrum', 'modify_date', DateTime),
+                 ('spectrum', 'energy_ev', LargeBinary),
+                 ('spectrum', 'content_hash', String),
+                 ('spectrum', 'data_fingerprint', String),
+                 ('spectrum', 'fileheader', Text))
+
+# full text search index for spectra: an FTS5 table for sqlite, with
+# rowid = spectrum id, or a tsvector table with a GIN index for postgresql
+SEARCH_COLUMNS = ('name', 'description', 'sample', 'comments',
+                  'beamline', 'person', 'metadata')
+
+SEARCH_INDEX_DDL = {
+    'sqlite': ["""create virtual table if not exists spectrum_fts
+     using fts5(%s, tokenize='unicode61')""" % (', '.join(SEARCH_COLUMNS))],
+    'postgresql': ["""create table if not exists spectrum_fts
+     (spectrum_id integer primary key, document tsvector)""",
+                   """create index if not exists ix_spectrum_fts_document
+     on spectrum_fts using gin(document)"""]}
+
+def create_search_index(conn, dialect_name):
+    """create full text search table for spectra, given a connection
+    and name of the database dialect.  Returns whether the table was made"""
+    ddl = SEARCH_INDEX_DDL.get(dialect_name, None)
+    if ddl is None:
+        return False
+    for statement in ddl:
+        conn.execute(text(statement))
+    return True
+
+def make_indexes(tables):
+    """make Index objects for INDEXES, given a dict of Tables.
+    Indexes for missing tables or columns are skipped"""
+    out = []
+    for tname, colnames in INDEXES:
+        tab = tables.get(tname, None)
+        if tab is None or any(c not in tab.c for c in colnames):
+            continue
+        name = 'ix_%s_%s' % (tname, '_'.join(colnames))
+        out.append(Index(name, *[tab.c[c] for c in colnames]))
+    return out
+
 def PointerCol(name, other=None, keyid='id', **kws):
     "pointer column"
     if other is None:
@@ -30,6 +91,10 @@ def StrCol(name, size=None, **kws):
     else:
         return Column(name, String(size), **kws)
 
+def BlobCol(name, **kws):
+    "binary column, for encoded arrays and file text"
+    return Column(name, LargeBinary, **kws)
+
 def IntCol(name, **kws):
     "integer column"
     return Column(name, Integer, **kws)
@@ -50,6 +115,42 @@ def NamedTable(tablename, metadata, keyid='id', nameid='name',
         args.extend(cols)
     return Table(tablename, metadata, *args)
 
+def ProductTable(metadata):
+    """table of results derived from spectra, such as pre-edge subtraction
+    and normalization, keyed by spectrum, kind of product, and a hash of
+    the parameters used.  result holds JSON, xdata and ydata hold arrays"""
+    return Table('spectrum_product', metadata,
+                 IntCol('id', primary_key=True),
+                 PointerCol('spectrum'),
+                 StrCol('kind', size=64, nullable=False),
+                 StrCol('param_hash', size=64, nullable=False),
+                 StrCol('params'),
+                 StrCol('result'),
+                 BlobCol('xdata'),
+                 BlobCol('ydata'),
+                 DateCol('create_date'))
+
+def ManifestTable(metadata):
+    """table of files read by XASDataLibrary.ingest_files(), keyed by
+    absolute path, with size, modification time and SHA-256 of the file
+    when read, whether it was 'added' or 'failed' (with message), and
+    the spectrum made from it"""
+    return Table('ingest_manifest', metadata,
+                 IntCol('id', primary_key=True),
+                 StrCol('path', nullable=False, unique=True),
+                 IntCol('size'),
+                 Column('mtime', Float),
+                 StrCol('sha256', size=64),
+                 StrCol('status', size=16),
+                 StrCol('message'),
+                 PointerCol('spectrum'),
+                 DateCol('ingest_date'))
+
+# tables added after the first release, as functions of a MetaData,
+# so that XASDataLibrary.upgrade_schema() can add them to older libraries
+ADDED_TABLES = (('spectrum_product', ProductTable),
+                ('ingest_manifest', ManifestTable))
+
 
 def create_xaslib(dbname, server= 'sqlite', user='',
                 password='',  host='', port=None):
@@ -84,7 +185,7 @@ def create_xaslib(dbname, server= 'sqlite', user='',
 
         engine = create_engine(conn_str % (user, password, host, port, dbname))
 
-    metadata =  MetaData(engine)
+    metadata =  MetaData()
 
 
     info = Table('info', metadata,
@@ -147,17 +248,18 @@ def create_xaslib(dbname, server= 'sqlite', user='',
                               ])
 
     spectrum = NamedTable('spectrum', metadata, name_unique=False,
-                          cols=[StrCol('energy'),
+                          cols=[BlobCol('energy'),
+                                BlobCol('energy_ev'),
                                 StrCol('description'),
-                                StrCol('i0'),
-                                StrCol('itrans'),
-                                StrCol('ifluor'),
-                                StrCol('irefer'),
-                                StrCol('energy_stderr'),
-                                StrCol('i0_stderr'),
-                                StrCol('itrans_stderr'),
-                                StrCol('ifluor_stderr'),
-                                StrCol('irefer_stderr'),
+                                BlobCol('i0'),
+                                BlobCol('itrans'),
+                                BlobCol('ifluor'),
+                                BlobCol('irefer'),
+                                BlobCol('energy_stderr'),
+                                BlobCol('i0_stderr'),
+                                BlobCol('itrans_stderr'),
+                                BlobCol('ifluor_stderr'),
+                                BlobCol('irefer_stderr'),
                                 StrCol('energy_notes'),
                                 StrCol('energy_resolution'),
                                 StrCol('i0_notes'),
@@ -165,13 +267,18 @@ def create_xaslib(dbname, server= 'sqlite', user='',
                                 StrCol('ifluor_notes'),
                                 StrCol('irefer_notes'),
                                 StrCol('temperature'),
-                                StrCol('filetext'),
+                                BlobCol('filetext'),
+                                StrCol('fileheader'),
+                                StrCol('content_hash', size=64),
+                                StrCol('data_fingerprint', size=64),
                                 StrCol('comments'),
                                 Column('d_spacing', Float),
                                 DateCol('submission_date'),
                                 DateCol('collection_date'),
+                                DateCol('modify_date'),
                                 StrCol('reference_sample'),
                                 StrCol('rating_summary'),
+                                Column('rating', Float),
                                 PointerCol('energy_units'),
                                 PointerCol('person'),
                                 PointerCol('edge'),
@@ -218,45 +325,57 @@ def create_xaslib(dbname, server= 'sqlite', user='',
                            PointerCol('ligand'),
                            PointerCol('spectrum'))
 
-    metadata.create_all()
-    session = sessionmaker(bind=engine)()
-
-    for z, sym, name  in initialdata.elements:
-        element.insert().execute(z=z, symbol=sym,  name=name)
-
-    for units, notes  in initialdata.e_units:
-        energy_units.insert().execute(units=units, notes=notes)
-
-    for name, level in initialdata.edges:
-        edge.insert().execute(name=name, level=level)
-
-    for name, notes in initialdata.modes:
-        mode.insert().execute(name=name, notes=notes)
-
-    for name, notes in initialdata.reference_modes:
-        refmode.insert().execute(name=name, notes=notes)
-
-    for name, country, city, fullname, lab in initialdata.facilities:
-        facility.insert().execute(name=name, country=country, city=city,
-                                  fullname=fullname, laboratory=lab)
-
-    session.commit()
-    for name, fac_name, nickname, erange in initialdata.beamlines:
-        fac_id = None
-        f = facility.select(facility.c.name==fac_name).execute().fetchall()
-        if len(f) > 0:
-            fac_id = f[0].id
-        beamline.insert().execute(name=name, nickname=nickname,
-                                  energy_range=erange, facility_id=fac_id)
-
-    now = datetime.isoformat(datetime.now())
-    for key, value in initialdata.info:
-        if value == '<now>':
-            value = now
-        info.insert().execute(key=key, value=value)
-
-    session.flush()
-    session.commit()
+    ProductTable(metadata)
+    ManifestTable(metadata)
+
+    make_indexes(metadata.tables)
+    metadata.create_all(engine)
+
+    # initial data is inserted with executemany, one table at a time
+    with engine.begin() as conn:
+        create_search_index(conn, engine.dialect.name)
+
+        conn.execute(element.insert(),
+                     [{'z': z, 'symbol': sym, 'name': name}
+                      for z, sym, name in initialdata.elements])
+
+        conn.execute(energy_units.insert(),
+                     [{'units': units, 'notes': notes}
+                      for units, notes in initialdata.e_units])
+
+        conn.execute(edge.insert(),
+                     [{'name': name, 'level': level}
+                      for name, level in initialdata.edges])
+
+        conn.execute(mode.insert(),
+                     [{'name': name, 'notes': notes}
+                      for name, notes in initialdata.modes])
+
+        conn.execute(refmode.insert(),
+                     [{'name': name, 'notes': notes}
+                      for name, notes in initialdata.reference_modes])
+
+        conn.execute(facility.insert(),
+                     [{'name': name, 'country': country, 'city': city,
+                       'fullname': fullname, 'laboratory': lab}
+                      for name, country, city, fullname, lab
+                      in initialdata.facilities])
+
+        fac_ids = {}
+        for row in conn.execute(facility.select()).fetchall():
+            fac_ids[row.name] = row.id
+
+        conn.execute(beamline.insert(),
+                     [{'name': name, 'nickname': nickname,
+                       'energy_range': erange,
+                       'facility_id': fac_ids.get(fac_name, None)}
+                      for name, fac_name, nickname, erange
+                      in initialdata.beamlines])
+
+        now = datetime.isoformat(datetime.now())
+        conn.execute(info.insert(),
+                     [{'key': key, 'value': now if value == '<now>' else value}
+                      for key, value in initialdata.info])
 
 
 def dumpsql(dbname, fname='xdl_init.sql', server='sqlite'):
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+  reading XDI files for XASDataLibrary.add_xdifile() and ingest_files(),
+  in worker processes, and content hashes and data fingerprints of
+  spectra for finding duplicates
+"""
+
+import os
+import struct
+from hashlib import sha256
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .simpledb import isotime
+from .xdifile import read_xdi
+from .xaslib import (json_encode, encode_array, encode_text, text_header,
+                     energy_to_ev, SpectrumArrays, SPECTRUM_ARRAYS,
+                     FILETEXT_COMPRESSION, PREEDGE_PARAMS, FEATURE_GRID,
+                     preedge_products, preedge_row, feature_rows)
+
+# rounding of energies (eV), and of mu(E) scaled from 0 to 1, for data
+# fingerprints (see hash_data)
+FINGERPRINT_ESTEP = 0.01
+FINGERPRINT_MUSTEP = 1.e-4
+
+# number of chunks of files per process read ahead of the writer
+# by read_xdi_chunks()
+CHUNKS_PER_WORKER = 2
+
+def hash_text(text):
+    "SHA-256 of file text, as spectrum.content_hash, or None for None"
+    if text is None:
+        return None
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return sha256(text).hexdigest()
+
+def hash_data(energy, mu):
+    """fingerprint of energy (eV) and mu(E) arrays, as
+    spectrum.data_fingerprint, or None without enough finite points.
+    Energies are rounded to FINGERPRINT_ESTEP and mu(E), scaled from 0
+    to 1, to FINGERPRINT_MUSTEP before hashing, so that the same data
+    written with different headers or number formats match"""
+    if energy is None or mu is None:
+        return None
+    energy = np.asarray(energy, dtype=np.float64)
+    mu = np.asarray(mu, dtype=np.float64)
+    if energy.shape != mu.shape:
+        return None
+    valid = np.isfinite(energy) & np.isfinite(mu)
+    if valid.sum() < 3:
+        return None
+    energy, mu = energy[valid], mu[valid]
+    mu = (mu - mu.min())/max(mu.max() - mu.min(), 1.e-300)
+    sha = sha256(struct.pack('<I', len(energy)))
+    sha.update(np.round(energy/FINGERPRINT_ESTEP).astype('<i8').tobytes())
+    sha.update(np.round(mu/FINGERPRINT_MUSTEP).astype('<i8').tobytes())
+    return sha.hexdigest()
+
+def spectrum_hashes(filetext, arrays):
+    """return content hash of file text (see hash_text) and data
+    fingerprint (see hash_data) of a SpectrumArrays"""
+    try:
+        fingerprint = hash_data(arrays.energy, arrays.mu())
+    except (TypeError, ValueError):
+        fingerprint = None
+    return hash_text(filetext), fingerprint
+
+def xdi_record(fname, mode=None):
+    """read an XDI file, returning a dict with 'spectrum', the arguments
+    for XASDataLibrary.spectrum_row() except person and sample, and
+    'sample', a dict of name, notes, and other sample columns, or None.
+    Raises ValueError for files without usable data"""
+    xdi = read_xdi(fname)
+    fname = os.path.split(fname)[1]
+    spectrum_name = fname
+    if spectrum_name.endswith('.xdi'):
+        spectrum_name = spectrum_name[:-4]
+
+    try:
+        c_date = xdi.attrs['scan']['start_time']
+    except:
+        c_date = 'collection date unknown'
+    if xdi.energy_label is None:
+        raise ValueError(f"cannot find energy data in {fname}")
+    energy = xdi.get(xdi.energy_label)
+
+    i0  = xdi.get('i0', xdi.get('io', np.ones(len(energy))*1.0))
+    itrans = xdi.get('itrans', xdi.get('i1', None))
+    ifluor = xdi.get('ifluor', xdi.get('if', None))
+    irefer = xdi.get('irefer', xdi.get('i2', None))
+
+    if xdi.get('mutrans') is not None:
+        itrans = i0 * np.exp(-xdi.get('mutrans'))
+    if xdi.get('mufluor') is not None:
+        ifluor = i0 * xdi.get('mufluor')
+
+    if mode is None:
+        mode = 'fluorescence'
+        if itrans is not None:
+            mode = 'transmission'
+    if mode == 'transmission' and itrans is None:
+        raise ValueError("cannot find transmission data")
+    elif mode == 'fluoresence' and ifluor is None:
+        raise ValueError("cannot find fluorescence data")
+
+    reference_mode = 'none' if irefer is None else 'transmission'
+
+    temperature = None
+    reference_sample = None
+    sample = None
+    if 'sample' in xdi.attrs:
+        sample_attrs  = xdi.attrs['sample']
+        if 'temperature' in sample_attrs:
+            temperature = sample_attrs['temperature']
+        sample_name = sample_attrs.pop('name', spectrum_name)
+        if 'reference' in sample_attrs:
+            reference_sample = sample_attrs['reference']
+
+        sample = {'name': sample_name,
+                  'notes': "sample for '%s', uploaded %s" % (fname, isotime())}
+        for attr in ('preparation', 'formula'):
+            shortname = attr[:4]
+            if shortname in sample_attrs:
+                sample[attr] = sample_attrs.pop(shortname)
+            elif attr in sample_attrs:
+                sample[attr] = sample_attrs.pop(attr)
+        if len(sample_attrs) > 0:
+            sample['notes'] = '%s\n%s' % (sample['notes'], json_encode(sample_attrs))
+
+    if reference_mode != 'none':
+        if reference_sample is None:
+            reference_sample = 'unknown'
+    else:
+        reference_sample = 'none'
+
+    spectrum = {'name': spectrum_name, 'description': spectrum_name,
+                'd_spacing': xdi.dspacing, 'collection_date': c_date,
+                'beamline': xdi.attrs['beamline']['name'],
+                'edge': xdi.edge, 'element': xdi.element, 'mode': mode,
+                'energy': energy, 'energy_units': xdi.energy_units,
+                'i0': i0, 'itrans': itrans, 'ifluor': ifluor,
+                'irefer': irefer, 'comments': xdi.comments,
+                'notes': json_encode(xdi.attrs), 'filetext': xdi.text,
+                'reference_sample': reference_sample,
+                'reference_mode': reference_mode,
+                'temperature': temperature}
+    return {'spectrum': spectrum, 'sample': sample}
+
+def record_arrays(spect):
+    """return SpectrumArrays, with energy in eV, for the arrays of a
+    spectrum from xdi_record()"""
+    energy_ev = energy_to_ev(spect['energy'], spect['energy_units'],
+                             spect['d_spacing'])
+    return SpectrumArrays(mode=spect['mode'], refmode=spect['reference_mode'],
+                          energy=energy_ev, i0=spect['i0'],
+                          itrans=spect['itrans'], ifluor=spect['ifluor'],
+                          irefer=spect['irefer'])
+
+def duplicate_message(fname, dup):
+    "message for a file that duplicates a spectrum, from find_duplicates()"
+    what = 'file' if dup['match'] == 'file' else 'data'
+    return f"{fname}: same {what} as spectrum '{dup['name']}' (id {dup['id']})"
+
+def file_stamp(fname):
+    """return dict of 'path' (absolute), 'size', 'mtime' and 'sha256'
+    (of the contents) of a file, as for the ingest_manifest table"""
+    sha = sha256()
+    with open(fname, 'rb') as fh:
+        stat = os.fstat(fh.fileno())
+        for block in iter(lambda: fh.read(1<<20), b''):
+            sha.update(block)
+    return {'path': os.path.abspath(fname), 'size': stat.st_size,
+            'mtime': stat.st_mtime, 'sha256': sha.hexdigest()}
+
+def read_xdi_chunk(args):
+    """read XDI files and compute their stored products, for
+    XASDataLibrary.ingest_files() and process pools.  args is a tuple
+    of file names, mode, and dict of {file name: SHA-256} of those of
+    the files read before.  Returns a list of dicts with 'fname', 'stamp' (see
+    file_stamp()), and either 'error', 'unchanged' for files with the
+    SHA-256 given, or the results of xdi_record(), with arrays encoded,
+    'energy_ev', and 'products', a list of (kind, params, row) for the
+    spectrum_product table"""
+    fnames, mode, known = args
+    records = []
+    for fname in fnames:
+        try:
+            stamp = file_stamp(fname)
+        except OSError as exc:
+            records.append({'fname': fname, 'stamp': None,
+                            'error': f"{type(exc).__name__}: {exc}"})
+            continue
+        if known.get(fname, None) == stamp['sha256']:
+            records.append({'fname': fname, 'stamp': stamp, 'unchanged': True})
+            continue
+        try:
+            rec = xdi_record(fname, mode=mode)
+        except Exception as exc:
+            records.append({'fname': fname, 'stamp': stamp,
+                            'error': f"{type(exc).__name__}: {exc}"})
+            continue
+        spect = rec['spectrum']
+        rec['arrays'] = arrays = record_arrays(spect)
+        spect['content_hash'], spect['data_fingerprint'] = spectrum_hashes(
+            spect['filetext'], arrays)
+        spect['energy_ev'] = encode_array(energy_to_ev(spect['energy'],
+                                                       spect['energy_units'],
+                                                       spect['d_spacing']))
+        spect['fileheader'] = text_header(spect['filetext'])
+        spect['filetext'] = encode_text(spect['filetext'],
+                                        compress=FILETEXT_COMPRESSION)
+        for attr in SPECTRUM_ARRAYS:
+            spect[attr] = encode_array(spect.get(attr, None))
+        rec.update({'fname': fname, 'stamp': stamp, 'products': []})
+        records.append(rec)
+
+    for kind, refer in (('preedge', False), ('preedge_refer', True)):
+        recs, energies, mus = [], [], []
+        for rec in records:
+            arrays = rec.get('arrays', None)
+            try:
+                valid = None if arrays is None else arrays.valid(refer=refer)
+            except (TypeError, ValueError):
+                valid = None
+            if valid is None or valid.sum() < 3:
+                continue
+            mu = arrays.mu_refer() if refer else arrays.mu()
+            recs.append(rec)
+            energies.append(arrays.energy[valid])
+            mus.append(mu[valid])
+        if len(recs) == 0:
+            continue
+        results = preedge_products(energies, mus)
+        for rec, result in zip(recs, results):
+            if result is not None:
+                rec['products'].append((kind, PREEDGE_PARAMS, preedge_row(result)))
+        if not refer:
+            for rec, row in zip(recs, feature_rows(results)):
+                if row is not None:
+                    rec['products'].append(('xanes_features', FEATURE_GRID, row))
+    for rec in records:
+        rec.pop('arrays', None)
+    return records
+
+
+def read_xdi_chunks(chunks, workers=None):
+    """yield the results of read_xdi_chunk() for a list of chunks, in
+    order, reading them in a pool of workers processes, or in this
+    process for workers=None.  At most CHUNKS_PER_WORKER chunks per
+    process are read ahead of those used, to bound the memory held"""
+    if workers is None or workers < 2 or len(chunks) < 2:
+        for chunk in chunks:
+            yield read_xdi_chunk(chunk)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(read_xdi_chunk, chunk))
+            if len(pending) >= CHUNKS_PER_WORKER*workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
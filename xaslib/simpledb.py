@@ -7,11 +7,14 @@ import os
 import time
 import random
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
-from sqlalchemy import MetaData, create_engine, text, and_
+from sqlalchemy import MetaData, create_engine, select, text, and_, or_
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.sqltypes import INTEGER
+from sqlalchemy.sql.expression import ClauseElement
 
 from base64 import b64encode
 from hashlib import pbkdf2_hmac
@@ -92,6 +95,28 @@ def isotime(dtime=None, sep=' '):
         dtime = datetime.now()
     return datetime.isoformat(dtime, sep=sep)
 
+def keyset_clause(column, idcolumn, value, last_id, reverse=False):
+    """where clause for keyset pagination: rows that come after the row
+    with (value, last_id) when ordered by (column, idcolumn), with NULLs
+    first, or in reverse order, with NULLs last.
+    Use with keyset_order() for the matching order_by"""
+    if not reverse:
+        if value is None:
+            return or_(and_(column.is_(None), idcolumn > last_id),
+                       column.isnot(None))
+        return or_(column > value, and_(column == value, idcolumn > last_id))
+    if value is None:
+        return and_(column.is_(None), idcolumn < last_id)
+    return or_(column < value, and_(column == value, idcolumn < last_id),
+               column.is_(None))
+
+def keyset_order(column, idcolumn, reverse=False):
+    """order_by arguments for (column, idcolumn) for keyset_clause()"""
+    if reverse:
+        return (column.desc().nulls_last(), idcolumn.desc())
+    return (column.asc().nulls_first(), idcolumn.asc())
+
+
 class SimpleDB(object):
     """simple, common interface to Sqlite/Postgres databases
 
@@ -107,6 +132,7 @@ class SimpleDB(object):
 
     connect(dbname, serve, user, password, port, host)
     close()
+    transaction()
     execute()
     set_info()
     get_rows()
@@ -117,6 +143,7 @@ class SimpleDB(object):
         self.engine = None
         self.metadata = None
         self.logfile = logfile
+        self._txn = threading.local()
         if dbname is not None:
             self.connect(dbname, server=server, user=user,
                          password=password, port=port, host=host, dialect=dialect)
@@ -150,14 +177,11 @@ class SimpleDB(object):
             connect_str = f'{server}+{dialect}://{connect_str}'
 
         self.engine = create_engine(connect_str, connect_args=connect_args)
-        self.metadata = MetaData()
         try:
-            self.metadata.reflect(bind=self.engine)
+            self.refresh_tables()
         except:
             raise ValueError(f'{dnamme:s} is not a valid database' % dbname)
 
-        tables = self.tables = self.metadata.tables
-
         if self.logfile is None and server.startswith('sqlit'):
             self.logfile = f"{self.dbname:s}.log"
             logging.basicConfig()
@@ -165,20 +189,61 @@ class SimpleDB(object):
             logger.addHandler(logging.FileHandler(self.logfile))
 
 
+    def refresh_tables(self):
+        "reflect table definitions from the database"
+        self.metadata = MetaData()
+        self.metadata.reflect(bind=self.engine)
+        self.tables = self.metadata.tables
+
     def close(self):
         "close session"
         with Session(self.engine) as session, session.begin():
             session.flush()
 
-    def execute(self, query, set_modify_date=False):
-        """general execute of query, optionally setting 'modify date' and committing"""
-        result = None
-        with Session(self.engine) as session, session.begin():
-            result = session.execute(query)
+    @contextmanager
+    def transaction(self):
+        """context manager for a transaction: all queries made inside
+        the `with` block use a single session and are committed together
+        at the end, or rolled back if an exception is raised.  If any of
+        them modified the database, 'modify_date' is set once, at commit.
+
+        Nested calls join the outer transaction.  Transactions are
+        per-thread.
+
+        >>> with db.transaction():
+        ...     db.add_row('sample', name='Fe2O3', person_id=1)
+        ...     db.update('spectrum', where=3, sample_id=2)
+        """
+        session = getattr(self._txn, 'session', None)
+        if session is not None:
+            yield session
+            return
+        session = Session(self.engine)
+        self._txn.session = session
+        self._txn.modified = False
+        try:
+            with session.begin():
+                yield session
+                if self._txn.modified:
+                    session.execute(self.set_info('modify_date', isotime(),
+                                                  do_execute=False))
+        finally:
+            self._txn.session = None
+            self._txn.modified = False
+            session.close()
+
+    def execute(self, query, params=None, set_modify_date=False):
+        """general execute of query, optionally setting 'modify date'.
+        Joins the current transaction, if there is one, otherwise the
+        query is run and committed in its own transaction.
+        A list of dicts for `params` will use executemany."""
+        with self.transaction() as session:
+            if params is None:
+                result = session.connection().execute(query)
+            else:
+                result = session.connection().execute(query, params)
             if set_modify_date:
-                session.execute(self.set_info('modify_date', isotime(),
-                                              do_execute=False))
-            session.flush()
+                self._txn.modified = True
         return result
 
     def set_info(self, key, value, do_execute=True):
@@ -200,9 +265,72 @@ class SimpleDB(object):
         self.set_info('modify_date', isotime(), do_execute=True)
 
     def add_row(self, tablename, **kws):
-        """add row to a table with keyword/value pairs"""
+        """add row to a table with keyword/value pairs,
+        returns primary key of the new row"""
         tab = self.tables[tablename]
-        self.execute(tab.insert().values(**kws), set_modify_date=True)
+        result = self.execute(tab.insert().values(**kws), set_modify_date=True)
+        self.table_modified(tablename)
+        pkey = result.inserted_primary_key
+        if pkey is not None and len(pkey) == 1:
+            pkey = pkey[0]
+        return pkey
+
+    def add_rows(self, tablename, rows, return_ids=True):
+        """add many rows to a table in a single transaction
+
+        Arguments
+        ----------
+        tablename   name of table
+        rows        list of dicts of column/value pairs
+        return_ids  whether to return primary keys of the new rows [True]
+
+        Returns
+        -------
+        list of primary keys of the new rows, in the order given,
+        or None if return_ids=False
+
+        Notes
+        -----
+        rows that all have the same columns are inserted with executemany,
+        using INSERT .. RETURNING if the database supports it.
+        Otherwise rows are inserted one at a time.
+
+        Examples
+        --------
+        >>> db.add_rows('spectrum_suite', [{'suite_id': 2, 'spectrum_id': i}
+        ...                                for i in (3, 4, 5)])
+        """
+        tab = self.tables.get(tablename, None)
+        if tab is None:
+            self.table_error(f"no table found", tablename, 'add_rows')
+        rows = list(rows)
+        if len(rows) == 0:
+            return [] if return_ids else None
+
+        pkeys = list(tab.primary_key.columns)
+        same_columns = len(set(tuple(sorted(r.keys())) for r in rows)) == 1
+        dialect = self.engine.dialect
+        out = None
+        with self.transaction():
+            if same_columns and not return_ids:
+                self.execute(tab.insert(), rows, set_modify_date=True)
+            elif (same_columns and len(pkeys) == 1 and not pkeys[0].nullable and
+                  getattr(dialect, 'insert_executemany_returning_sort_by_parameter_order',
+                          False)):
+                query = tab.insert().returning(pkeys[0],
+                                               sort_by_parameter_order=True)
+                result = self.execute(query, rows, set_modify_date=True)
+                out = [r[0] for r in result.fetchall()]
+            else:
+                out = [self.add_row(tablename, **row) for row in rows]
+        self.table_modified(tablename)
+        return out if return_ids else None
+
+    def table_modified(self, tablename):
+        """called whenever rows of a table are added, updated or deleted.
+        Does nothing here, but may be overridden by subclasses that
+        cache table contents"""
+        pass
 
     def table_error(self, message, tablename, funcname):
         raise ValueError(f"{message} for table '{tablename}' in {funcname}()")
@@ -215,7 +343,10 @@ class SimpleDB(object):
             self.table_error(f"no table found", tablename, funcname)
 
         filters = []
-        if where is None or isinstance(where, bool) and where:
+        if isinstance(where, ClauseElement):
+            filters.append(where)
+            where = {}
+        elif where is None or isinstance(where, bool) and where:
             where = {}
             if len(kws) == 0:
                 filters.append(True)
@@ -223,7 +354,6 @@ class SimpleDB(object):
         if isinstance(where, int):
             if 'id' in tab.c:
                 filters.append(tab.c.id==where)
-                print(" .(id).  ", where)
             else:
                 for colname, coldat in tab.columns.items():
                     if coldat.primary_key and isinstance(coldat.type, INTEGER):
@@ -243,41 +373,115 @@ class SimpleDB(object):
 
         return and_(*filters)
 
+    def handle_columns(self, tablename, columns=None, exclude=None,
+                       funcname=None):
+        """return list of columns for a select, from a list of column
+        names to include and/or a list of column names to exclude"""
+        if funcname is None:
+            funcname = 'handle_columns'
+        tab = self.tables.get(tablename, None)
+        if tab is None:
+            self.table_error(f"no table found", tablename, funcname)
+        if columns is None:
+            columns = tab.columns.keys()
+        if exclude is None:
+            exclude = ()
+        cols = []
+        for colname in columns:
+            if colname in exclude:
+                continue
+            col = tab.c.get(colname, None)
+            if col is None:
+                self.table_error(f"no column '{colname}'", tablename, funcname)
+            cols.append(col)
+        return cols
+
     def get_rows(self, tablename, where=None, order_by=None, limit_one=False,
-                none_if_empty=False, **kws):
+                 none_if_empty=False, columns=None, exclude=None, limit=None,
+                 offset=None, after=None, after_id=None, reverse=False, **kws):
         """general-purpose select of row data:
 
         Arguments
         ----------
         tablename    name of table
-        where        dict of key/value pairs for where clause [None]
+        where        dict of key/value pairs or SQL expression for where clause [None]
         order_by     name of column to order by [None]
         limit_one    whether to limit result to 1 row [False[
         none_if_empty whether to return None for an empty row [False]
+        columns      list of column names to select [None, all columns]
+        exclude      list of column names to leave out of select [None]
+        limit        maximum number of rows to return [None, all rows]
+        offset       number of rows to skip [None]
+        after        (value, id) of last row of the previous page, for
+                     keyset pagination ordered by (order_by, id) [None]
+        after_id     id of the last row of the previous page, for keyset
+                     pagination ordered by id [None]
+        reverse      whether to use descending order [False]
         kwargs        other keyword/value pairs are included in the `where` dictionary
         Returns
         -------
         rows matching `where` (all if `where=None`) optionally ordered by order_by
 
+        Notes
+        -----
+        with `after` or `after_id`, rows are also ordered by id, and NULL
+        values of `order_by` come first (or last if reverse=True).
+
         Examples
         --------
         >>> db.get_rows('element', where{'z': 30})
+        >>> db.get_rows('spectrum', columns=('id', 'name'))
+        >>> page = db.get_rows('spectrum', order_by='name', limit=50)
+        >>> page = db.get_rows('spectrum', order_by='name', limit=50,
+        ...                    after=(page[-1].name, page[-1].id))
         """
         tab = self.tables.get(tablename, None)
         if tab is None:
             self.table_error(f"no table found", tablename, 'get_rows')
 
         where = self.handle_where(tablename, where=where, funcname='get_rows', **kws)
-        query = tab.select().where(where)
+        if columns is None and exclude is None:
+            query = tab.select().where(where)
+        else:
+            cols = self.handle_columns(tablename, columns=columns,
+                                       exclude=exclude, funcname='get_rows')
+            query = select(*cols).where(where)
 
+        key = None
         if order_by is not None:
             key = getattr(tab.c, order_by, None)
             if key is None:
                 key = getattr(tab.c, f"{order_by}_id", None)
             if key is None:
                 self.table_error(f"no column '{order_by}'", tablename, 'get_rows')
-            else:
-                query = query.order_by(key)
+
+        paging = (limit is not None or offset is not None or
+                  after is not None or after_id is not None)
+        pkeys = list(tab.primary_key.columns)
+        if paging and len(pkeys) == 1:
+            # pages are ordered by (key, id), so that they are stable
+            idcol = pkeys[0]
+            if key is None:
+                key = idcol
+            if after_id is not None:
+                if key is not idcol:
+                    self.table_error("use `after` when not ordering by id",
+                                     tablename, 'get_rows')
+                after = (after_id, after_id)
+            if after is not None:
+                query = query.where(keyset_clause(key, idcol, after[0], after[1],
+                                                  reverse=reverse))
+            query = query.order_by(*keyset_order(key, idcol, reverse=reverse))
+        elif after is not None or after_id is not None:
+            self.table_error("keyset pagination needs a single primary key",
+                             tablename, 'get_rows')
+        elif key is not None:
+            query = query.order_by(key.desc() if reverse else key)
+
+        if limit is not None:
+            query = query.limit(limit)
+        if offset is not None:
+            query = query.offset(offset)
 
         result = self.execute(query)
         if limit_one:
@@ -289,15 +493,17 @@ class SimpleDB(object):
             result = None
         return result
 
-    def lookup(self, tablename, **kws):
+    def lookup(self, tablename, columns=None, exclude=None, **kws):
         """
         simple select of table with any equality filter on columns by name
 
         a simple wrapper for
-           self.get_rows(tablename, limit_one=False, none_if_empty=False, **kws)
+           self.get_rows(tablename, limit_one=False, none_if_empty=False,
+                         columns=columns, exclude=exclude, **kws)
 
         """
-        return self.get_rows(tablename, limit_one=False, none_if_empty=False, **kws)
+        return self.get_rows(tablename, limit_one=False, none_if_empty=False,
+                             columns=columns, exclude=exclude, **kws)
 
     def update(self, tablename, where=None, **kws):
         """update a row (with where in a table
@@ -318,6 +524,7 @@ class SimpleDB(object):
 
         where = self.handle_where(tablename, where=where, funcname='update')
         self.execute(tab.update().where(where).values(**kws), set_modify_date=True)
+        self.table_modified(tablename)
 
 
     def delete_rows(self, tablename, where):
@@ -335,3 +542,4 @@ class SimpleDB(object):
 
         where = self.handle_where(tablename, where=where, funcname='delete')
         self.execute(tab.delete().where(where), set_modify_date=True)
+        self.table_modified(tablename)
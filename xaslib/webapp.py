@@ -17,7 +17,9 @@ from flask import (Flask, request, session, redirect, url_for,
                    send_from_directory)
 
 from .xaslib import (connect_xaslib, isotime2datetime, isotime, valid_score,
-                     unique_name)
+                     unique_name, decode_text, SpectrumArrays, energy_to_ev,
+                     SPECTRUM_HEAVY_COLUMNS)
+from .ingest import hash_data
 from .initialdata import edge_energies, elem_syms
 from larch.io import read_ascii
 from larch.xafs.pre_edge import preedge
@@ -31,7 +33,7 @@ from .webutils import (row2dict, multiline_text, parse_spectrum,
                        spectra_for_citation, save_zipfile,
                        spectra_for_beamline, get_rating,
                        get_fullpath, guess_metadata, pathjoin,
-                       secure_filename, mono_deg2ev, upload2xdi)
+                       secure_filename, upload2xdi)
 
 from .webplot import make_xafs_plot, xafs_plotly, plot_multiple_spectra
 
@@ -47,6 +49,34 @@ REFERENC_MODES = SAMPLES_DATA = None
 
 EMAIL_MSG = "From: {mailfrom:s}\r\nTo: {mailto:s}\r\nSubject: {subject:s}\r\n{message:s}\n"
 
+# number of spectra per page when browsing
+PAGE_SIZE = 100
+
+# sort keys for browsing spectra: these all have JSON-safe values
+# (strings or numbers), so that page cursors survive a round trip
+BROWSE_SORT_KEYS = ('element_z', 'name', 'edge', 'mode', 'beamline',
+                    'rating_summary')
+
+# number of similar spectra to show for a spectrum or upload
+SIMILAR_COUNT = 8
+
+# largest number of standards in linear combination fits from the web
+LCF_MAX_COMPONENTS = 4
+
+# largest number of principal components from the web
+PCA_MAX_COMPONENTS = 20
+
+# plot styles for spectra, and k-weight and R range for plotting EXAFS
+PLOT_STYLES = (('xanes', 'normalized XANES'), ('rawxafs', 'Raw XAFS'),
+               ('chik', 'EXAFS chi(k)'), ('chir', 'EXAFS |chi(R)|'))
+PLOT_KWEIGHT = 2
+PLOT_RMAX = 6.0
+
+# columns not read for showing a spectrum: pages use its stored header
+# and products, not the compressed file text or raw arrays
+SPECTRUM_VIEW_EXCLUDE = tuple(c for c in SPECTRUM_HEAVY_COLUMNS
+                              if c != 'fileheader')
+
 GEN_MONOS = {"None":"-1",
              "generic Si(111)":"3.1355893",
              "generic Si(220)":"1.9201484",
@@ -59,6 +89,20 @@ def make_permalink(selected, func='plots'):
     sel = '/'.join(['%d' % i for i in selected])
     return "%s/%s/%s" % (base_url, func, sel)
 
+def page_cursor(value):
+    """[sort_key, id] from the JSON text of a page link cursor, or None
+    for a missing or malformed cursor"""
+    if value is None:
+        return None
+    try:
+        sort_key, spid = json.loads(value)
+        spid = int(spid)
+    except (ValueError, TypeError):
+        return None
+    if sort_key is not None and not isinstance(sort_key, (str, int, float)):
+        return None
+    return [sort_key, spid]
+
 def session_init(session, force_refresh=False):
     global db, app, ANY_EDGES, ANY_MODES,  SAMPLES_OR_NEW
     global ANY_BEAMLINES, BEAMLINE_DATA, SAMPLES_DATA, REFERENCE_MODES
@@ -79,7 +123,7 @@ def session_init(session, force_refresh=False):
         SAMPLES_OR_NEW.extend( [(s.id, s.name) for s in db.lookup('sample')])
 
         INCLUDED_ELEMS = db.included_elements()
-        SPECTRA_COUNT = len(db.get_spectra())
+        SPECTRA_COUNT = db.count_spectra()
         ALL_ELEMS  = db.lookup('element')
         EN_UNITS = [e.units for e in db.lookup('energy_units')]
         REFERENCE_MODES = [r.notes for r in db.lookup('reference_mode')]
@@ -110,7 +154,7 @@ def session_init(session, force_refresh=False):
         SAMPLES_DATA = []
         for sdat in db.lookup('sample', order_by='name'):
             sid = sdat.id
-            nspectra = len(db.lookup('spectrum', sample_id=sid))
+            nspectra = len(db.lookup('spectrum', sample_id=sid, columns=('id',)))
             formula = sdat.formula
             if formula in (None, 'None'):
                 formula = 'unknown'
@@ -411,13 +455,64 @@ def elem(elem=None, order_by='element_z', reverse=0):
         elem = 'all'
     elif elem is None:
         elem = request.form.get('elem')
-    if elem is not None:
-        kws = {'order_by': order_by}
-        if elem.lower() != 'all':
-            kws['element'] = elem
 
-        dbspectra = db.get_spectra(**kws)
+    # filters may come from the form or from page links
+    edge_filter = request.values.get('edge_filter', ANY_EDGES[0])
+    mode_filter = request.values.get('mode_filter', ANY_MODES[0])
+    beamline_id = request.values.get('beamline', '0')
+    searchword  = request.values.get('searchphrase', '')
+    rating_min  = request.values.get('rating', '0')
+    page_args = {'edge_filter': edge_filter, 'mode_filter': mode_filter,
+                 'beamline': beamline_id, 'searchphrase': searchword,
+                 'rating': rating_min}
+
+    # pages are given by (sort_key, id) of the row after the previous
+    # page or before the next page
+    reverse = int(reverse)
+    if order_by not in BROWSE_SORT_KEYS:
+        order_by = BROWSE_SORT_KEYS[0]
+    after = page_cursor(request.args.get('after', None))
+    before = page_cursor(request.args.get('before', None))
+    has_prev = has_next = False
 
+    ntotal = nmatched = 0
+    if elem is not None:
+        filters = {}
+        if elem.lower() != 'all':
+            filters['element'] = elem
+        ntotal = db.count_spectra(**filters)
+        if edge_filter != ANY_EDGES[0]:
+            filters['edge'] = edge_filter
+        if mode_filter != ANY_MODES[0]:
+            filters['mode'] = mode_filter
+        if beamline_id != '0':
+            filters['beamline'] = int(beamline_id)
+        if rating_min != '0':
+            # ratings are shown to 1 decimal place
+            filters['rating_min'] = int(rating_min) - 0.05
+        if searchword != '':
+            filters['search'] = searchword
+        nmatched = db.count_spectra(**filters)
+
+        if before is not None:
+            # read backwards from the first spectrum of the next page
+            dbspectra = db.list_spectra_summary(filters=filters,
+                                                order_by=order_by,
+                                                limit=PAGE_SIZE+1,
+                                                after=before,
+                                                reverse=not reverse)
+            has_prev = len(dbspectra) > PAGE_SIZE
+            dbspectra = dbspectra[:PAGE_SIZE]
+            dbspectra.reverse()
+            has_next = True
+        else:
+            dbspectra = db.list_spectra_summary(filters=filters,
+                                                order_by=order_by,
+                                                limit=PAGE_SIZE+1,
+                                                after=after, reverse=reverse)
+            has_next = len(dbspectra) > PAGE_SIZE
+            dbspectra = dbspectra[:PAGE_SIZE]
+            has_prev = after is not None
 
     selected = []
     for key, val in request.form.items():
@@ -443,74 +538,43 @@ def elem(elem=None, order_by='element_z', reverse=0):
                                    person_id = person_id)
         flash(msg)
 
-    edge_filter = request.form.get('edge_filter', ANY_EDGES[0])
-    mode_filter = request.form.get('mode_filter', ANY_MODES[0])
-    beamline_id = request.form.get('beamline', '0')
-    searchword  = request.form.get('searchphrase', '')
-    rating_min  = request.form.get('rating', '0')
-
     spectra = []
     for s in dbspectra:
-        edge     = db.get_edge(s.edge_id).name
-        elem_sym = db.get_element(s.element_z).symbol
-        person   = db.get_person(s.person_id)
-        mode     = ANY_MODES[s.mode_id]
+        edge     = s['edge']
+        elem_sym = s['elem_sym']
         rating   = get_rating(s, short=True)
-        bl_id, bl_desc = db.get_spectrum_beamline(s.id)
-
-        # filter edge, beamline, and modes:
-        if ((edge_filter not in (edge, ANY_EDGES[0])) or
-            (beamline_id != '0' and int(bl_id) != int(beamline_id)) or
-            (mode_filter not in (mode, ANY_MODES[0]))):
-            continue
-
-        # filter rating
-        if rating_min != '0':
-            try:
-                rval = float(rating)
-            except:
-                rval = 6.0
-            if (rval-0.01) < int(rating_min):
-                continue
+        bl_id    = '%d' % (s['beamline_id'] or -1)
+        bl_desc  = s['beamline_name'] or 'unknown'
 
-        # filter word
-        if searchword != '':
-            fulldat =  parse_spectrum(s, db)
-            misc = fulldat.get('misc', {})
-            misc = '\n'.join(['%s:%s' % (m['key'], m['val']) for m in misc])
-            if not any((searchword in fulldat.get('spectrum_name', ''),
-                        searchword in fulldat.get('xdi_filename',''),
-                        searchword in fulldat.get('description', ''),
-                        searchword in fulldat.get('sample_name',''),
-                        searchword in fulldat.get('raw_comments', ''),
-                        searchword in fulldat.get('beamline_desc',''),
-                        searchword in fulldat.get('person_name', ''),
-                        searchword in fulldat.get('person_email',''),
-                        searchword in misc)):
-                continue
-        spectra.append({'id': s.id,
-                        'name': s.name,
-                        'description': s.description,
+        spectra.append({'id': s['id'],
+                        'name': s['name'],
+                        'description': s['description'],
                         'element': elem,
                         'edge': edge,
-                        'person_email': person.email,
-                        'person_name': person.name,
+                        'person_email': s['person_email'],
+                        'person_name': s['person_name'],
                         'elem_sym': elem_sym,
                         'rating': rating,
                         'beamline_desc': bl_desc,
                         'beamline_id': bl_id })
 
-    reverse = int(reverse)
-    if reverse:
-        spectra.reverse()
-        reverse = 0
-    else:
-        reverse = 1
+    prev_url = next_url = None
+    if has_prev:
+        first = dbspectra[0]
+        prev_url = url_for('elem', elem=elem, order_by=order_by,
+                           reverse=reverse, **page_args,
+                           before=json.dumps([first['sort_key'], first['id']]))
+    if has_next:
+        last = dbspectra[-1]
+        next_url = url_for('elem', elem=elem, order_by=order_by,
+                           reverse=reverse, **page_args,
+                           after=json.dumps([last['sort_key'], last['id']]))
 
     return render_template('browse_elements.html',
-                           ntotal=len(dbspectra),
-                           nspectra=len(spectra),
-                           reverse=reverse,
+                           ntotal=ntotal,
+                           nspectra=nmatched,
+                           reverse=0 if reverse else 1,
+                           prev_url=prev_url, next_url=next_url,
                            elem=elem, spectra=spectra,
                            edge_filter=edge_filter, edges=ANY_EDGES,
                            mode_filter=mode_filter, modes=ANY_MODES,
@@ -548,7 +612,7 @@ def index():
 @app.route('/spectrum/<int:spid>/<plotstyle>')
 def spectrum(spid=None, plotstyle='xanes'):
     session_init(session)
-    s  = db.get_spectrum(spid)
+    s  = db.get_spectrum(spid, exclude=SPECTRUM_VIEW_EXCLUDE)
     if s is None:
         return sendback(error='no spectrum #%d found' % spid)
 
@@ -557,64 +621,54 @@ def spectrum(spid=None, plotstyle='xanes'):
     opts['person_id'] = s.person_id
     opts['rating'] = get_rating(s)
 
-    eunits = opts['energy_units']
-    if eunits.startswith('keV'):
-        energy = energy /1000.0
-    elif eunits.startswith('deg'):
-        print('Need to convert angle to energy')
-
     try:
         e0 = edge_energies[int(s.element_z)][str(opts['edge'])]
         opts['e0'] = '%f' % e0
     except:
         pass
 
-    plot_mode = mode = db.get_spectrum_mode(spid)
 
-    # now get real data for plotting
-    energy, mudata, murefer = None, None, None
-    try:
-        if plot_mode.startswith('trans'):
-            energy = np.array(json.loads(s.energy))
-            i0     = np.array(json.loads(s.i0))
-            itrans = np.array(json.loads(s.itrans))
-            mudata = -np.log(itrans/i0)
-        else:
-            energy = np.array(json.loads(s.energy))
-            i0     = np.array(json.loads(s.i0))
-            ifluor = np.array(json.loads(s.ifluor))
-            mudata = ifluor/i0
-    except:
+    # normalized data, stored with the spectrum
+    dgroup = db.get_preedge(spid)
+    if dgroup is None:
         return render_template('spectrum.html', **opts)
-
-    dgroup = preedge(energy, mudata)
-    # get reference if possible
-    try:
-        irefer = np.array(json.loads(s.irefer))
-        refmode = opts.get('refmode', 'none')
-        if refmode.startswith('none'):
-            murefer = None
-        elif refmode.startswith('mu'):
-            murefer = irefer
-        elif refmode.startswith('trans'):
-            murefer = -np.log(irefer/itrans)
-        elif refmode.startswith('fluor') and 'itrans' in rmode:
-            murefer = irefer/itrans
-        else:
-            murefer = irefer/i0
-    except:
-        murefer = None
-
-    if plotstyle.lower() == 'rawxafs':
+    energy = dgroup['energy']
+
+    refmode = opts.get('refmode', 'none')
+    plotstyle = plotstyle.lower()
+    labels = dict(PLOT_STYLES)
+    if plotstyle not in labels:
+        plotstyle = 'xanes'
+
+    # chi(k) and chi(R) are computed on first view, and stored
+    exafs = None
+    if plotstyle in ('chik', 'chir'):
+        exafs = db.get_chi(spid)
+        if exafs is None:
+            plotstyle = 'xanes'
+            labels.pop('chik')
+            labels.pop('chir')
+
+    if plotstyle == 'rawxafs':
+        arrays = db.get_spectrum_arrays(spid)
+        try:
+            energy, mudata = arrays.energy, arrays.mu()
+            murefer = arrays.mu_refer()
+        except:
+            return render_template('spectrum.html', **opts)
         opts['xasplot'] =  xafs_plotly(energy, mudata, s.name, ylabel='Raw XAFS')
-        opts['plotstyle'] = 'xanes'
-        opts['plotstyle_label'] = 'normalized XANES'
         if murefer is not None:
-            opts['plotstyle_label'] = 'normalized XANES, with reference spectra'
+            labels['xanes'] = 'normalized XANES, with reference spectra'
+    elif plotstyle == 'chik':
+        kchi = exafs['chi']*exafs['k']**PLOT_KWEIGHT
+        opts['xasplot'] = xafs_plotly(exafs['k'], kchi, s.name,
+                                      xlabel='k (1/\u00c5)',
+                                      ylabel='k^%d chi(k)' % PLOT_KWEIGHT)
+    elif plotstyle == 'chir':
+        opts['xasplot'] = xafs_plotly(exafs['r'], exafs['chir_mag'], s.name,
+                                      xlabel='R (\u00c5)', ylabel='|chi(R)|',
+                                      x_range=[0, PLOT_RMAX])
     else:
-        opts['plotstyle'] = 'rawxafs'
-        opts['plotstyle_label'] = 'Raw XAFS'
-
         emin = max(e0-50, min(energy))
         emax = min(e0+175, max(energy))
 
@@ -626,14 +680,19 @@ def spectrum(spid=None, plotstyle='xanes'):
         ymin -= (ymax-ymin)*0.05
 
         ref_mu = None
-        if murefer is not None:
-            rgroup = preedge(energy, murefer)
-            ref_mu = rgroup['norm']
+        if not refmode.startswith('none'):
+            rgroup = db.get_preedge(spid, refer=True)
+            if rgroup is not None:
+                ref_mu = rgroup['norm']
         opts['xasplot'] = xafs_plotly(energy, dgroup['norm'], s.name,
                                       ylabel='Normalized XANES',
                                       refer=ref_mu, x_range=[emin, emax],
                                       y_range=[ymin, ymax])
 
+    opts['plotstyle'] = plotstyle
+    opts['plotstyles'] = [(name, label) for name, label in labels.items()
+                          if name != plotstyle]
+
     suites = []
     for r in db.lookup('spectrum_suite', spectrum_id=s.id):
         st = db.lookup('suite', id=r.suite_id)[0]
@@ -641,12 +700,64 @@ def spectrum(spid=None, plotstyle='xanes'):
     opts['nsuites'] = len(suites)
     opts['suites'] = suites
     opts['owned_suites'] = get_person_suites(db, session['person_id'])
+    try:
+        opts['similar'] = db.find_similar(spid, k=SIMILAR_COUNT)
+    except ValueError:
+        opts['similar'] = []
     return render_template('spectrum.html', **opts)
 
+@app.route('/lcf/<int:spid>')
+def lcf_fits(spid=None):
+    """linear combination fits of a spectrum to other spectra, as JSON.
+    Optional arguments: candidates (comma-separated spectrum ids),
+    max_components, nbest, and sum_to_one"""
+    session_init(session)
+    try:
+        max_components = min(LCF_MAX_COMPONENTS,
+                             int(request.args.get('max_components', 3)))
+        nbest = int(request.args.get('nbest', 10))
+        candidates = request.args.get('candidates', None)
+        if candidates is not None:
+            candidates = [int(i) for i in candidates.split(',') if len(i.strip()) > 0]
+    except ValueError:
+        return Response(json.dumps({'error': 'invalid arguments'}),
+                        status=400, mimetype='application/json')
+    sum_to_one = request.args.get('sum_to_one', '0').lower() in ('1', 'true', 'yes')
+
+    try:
+        fits = db.lcf(spid, candidates=candidates, max_components=max_components,
+                      sum_to_one=sum_to_one, nbest=nbest)
+    except ValueError as exc:
+        return Response(json.dumps({'error': str(exc)}),
+                        status=404, mimetype='application/json')
+    return Response(json.dumps({'spectrum_id': spid, 'fits': fits}),
+                    mimetype='application/json')
+
+@app.route('/pca/<elem>')
+@app.route('/pca/<elem>/<edge>')
+def pca_components(elem=None, edge='K'):
+    """principal components of normalized XANES for all spectra of an
+    element and edge, as JSON.  Optional argument: ncomps"""
+    session_init(session)
+    try:
+        ncomps = min(PCA_MAX_COMPONENTS, int(request.args.get('ncomps', 5)))
+        out = db.pca(elem, edge=edge, ncomps=ncomps)
+    except ValueError as exc:
+        return Response(json.dumps({'error': str(exc)}),
+                        status=404, mimetype='application/json')
+
+    result = {'element': elem, 'edge': edge, 'ids': out['ids'],
+              'nspectra': len(out['ids'])}
+    for key in ('grid', 'mean', 'components', 'explained_variance',
+                'explained_variance_ratio', 'scores'):
+        val = out[key]
+        result[key] = None if val is None else val.tolist()
+    return Response(json.dumps(result), mimetype='application/json')
+
 @app.route('/showspectrum_rating/<int:spid>')
 def showspectrum_rating(spid=None):
     session_init(session)
-    s  = db.get_spectrum(spid)
+    s  = db.get_spectrum(spid, exclude=SPECTRUM_VIEW_EXCLUDE)
     if s is None:
         return sendback('spectrum', error='Could not find Spectrum #%d' % spid)
 
@@ -706,7 +817,7 @@ def edit_spectrum(spid=None):
     if session['username'] is None:
         needslogin(error='to edit spectrum')
 
-    s  = db.get_spectrum(spid)
+    s  = db.get_spectrum(spid, exclude=SPECTRUM_VIEW_EXCLUDE)
     if s is None:
         return redirect(url_for('/', error='Could not find Spectrum #%d' % spid))
 
@@ -729,7 +840,7 @@ def delete_spectrum(spid, ask=1):
     if session['username'] is None:
         return needslogin(error='to delete a spectrum')
 
-    spect_name = db.lookup('spectrum', id=spid)[0].name
+    spect_name = db.lookup('spectrum', id=spid, columns=('name',))[0].name
     if ask != 0:
         return render_template('confirm_delete_spectrum.html',
                                spectrum_id=spid,
@@ -786,7 +897,7 @@ def rate_spectrum(spid=None):
         return redirect(url_for('spectrum', spid=spid, error=error))
 
     pid = int(session['person_id'])
-    s  = db.get_spectrum(spid)
+    s  = db.get_spectrum(spid, exclude=SPECTRUM_VIEW_EXCLUDE)
     if s is None:
         return sendback(error='Could not find Spectrum #%d' % spid)
 
@@ -927,7 +1038,7 @@ def submit_spectrum_to_suite():
         for r in db.lookup('spectrum_suite', suite_id=stid):
             found = found or (r.spectrum_id == spid)
         if not found:
-            db.addrow('spectrum_suite', suite_id=stid, spectrum_id=spid)
+            db.add_row('spectrum_suite', suite_id=stid, spectrum_id=spid)
             time.sleep(0.1)
         else:
             stname = db.lookup('suite', id=stid)[0].name
@@ -940,12 +1051,12 @@ def submit_spectrum_to_suite():
 @app.route('/rawfile/<int:spid>/<fname>')
 def rawfile(spid, fname):
     session_init(session)
-    s  = db.get_spectrum(spid)
+    s  = db.get_spectrum(spid, columns=('id', 'filetext'))
     if s is None:
         error = 'Could not find Spectrum #%d' % spid
         return redirect(url_for('spectrum', spid=spid, error=error))
 
-    return Response(s.filetext, mimetype='text/plain')
+    return Response(decode_text(s.filetext), mimetype='text/plain')
 
 
 @app.route('/about')
@@ -966,7 +1077,8 @@ def show_person(pid=-1):
     session_init(session)
     person = db.get_person(pid)
     suites = db.lookup('suite', person_id=pid)
-    spectra = db.lookup('spectrum', person_id=pid)
+    spectra = db.lookup('spectrum', person_id=pid,
+                        exclude=SPECTRUM_HEAVY_COLUMNS)
     # print(len(suites), len(spectra), pid)
     return render_template('person.html', person=person, suites=suites,
                            spectra=spectra)
@@ -1151,15 +1263,15 @@ def submit_suite_edits():
 
     if request.method == 'POST':
         stid  = int(request.form['suite'])
-        db.update('suite', stid,
-                  name=request.form['name'],
-                  notes=request.form['comments'])
+        with db.transaction():
+            db.update('suite', stid,
+                      name=request.form['name'],
+                      notes=request.form['comments'])
 
-        for spec in spectra_for_suite(db, stid):
-            spid = int(spec['spectrum_id'])
-            if ('remove_%d' % spid) in request.form:
-                db.remove_spectrum_from_suite(stid, spid)
-        time.sleep(0.1)
+            for spec in spectra_for_suite(db, stid):
+                spid = int(spec['spectrum_id'])
+                if ('remove_%d' % spid) in request.form:
+                    db.remove_spectrum_from_suite(stid, spid)
 
     return redirect(url_for('suites', stid=stid, error=error))
 
@@ -1173,7 +1285,8 @@ def sample(sid=None):
 
     opts = row2dict(sdat)
     has_image = opts.get('image_data', None) is not None
-    opts['spectra'] = db.lookup('spectrum', sample_id=sid)
+    opts['spectra'] = db.lookup('spectrum', sample_id=sid,
+                                exclude=SPECTRUM_HEAVY_COLUMNS)
     return render_template('sample.html', sid=sid, has_image=has_image, **opts)
 
 
@@ -1222,7 +1335,8 @@ def select_spectrum_sample(spid=None, sid=None):
         error='must be logged in to edit sample'
         return redirect(url_for('spectrum', spid=spid, error=error))
 
-    opts = {'spectra': db.lookup('spectrum', sample_id=sid)}
+    opts = {'spectra': db.lookup('spectrum', sample_id=sid,
+                                 exclude=SPECTRUM_HEAVY_COLUMNS)}
     sdat = db.lookup('sample', id=sid, none_if_empty=True)
     if sdat is not None:
         opts = row2dict(sdat)
@@ -1246,7 +1360,8 @@ def edit_sample(sid=None):
     opts = row2dict(sdat)
     opts['has_image'] = opts.get('image_data', None) is not None
 
-    opts['spectra'] = db.lookup('spectrum', sample_id=sid)
+    opts['spectra'] = db.lookup('spectrum', sample_id=sid,
+                                exclude=SPECTRUM_HEAVY_COLUMNS)
     return render_template('edit_sample.html', sid=sid, **opts)
 
 @app.route('/submit_sample_edits', methods=['GET', 'POST'])
@@ -1657,60 +1772,35 @@ def verify_uploaded_data(form, with_arrays=False):
 
     mode = form['mode'].lower()
     energy = getattr(dgroup, form['en_arrayname'])
-    if opts['energy_units'].lower().startswith('kev'):
-        energy = 1000.0 * energy
-    elif opts['energy_units'].lower().startswith('deg') and float(opts['d_spacing']) > 0.0:
-        energy = mono_deg2ev(energy, float(opts['d_spacing']))
+    energy_ev = energy_to_ev(energy, opts['energy_units'], float(opts['d_spacing']))
+    if energy_ev is not None:
+        energy = energy_ev
 
 
-    i0 = getattr(dgroup, form['i0_arrayname'], None)
-    itrans = getattr(dgroup, form['it_arrayname'], None)
-    ifluor = irefer = mu = murefer = None
-
+    mumode = mode
+    arrays = {'energy': energy,
+              'i0': getattr(dgroup, form['i0_arrayname'], None),
+              'itrans': getattr(dgroup, form['it_arrayname'], None)}
     if mode.startswith('trans'):
-        itrans = getattr(dgroup, form['it_arrayname'], None)
         if 'is_mutrans' in form:
-            mu = itrans
-        elif itrans is not None and i0 is not None:
-            mu = -np.log(itrans/i0)
+            mumode = 'mutrans'
     elif 'if_arrayname' in form:
-        ifluor = getattr(dgroup, form['if_arrayname'], None)
+        arrays['ifluor'] = getattr(dgroup, form['if_arrayname'], None)
         if 'is_mufluor' in form:
-            mu = ifluor
-        elif ifluor is not None and i0 is not None:
-            mu = ifluor/i0
-    else:
-        print("Could not get mu array")
+            mumode = 'mufluor'
 
     ir_arrayname = form.get('ir_arrayname', None)
     refmode = form.get('ref_mode', 'none').lower()
     if ir_arrayname is not None and refmode != 'none':
-        irefer = getattr(dgroup, ir_arrayname, None)
-        if irefer is None:
-            murefer = None
-        elif refmode.startswith('mu'):
-            murefer = irefer
-        elif refmode.startswith('trans'):
-            murefer = -np.log(irefer/itrans)
-        elif refmode.startswith('fluor') and 'itrans' in refmode:
-            murefer = irefer/itrans
-        elif refmode.startswith('fluor') and 'i0' in refmode:
-            murefer = irefer/i0
-
-    # ensure data is ordered by increasing energy:
-    en_order = np.argsort(energy)
-    if abs(np.diff(en_order) - 1).sum() > 0: # there is some out-of-order data
-        energy = energy[en_order]
-        mu = mu[en_order]
-        i0 = i0[en_order]
-        if itrans is not None:
-            itrans = itrans[en_order]
-        if ifluor is not None:
-            ifluor = ifluor[en_order]
-        if irefer is not None:
-            irefer = irefer[en_order]
-        if murefer is not None:
-            murefer = murefer[en_order]
+        arrays['irefer'] = getattr(dgroup, ir_arrayname, None)
+
+    # arrays are put in order of increasing energy
+    arrays = SpectrumArrays(mode=mumode, refmode=refmode, **arrays)
+    energy, mu, murefer = arrays.energy, arrays.mu(), arrays.mu_refer()
+    i0, itrans = arrays.i0, arrays.itrans
+    ifluor, irefer = arrays.ifluor, arrays.irefer
+    if mu is None:
+        print("Could not get mu array")
 
     try:
         opts['muplot'] =  xafs_plotly(energy, mu, fname, ylabel=mode, refer=murefer)
@@ -1756,6 +1846,18 @@ def verify_uploaded_data(form, with_arrays=False):
     if min(np.diff(energy)) < 0.001:
         opts['verify_messages'].append('Warning: Energy array has some very small steps')
 
+    opts['duplicate'] = db.find_duplicate(data_fingerprint=hash_data(energy, mu))
+    if opts['duplicate'] is not None:
+        opts['verify_messages'].append("Warning: this data is already in the library as '%s'"
+                                       % opts['duplicate']['name'])
+
+    try:
+        opts['similar'] = db.find_similar((energy, mu), k=SIMILAR_COUNT,
+                                          element=opts['elem_sym'],
+                                          edge=opts['edge'])
+    except (TypeError, ValueError):
+        opts['similar'] = []
+
     opts['sample'] = int(opts['sample'])
     if opts['sample'] > 0:
         s = db.lookup('sample', id=opts['sample'], none_if_empty=True)
@@ -1828,6 +1930,9 @@ def submit_upload():
 
         return render_template('verify_uploadspectrum.html', **opts)
 
+    elif request.form.get('submit', '').lower().startswith('use existing'):
+        return redirect(url_for('spectrum', spid=int(request.form['duplicate_id'])))
+
     else:
         spid = 1
         opts = verify_uploaded_data(request.form, with_arrays=True)
@@ -1835,8 +1940,7 @@ def submit_upload():
         time.sleep(0.25)
         spid = db.add_xdifile(filename, person=pemail,
                               spectrum_name=opts['filename'],
-                              description=opts['description'],
-                              create_sample=True)
+                              description=opts['description'])
         time.sleep(0.25)
         session_init(session, force_refresh=True)
 
@@ -18,8 +18,6 @@ rcParams['xtick.labelsize'] =  rcParams['ytick.labelsize'] = 18
 import json
 import plotly
 
-from larch.xafs.pre_edge import preedge
-
 PLOTLY_CONFIG = {'displaylogo': False,
                  'modeBarButtonsToRemove': [ 'hoverClosestCartesian',
                                              'hoverCompareCartesian',
@@ -27,7 +25,7 @@ PLOTLY_CONFIG = {'displaylogo': False,
 
 
 def xafs_plotly(x, y, title, ylabel='mutrans', refer=None,
-                x_range=None, y_range=None):
+                x_range=None, y_range=None, xlabel='Energy (eV)'):
 
     data = [{'x': x.tolist(),
              'y': y.tolist(),
@@ -47,7 +45,7 @@ def xafs_plotly(x, y, title, ylabel='mutrans', refer=None,
               'height': 350,
               'width': 500,
               'showlegend': len(data) > 1,
-              'xaxis': {'title': {'text': 'Energy (eV)'},
+              'xaxis': {'title': {'text': xlabel},
                         'tickformat': '.0f'},
               'yaxis': {'title': {'text': ylabel},
                         'zeroline': False,
@@ -63,45 +61,34 @@ def xafs_plotly(x, y, title, ylabel='mutrans', refer=None,
 
 
 def plot_multiple_spectra(db, spectra_list, title=None, max_spectra=20):
+    # normalized data, stored or computed with larch's preedge()
+    groups = db.get_preedges(spectra_list)
+    spectra_list = [int(spid) for spid in spectra_list
+                    if int(spid) in groups][:max_spectra]
+    if len(spectra_list) < 1:
+        return
+
+    spec = db.tables['spectrum']
+    names = {}
+    for row in db.get_rows('spectrum', where=spec.c.id.in_(spectra_list),
+                           columns=('id', 'name')):
+        names[row.id] = row.name
+
     data = []
     xmin, xmax, ymin, ymax = [], [], [], []
     for spid in spectra_list:
-        # now get real data for plotting
-        energy, mudata, dgroup = None, None, None
-        try:
-            s  = db.get_spectrum(spid)
-            mode = db.get_spectrum_mode(spid)
-            if mode.startswith('trans'):
-                energy = np.array(json.loads(s.energy))
-                i0     = np.array(json.loads(s.i0))
-                itrans = np.array(json.loads(s.itrans))
-                mudata = -np.log(itrans/i0)
-            else:
-                energy = np.array(json.loads(s.energy))
-                i0     = np.array(json.loads(s.i0))
-                ifluor = np.array(json.loads(s.ifluor))
-                mudata = ifluor/i0
-        except:
-            pass
-        if energy is not None and mudata is not None:
-            dgroup = preedge(energy, mudata)
-        if dgroup is not None:
-            data.append({'x': energy.tolist(),
-                         'y': dgroup['norm'].tolist(),
-                         'type': 'scatter',
-                         'name': s.name,
-                         'line': {'width': 3},
-                         'hoverinfo': 'skip'})
-            xmin.append(energy.min())
-            xmax.append(energy.max())
-            ymin.append(dgroup['norm'].min())
-            ymax.append(dgroup['norm'].max())
-            if len(data) >= max_spectra:
-                break
-
-
-    if len(data) < 0:
-        return
+        energy = groups[spid]['energy']
+        norm = groups[spid]['norm']
+        data.append({'x': energy.tolist(),
+                     'y': norm.tolist(),
+                     'type': 'scatter',
+                     'name': names.get(spid, '#%d' % spid),
+                     'line': {'width': 3},
+                     'hoverinfo': 'skip'})
+        xmin.append(energy.min())
+        xmax.append(energy.max())
+        ymin.append(np.nanmin(norm))
+        ymax.append(np.nanmax(norm))
 
     xmin = np.array(xmin).min()
     xmax = np.array(xmax).max()
@@ -10,9 +10,6 @@ from random import randrange
 from string import printable
 from sqlalchemy import text
 
-import numpy as np
-import scipy.constants as consts
-
 try:
     from werkzeug.utils import secure_filename
 except ImportError:
@@ -22,11 +19,7 @@ from xraydb import guess_edge
 
 from lmfit.printfuncs import gformat
 
-from .xaslib import isotime, guess_datetime
-
-PLANCK_HC = 1.e10 * consts.Planck * consts.c / consts.e
-def mono_deg2ev(angle, d_spacing):
-    return PLANCK_HC / (2*d_spacing*np.sin(angle*np.pi/180))
+from .xaslib import isotime, guess_datetime, decode_text
 
 def pathjoin(*args):
     return path.join(*args)
@@ -86,8 +79,8 @@ def save_zipfile(db, slist, folder='.'):
     tfile = path.abspath(path.join(folder, fname))
     zfile = ZipFile(tfile, mode='w')
     for spid in slist:
-        spect =  db.lookup('spectrum', id=spid)[0]
-        zfile.writestr("%s.xdi" % spect.name, spect.filetext)
+        spect =  db.lookup('spectrum', id=spid, columns=('name', 'filetext'))[0]
+        zfile.writestr("%s.xdi" % spect.name, decode_text(spect.filetext))
     zfile.close()
     return fname
 
@@ -104,7 +97,10 @@ def session_init(session, db):
         session['person_id'] = "-1"
 
 def get_rating(item, short=False):
-    rating = getattr(item, 'rating_summary', None)
+    if isinstance(item, dict):
+        rating = item.get('rating_summary', None)
+    else:
+        rating = getattr(item, 'rating_summary', None)
     if short and rating is not None:
         rating = rating.split()[0]
     if rating is None or len(rating) < 1:
@@ -201,11 +197,10 @@ def add_spectra_to_suite(db, spectrum_ids, suite_id=-1, person_id=-1):
     current_spectrum_ids = []
     for r in db.lookup('spectrum_suite', suite_id=suite_id):
         current_spectrum_ids.append(r.spectrum_id)
-    nadded = 0
-    for spid in spectrum_ids:
-        if spid not in current_spectrum_ids:
-            db.addrow('spectrum_suite', suite_id=suite_id, spectrum_id=spid)
-            nadded += 1
+    rows = [{'suite_id': suite_id, 'spectrum_id': spid}
+            for spid in spectrum_ids if spid not in current_spectrum_ids]
+    db.add_rows('spectrum_suite', rows, return_ids=False)
+    nadded = len(rows)
     return "added %d spectra to suite '%s'" % (nadded, suite.name)
 
 
@@ -249,9 +244,7 @@ def citation_for_spectrum(db, s, notes=None):
 
 def spectra_for_beamline(db, blid):
     spectra = []
-    for r in db.get_spectra():
-        if r.beamline_id !=int(blid):
-            continue
+    for r in db.get_spectra(beamline=int(blid)):
         elem = db.get_element(r.element_z)
         edge = db.get_edge(r.edge_id)
         spectra.append({'spectrum_id': r.id, 'name':    r.name,
@@ -287,12 +280,12 @@ def parse_spectrum(s, db):
     edge   = db.get_edge(s.edge_id)
     elem   = db.get_element(s.element_z)
     person = db.get_person(s.person_id)
-    mode   = db.get_spectrum_mode(s.id)
+    mode   = db.get_mode(s.mode_id).name
     try:
-        refmode = db.get_spectrum_refmode(s.id)
+        refmode = db.get_reference_mode(s.reference_mode_id).name
     except:
         refmode = 'none'
-    eunits = db.lookup('energy_units', id=s.energy_units_id)[0].units
+    eunits = db.get_energy_units(s.energy_units_id).units
     d_spacing = '%f'% s.d_spacing
     notes =  json.loads(s.notes)
 
@@ -339,10 +332,13 @@ def parse_spectrum(s, db):
     if eresolution is None:
         eresolution = 'nominal'
 
-    header = []
-    for tline in s.filetext.split('\n'):
-        if tline.startswith('#'):
-            header.append(tline)
+    # the header is stored apart from the (compressed) file text
+    header = getattr(s, 'fileheader', None)
+    if header is None:
+        header = db.get_fileheader(s.id)
+    if header is None:
+        header = ''
+    header = header.split('\n') if len(header) > 0 else []
 
     return {'spectrum_id': s.id,
             'spectrum_name': s.name,
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+  EXAFS background subtraction and Fourier transforms:
+  chi(k) from normalized mu(E), and chi(R) from chi(k)
+"""
+
+import numpy as np
+from scipy.interpolate import BSpline
+
+# hbar**2/(2*m_e), in eV*Angstrom**2:  E - E0 = KTOE * k**2
+KTOE = 3.8099819442818976
+ETOK = 1.0/KTOE
+
+def etok(energy):
+    "convert photoelectron energy above e0 (eV) to k (1/Angstrom)"
+    return np.sqrt(np.maximum(energy, 0)*ETOK)
+
+def ktoe(k):
+    "convert k (1/Angstrom) to photoelectron energy above e0 (eV)"
+    return k*k*KTOE
+
+def ftwindow(x, xmin, xmax, dx=1.0):
+    """Hanning window for Fourier transforms: 1 between xmin+dx/2 and
+    xmax-dx/2, going smoothly to 0 at xmin-dx/2 and xmax+dx/2"""
+    x = np.asarray(x, dtype=np.float64)
+    dx = max(dx, 1.e-9)
+    x1, x2, x3, x4 = xmin - dx/2, xmin + dx/2, xmax - dx/2, xmax + dx/2
+    win = ((x >= x2) & (x <= x3)).astype(np.float64)
+    rise = (x > x1) & (x < x2)
+    win[rise] = np.sin(np.pi/2*(x[rise] - x1)/(x2 - x1))**2
+    fall = (x > x3) & (x < x4)
+    win[fall] = np.cos(np.pi/2*(x[fall] - x3)/(x4 - x3))**2
+    return win
+
+def xftf(k, chi, kmin=2.0, kmax=None, dk=1.0, kweight=2, rmax=10.0,
+         nfft=2048):
+    """forward Fourier transform of chi(k) to chi(R)
+
+    Arguments
+    ----------
+    k:        1-D array of k values, on a uniform grid starting at 0
+    chi:      1-D array of chi(k), or 2-D array with one chi(k) per row
+    kmin:     low end of the k range of the transform [2]
+    kmax:     high end of the k range [None, end of k]
+    dk:       width of the Hanning window sills [1]
+    kweight:  power of k to weight chi(k) by [2]
+    rmax:     largest R to return [10]
+    nfft:     number of points in the FFT [2048]
+
+    Returns
+    -------
+      r, chir: 1-D array of R (Angstrom) and complex array of chi(R),
+      one row per row of chi.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    chi = np.asarray(chi, dtype=np.float64)
+    kstep = k[1] - k[0]
+    if kmax is None:
+        kmax = k[-1]
+    weighted = chi * k**kweight * ftwindow(k, kmin, kmax, dk)
+    chir = np.fft.fft(weighted, n=nfft, axis=-1)[..., :nfft//2]
+    r = np.pi/(kstep*nfft) * np.arange(nfft//2)
+    keep = r <= rmax
+    return r[keep], chir[..., keep] * kstep/np.sqrt(np.pi)
+
+def autobk(energy, mu, e0, edge_step=1.0, rbkg=1.0, kmin=0.0, kmax=None,
+           kweight=2, kstep=0.05, dk=0.1, nclamp=5, clamp_lo=1.0,
+           clamp_hi=1.0, nfft=2048):
+    """EXAFS background subtraction, giving chi(k) from mu(E)
+
+    Arguments
+    ----------
+    energy:    1-D array of energies (eV), increasing
+    mu:        1-D array of mu(E), or normalized mu(E) with edge_step=1
+    e0:        edge energy (eV)
+    edge_step: edge step of mu [1]
+    rbkg:      largest R (Angstrom) of the background [1]
+    kmin:      low end of the k range of the background [0]
+    kmax:      high end of the k range [None, end of data]
+    kweight:   power of k to weight chi(k) by in the fit [2]
+    kstep:     step of the k grid of chi(k) [0.05]
+    dk:        width of the window sills for the fit [0.1]
+    nclamp:    number of points at each end of the k range to clamp [5]
+    clamp_lo:  weight of chi at low k in the fit [1]
+    clamp_hi:  weight of chi at high k in the fit [1]
+    nfft:      number of points in the FFT [2048]
+
+    Returns
+    -------
+      dict with arrays 'k', 'chi', and 'bkg' (the background on the
+      k grid), and 'kmin', 'kmax', 'nspl' (number of spline knots).
+
+    Notes
+    -----
+     The background is a cubic B-spline in k with knots spaced pi/rbkg
+     apart, as for AUTOBK (Newville et al, Phys Rev B 47, 14126 (1993)),
+     chosen to minimize chi(R) below rbkg and chi(k) at the ends of the
+     k range.  Since chi(R) is linear in the spline coefficients, this is
+     one linear least-squares fit.
+    """
+    energy = np.asarray(energy, dtype=np.float64)
+    mu = np.asarray(mu, dtype=np.float64)
+    kdata = etok(energy[-1] - e0)
+    if kmax is None or kmax > kdata:
+        kmax = kdata
+    nspl = 1 + int(2*rbkg*(kmax - kmin)/np.pi)
+    if nspl < 4 or energy[-1] <= e0:
+        raise ValueError('autobk: data range too short for EXAFS')
+
+    k = kstep*np.arange(int(kmax/kstep + 1.e-6) + 1)
+    muk = np.interp(e0 + ktoe(k), energy, mu)
+    knots = np.concatenate(([kmin]*3, np.linspace(kmin, kmax, nspl-2), [kmax]*3))
+    basis = BSpline(knots, np.eye(nspl), 3, extrapolate=True)(k)
+
+    fit = k >= kmin
+    weight = k**kweight * ftwindow(k, kmin, kmax, dk)
+    nlow = int(1.01 + rbkg*kstep*nfft/np.pi)
+    fmu = np.fft.fft(muk*weight, n=nfft)[:nlow]
+    fbasis = np.fft.fft(basis*weight[:, None], n=nfft, axis=0)[:nlow]
+
+    ifit = np.where(fit)[0]
+    clamped = np.concatenate((ifit[:nclamp], ifit[-nclamp:]))
+    cweight = np.concatenate(([clamp_lo]*nclamp, [clamp_hi]*nclamp))
+    cweight = cweight * k[clamped]**kweight
+
+    amat = np.vstack((fbasis.real, fbasis.imag, basis[clamped]*cweight[:, None]))
+    bvec = np.concatenate((fmu.real, fmu.imag, muk[clamped]*cweight))
+    coefs = np.linalg.lstsq(amat, bvec, rcond=None)[0]
+    bkg = basis @ coefs
+    return {'k': k, 'chi': (muk - bkg)/edge_step, 'bkg': bkg,
+            'kmin': kmin, 'kmax': kmax, 'nspl': nspl}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+  linear combination fitting of XAFS spectra to sets of standards,
+  for all combinations of standards at once
+"""
+
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+def combination_array(nbasis, ncomps):
+    "return 2-D array of all combinations of ncomps of nbasis indices"
+    return np.array(list(combinations(range(nbasis), ncomps)),
+                    dtype=int).reshape(-1, ncomps)
+
+def fit_combinations(gram, proj, yy, combos, sum_to_one=False, nbest=20):
+    """least-squares fits for many combinations of standards at once
+
+    Arguments
+    ----------
+    gram:       2-D array of dot products of standards, B @ B.T
+    proj:       1-D array of dot products of standards with target, B @ y
+    yy:         dot product of target with itself, y @ y
+    combos:     2-D array (nfits, ncomps) of indices of standards
+    sum_to_one: whether to constrain weights to sum to 1 [False]
+    nbest:      number of fits to return [20]
+
+    Returns
+    -------
+      combos, weights, rss for the best fits with all weights >= 0,
+      ordered by residual sum of squares.
+
+    Notes
+    -----
+     The fits are solved from the normal equations, stacked for all
+     combinations.  Fits with negative weights are dropped: a non-negative
+     fit using fewer standards is one of the smaller combinations.
+    """
+    nfits, ncomps = combos.shape
+    mat = gram[combos[:, :, None], combos[:, None, :]]
+    rhs = proj[combos]
+    if sum_to_one:
+        kkt = np.ones((nfits, ncomps+1, ncomps+1))
+        kkt[:, :ncomps, :ncomps] = mat
+        kkt[:, ncomps, ncomps] = 0.0
+        mat = kkt
+        rhs = np.concatenate((rhs, np.ones((nfits, 1))), axis=1)
+    try:
+        weights = np.linalg.solve(mat, rhs[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        weights = np.matmul(np.linalg.pinv(mat), rhs[..., None])[..., 0]
+    weights = weights[:, :ncomps]
+
+    sub = mat[:, :ncomps, :ncomps]
+    rss = (yy - 2*np.einsum('ij,ij->i', weights, rhs[:, :ncomps]) +
+           np.einsum('ij,ijk,ik->i', weights, sub, weights))
+    good = np.all(weights >= 0, axis=1) & np.isfinite(rss)
+    combos, weights, rss = combos[good], weights[good], rss[good]
+    if len(rss) > nbest:
+        best = np.argpartition(rss, nbest-1)[:nbest]
+        combos, weights, rss = combos[best], weights[best], rss[best]
+    order = np.argsort(rss)
+    return combos[order], weights[order], np.maximum(rss[order], 0)
+
+def lcf_combinations(target, basis, max_components=3, sum_to_one=False,
+                     nbest=20, workers=None, chunk_size=20000):
+    """linear combination fits of a target spectrum to all combinations
+    of up to max_components standards, with non-negative weights
+
+    Arguments
+    ----------
+    target:         1-D array of the spectrum to fit
+    basis:          2-D array (nstandards, npts) of standards, on the
+                    same grid as target
+    max_components: largest number of standards in a fit [3]
+    sum_to_one:     whether to constrain weights to sum to 1 [False]
+    nbest:          number of fits to return [20]
+    workers:        number of processes to use, or None to fit in this
+                    process [None]
+    chunk_size:     number of combinations to fit at a time [20000]
+
+    Returns
+    -------
+      list of dicts with 'components' (indices into basis), 'weights',
+      'rss' (residual sum of squares) and 'rfactor' (rss / sum(target**2)),
+      best fit first.
+    """
+    target = np.asarray(target, dtype=np.float64)
+    basis = np.asarray(basis, dtype=np.float64)
+    gram = basis @ basis.T
+    proj = basis @ target
+    yy = float(target @ target)
+
+    chunks = []
+    for ncomps in range(1, min(max_components, len(basis)) + 1):
+        combos = combination_array(len(basis), ncomps)
+        for i in range(0, len(combos), chunk_size):
+            chunks.append(combos[i:i+chunk_size])
+
+    args = [(gram, proj, yy, combos, sum_to_one, nbest) for combos in chunks]
+    if workers is not None and workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fits = list(pool.map(_fit_chunk, args))
+    else:
+        fits = [_fit_chunk(arg) for arg in args]
+
+    out = []
+    for combos, weights, rss in fits:
+        for comps, wts, res in zip(combos, weights, rss):
+            out.append({'components': comps.tolist(), 'weights': wts.tolist(),
+                        'rss': float(res),
+                        'rfactor': float(res/max(yy, 1.e-30))})
+    out.sort(key=lambda fit: fit['rss'])
+    return out[:nbest]
+
+def _fit_chunk(args):
+    "fit_combinations() for one chunk of combinations, for process pools"
+    return fit_combinations(*args)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+  principal component analysis of many XAFS spectra on a common grid,
+  built up from blocks of spectra so that all spectra are never needed
+  in memory at once
+"""
+
+import numpy as np
+
+class IncrementalPCA(object):
+    """principal component analysis, updated one block of rows at a time
+
+    >>> pca = IncrementalPCA(ncomps=5)
+    >>> for block in blocks:
+    ...     pca.partial_fit(block)
+    >>> scores = pca.transform(block)
+
+    Each update merges the current components, scaled by their singular
+    values, with the new rows and the shift of the mean, and takes the SVD
+    of that small matrix (as in Ross et al, Int J Comput Vis 77, 125 (2008)).
+    With ncomps less than the number of points, the result is approximate.
+    """
+    def __init__(self, ncomps=None):
+        self.ncomps = ncomps
+        self.nrows = 0
+        self.mean = None
+        self.components = None
+        self.singular_values = None
+        self.total_ss = 0.0
+
+    def partial_fit(self, block):
+        """update with a 2-D array of rows"""
+        block = np.atleast_2d(np.asarray(block, dtype=np.float64))
+        nnew = block.shape[0]
+        if nnew == 0:
+            return self
+        bmean = block.mean(axis=0)
+        centered = block - bmean
+        block_ss = (centered*centered).sum()
+        if self.nrows == 0:
+            ntotal = nnew
+            mean = bmean
+            self.total_ss = block_ss
+        else:
+            ntotal = self.nrows + nnew
+            shift = np.sqrt(self.nrows*nnew/ntotal)*(self.mean - bmean)
+            mean = (self.nrows*self.mean + nnew*bmean)/ntotal
+            self.total_ss += block_ss + (shift*shift).sum()
+            centered = np.vstack((self.singular_values[:, None]*self.components,
+                                  centered, shift))
+        u, svals, vt = np.linalg.svd(centered, full_matrices=False)
+        # fix signs so components do not flip between updates
+        signs = np.sign(vt[np.arange(len(vt)), np.argmax(abs(vt), axis=1)])
+        vt = vt*np.where(signs == 0, 1, signs)[:, None]
+        ncomps = len(svals) if self.ncomps is None else min(self.ncomps, len(svals))
+        self.components = vt[:ncomps]
+        self.singular_values = svals[:ncomps]
+        self.mean = mean
+        self.nrows = ntotal
+        return self
+
+    @property
+    def explained_variance(self):
+        "variance of the data along each component"
+        return self.singular_values**2/max(self.nrows - 1, 1)
+
+    @property
+    def explained_variance_ratio(self):
+        "fraction of the total variance along each component"
+        return self.singular_values**2/max(self.total_ss, 1.e-300)
+
+    def transform(self, data):
+        """return scores (2-D array, one row per row of data) of rows
+        of data on the components"""
+        data = np.atleast_2d(np.asarray(data, dtype=np.float64))
+        return (data - self.mean) @ self.components.T
@@ -4,8 +4,9 @@
   taken from larch (plugins/xafs/pre_edge.py)
 """
 
+from math import comb
 import numpy as np
-from scipy import polyfit
+from numpy import polyfit
 
 def index_of(arrval, value):
     """return index of array *at or below* value
@@ -20,6 +21,23 @@ def index_nearest(array, value, _larch=None):
     """
     return np.abs(array-value).argmin()
 
+def find_e0_index(dmu, frac=0.05):
+    """return index of the largest derivative of mu(E) that is inside a run
+    of at least 3 points with high derivative (above frac*max(dmu)), as
+    used to find E0.  Returns 0 if there are no such points.
+
+    dmu can be 1-D, or 2-D for many spectra on the same grid, in which
+    case an array of indices, one per row, is returned.
+    """
+    dmu = np.asarray(dmu, dtype=np.float64)
+    high = dmu > frac*np.nanmax(dmu, axis=-1, keepdims=True)
+    inner = np.zeros(dmu.shape, dtype=bool)
+    inner[..., 1:-1] = high[..., 1:-1] & high[..., :-2] & high[..., 2:]
+    score = np.where(inner & (dmu > 0), dmu, -np.inf)
+    idx = np.argmax(score, axis=-1)
+    found = np.isfinite(np.take_along_axis(score, np.expand_dims(idx, -1), -1))
+    return np.where(found[..., 0], idx, 0)
+
 def remove_dups(arr, tiny=1.e-8, frac=0.02):
     """avoid repeated successive values of an array that is expected
     to be monotonically increasing.
@@ -176,16 +194,7 @@ def preedge(energy, mu, e0=None, step=None,
     if e0 is None or e0 < energy[0] or e0 > energy[-1]:
         energy = remove_dups(energy)
         dmu = np.gradient(mu)/np.gradient(energy)
-        # find points of high derivative
-        high_deriv_pts = np.where(dmu >  max(dmu)*0.05)[0]
-        idmu_max, dmu_max = 0, 0
-        for i in high_deriv_pts:
-            if (dmu[i] > dmu_max and
-                (i+1 in high_deriv_pts) and
-                (i-1 in high_deriv_pts)):
-                idmu_max, dmu_max = i, dmu[i]
-
-        e0 = energy[idmu_max]
+        e0 = energy[int(find_e0_index(dmu))]
     nnorm = max(min(nnorm, 5), 1)
     ie0 = index_nearest(energy, e0)
     e0 = energy[ie0]
@@ -238,6 +247,222 @@ def preedge(energy, mu, e0=None, step=None,
             'nnorm': nnorm, 'norm1': norm1, 'norm2': norm2,
             'pre1': pre1, 'pre2': pre2, 'precoefs': precoefs}
 
+def _as_block(vals):
+    """return a NaN-padded 2-D float array for a 2-D array or a sequence of
+    1-D arrays of possibly different lengths, and the number of points in
+    each row (counting finite values at the start of a 2-D block)"""
+    if isinstance(vals, np.ndarray) and vals.ndim == 2:
+        block = vals.astype(np.float64)
+        return block, None
+    rows = [np.asarray(v, dtype=np.float64).ravel() for v in vals]
+    if len(rows) < 1:
+        raise ValueError('preedge_batch: no spectra given')
+    npts = np.array([len(r) for r in rows], dtype=int)
+    block = np.full((len(rows), npts.max()), np.nan)
+    for i, row in enumerate(rows):
+        block[i, :len(row)] = row
+    return block, npts
+
+def _row_gradient(block, npts):
+    """np.gradient() along each row of a NaN-padded 2-D array,
+    using one-sided differences at the last point of each row"""
+    rows = np.arange(len(block))
+    last = npts - 1
+    grad = np.full(block.shape, np.nan)
+    grad[:, 1:-1] = (block[:, 2:] - block[:, :-2])/2.0
+    grad[:, 0] = block[:, 1] - block[:, 0]
+    grad[rows, last] = block[rows, last] - block[rows, last-1]
+    return grad
+
+def _rows_index_of(block, valid, values):
+    "index_of() for each row of a 2-D array"
+    below = valid & (block <= values[:, None])
+    idx = block.shape[1] - 1 - np.argmax(below[:, ::-1], axis=1)
+    return np.where(below.any(axis=1), idx, 0)
+
+def _rows_index_nearest(block, valid, values):
+    "index_nearest() for each row of a 2-D array"
+    return np.where(valid, abs(block - values[:, None]), np.inf).argmin(axis=1)
+
+def _rows_polyfit(x, y, mask, deg):
+    """least-squares polynomial fit of y(x) for each row of 2-D arrays,
+    using only the points where mask is True.
+
+    The fits use x centered and scaled for each row, and are solved
+    together from the stacked normal equations.  Returns (coefs, center,
+    scale) with coefs[:, k] the coefficient of ((x-center)/scale)**k.
+    """
+    nrows = len(x)
+    ncoef = deg + 1
+    count = np.maximum(mask.sum(axis=1), 1)
+    center = np.where(mask, x, 0).sum(axis=1)/count
+    xlo = np.where(mask, x, np.inf).min(axis=1)
+    xhi = np.where(mask, x, -np.inf).max(axis=1)
+    scale = (xhi - xlo)/2.0
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    tval = np.where(mask, (x - center[:, None])/scale[:, None], 0)
+    yval = np.where(mask, y, 0)
+    moments = np.zeros((nrows, 2*deg+1))
+    rhs = np.zeros((nrows, ncoef))
+    tpow = mask.astype(np.float64)
+    for p in range(2*deg+1):
+        moments[:, p] = tpow.sum(axis=1)
+        if p < ncoef:
+            rhs[:, p] = (tpow*yval).sum(axis=1)
+        tpow = tpow*tval
+    terms = np.arange(ncoef)
+    gram = moments[:, terms[:, None] + terms[None, :]]
+    try:
+        coefs = np.linalg.solve(gram, rhs[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        coefs = np.matmul(np.linalg.pinv(gram), rhs[..., None])[..., 0]
+    return coefs, center, scale
+
+def _rows_polyval(coefs, center, scale, x):
+    "evaluate polynomials from _rows_polyfit() for each row of x"
+    tval = (x - center[:, None])/scale[:, None]
+    out = np.zeros(x.shape)
+    for k in range(coefs.shape[1]-1, -1, -1):
+        out = out*tval + coefs[:, k:k+1]
+    return out
+
+def _rows_rawcoefs(coefs, center, scale):
+    """convert coefficients from _rows_polyfit() to coefficients of
+    powers of x, lowest power first"""
+    ncoef = coefs.shape[1]
+    terms = np.arange(ncoef)
+    binom = np.array([[comb(k, j) for j in terms] for k in terms], dtype=np.float64)
+    shift = np.maximum(terms[:, None] - terms[None, :], 0)
+    trans = (binom[None, :, :] *
+             (-center)[:, None, None]**shift[None, :, :] *
+             scale[:, None, None]**(-terms)[None, :, None])
+    return np.einsum('nk,nkj->nj', coefs, trans)
+
+def preedge_batch(energies, mus, e0=None, step=None,
+                  nnorm=3, nvict=0, pre1=None, pre2=-50,
+                  norm1=100, norm2=None):
+    """pre edge subtraction and normalization for many spectra at once
+
+    This does the same steps as preedge(), but for all spectra together,
+    with the pre-edge lines and post-edge polynomials found from stacked
+    least-squares fits instead of one polyfit() per spectrum.
+
+    Arguments
+    ----------
+    energies: 2-D array (nspectra, npts) of energies, in eV, which can be
+              NaN-padded at the end of each row, or a list of 1-D arrays
+              of different lengths, or a single 1-D array for a grid
+              shared by all spectra.
+    mus:      2-D array or list of 1-D arrays of mu(E), matching energies
+    e0:       edge energy, in eV, either one value or one per spectrum.
+              If None (or NaN or out of range), it will be determined here.
+    step:     edge jump, either one value or one per spectrum.  If None
+              (or NaN), it will be determined here.
+    others:   pre1, pre2, norm1, norm2, nnorm, nvict as for preedge()
+
+    Returns
+    -------
+      dictionary with elements (among others)
+          e0          array of energy origins in eV
+          edge_step   array of edge steps
+          norm        2-D array of normalized mu(E), NaN-padded
+          pre_edge    2-D array of pre-edge curves
+          post_edge   2-D array of post-edge, normalization curves
+          energy      2-D array of energies, with repeated values removed
+          npts        array of number of points for each spectrum
+
+    Notes
+    -----
+     1 Non-finite values of mu(E) are left out of the fits.
+     2 Where a fit range has fewer points than coefficients, as for XANES
+       scans ending just after the edge, the minimum-norm solution about
+       the center of the range is used, which for a single point is a
+       flat line, where polyfit() would give an arbitrary polynomial.
+    """
+    mublock, npts = _as_block(mus)
+    nspec, width = mublock.shape
+    if np.ndim(energies[0]) == 0:
+        enblock = np.tile(np.asarray(energies, dtype=np.float64)[:width],
+                          (nspec, 1))
+    else:
+        enblock, _npts = _as_block(energies)
+        if npts is None:
+            npts = _npts
+    if enblock.shape != mublock.shape:
+        raise ValueError('preedge_batch: energies and mus do not match')
+    if npts is None:
+        npts = np.isfinite(enblock).sum(axis=1)
+
+    rows = np.arange(nspec)
+    cols = np.arange(width)
+    valid = cols[None, :] < npts[:, None]
+    enblock[~valid] = np.nan
+    mublock[~valid] = np.nan
+
+    dups = (abs(np.diff(enblock, axis=1)) < 1.e-8).any(axis=1)
+    for i in np.where(dups)[0]:
+        enblock[i, :npts[i]] = remove_dups(enblock[i, :npts[i]])
+
+    emin = enblock[:, 0]
+    emax = enblock[rows, npts-1]
+    if e0 is None:
+        e0 = np.full(nspec, np.nan)
+    e0 = np.array(np.broadcast_to(np.asarray(e0, dtype=np.float64), (nspec,)))
+    detect = ~((e0 >= emin) & (e0 <= emax))
+    if detect.any():
+        dmu = (_row_gradient(mublock[detect], npts[detect]) /
+               _row_gradient(enblock[detect], npts[detect]))
+        ie0 = find_e0_index(dmu)
+        e0[detect] = enblock[detect][np.arange(detect.sum()), ie0]
+
+    nnorm = max(min(nnorm, 5), 1)
+    ie0 = _rows_index_nearest(enblock, valid, e0)
+    e0 = enblock[rows, ie0]
+
+    emin = np.where(valid, enblock, np.inf).min(axis=1)
+    emax = np.where(valid, enblock, -np.inf).max(axis=1)
+    pre1 = emin - e0 if pre1 is None else np.maximum(pre1, emin - e0)
+    if norm2 is None or norm2 < 0:
+        norm2 = emax - e0
+    else:
+        norm2 = np.minimum(norm2, emax - e0)
+    pre2 = np.broadcast_to(pre2, (nspec,))
+    norm1 = np.broadcast_to(norm1, (nspec,))
+    pre1, pre2 = np.minimum(pre1, pre2), np.maximum(pre1, pre2)
+    norm1, norm2 = np.minimum(norm1, norm2), np.maximum(norm1, norm2)
+
+    omu = mublock*enblock**nvict
+    fitpts = valid & np.isfinite(omu)
+
+    def window(lo, hi):
+        p1 = _rows_index_of(enblock, valid, lo+e0)
+        p2 = _rows_index_nearest(enblock, valid, hi+e0)
+        p2 = np.where(p2-p1 < 2, np.minimum(npts, p1+2), p2)
+        return fitpts & (cols[None, :] >= p1[:, None]) & (cols[None, :] < p2[:, None])
+
+    prefit = _rows_polyfit(enblock, omu, window(pre1, pre2), 1)
+    pre_edge = _rows_polyval(*prefit, enblock) * enblock**(-nvict)
+    precoefs = _rows_rawcoefs(*prefit)[:, ::-1]
+
+    normfit = _rows_polyfit(enblock, omu, window(norm1, norm2), nnorm)
+    post_edge = _rows_polyval(*normfit, enblock) * enblock**(-nvict)
+    norm_coefs = _rows_rawcoefs(*normfit)
+
+    edge_step = post_edge[rows, ie0] - pre_edge[rows, ie0]
+    if step is not None:
+        step = np.broadcast_to(np.asarray(step, dtype=np.float64), (nspec,))
+        edge_step = np.where(np.isfinite(step), step, edge_step)
+
+    norm = (mublock - pre_edge)/edge_step[:, None]
+
+    return {'e0': e0, 'edge_step': edge_step, 'norm': norm,
+            'pre_edge': pre_edge, 'post_edge': post_edge,
+            'energy': enblock, 'npts': npts,
+            'norm_coefs': norm_coefs, 'nvict': nvict,
+            'nnorm': nnorm, 'norm1': norm1, 'norm2': norm2,
+            'pre1': pre1, 'pre2': pre2, 'precoefs': precoefs}
+
 symbols = ["", "H", "He", "Li", "Be", "B", "C", "N", "O", "F", "Ne", "Na",
            "Mg", "Al", "Si", "P", "S", "Cl", "Ar", "K", "Ca", "Sc", "Ti",
            "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn", "Ga", "Ge", "As",
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+  resampling of many XAFS spectra onto a common energy grid
+"""
+
+import numpy as np
+
+from .xafs_preedge import _as_block
+
+def make_grid(emin, emax, estep):
+    """return array of values from emin to emax (inclusive, if it is
+    a whole number of steps from emin) with step estep"""
+    npts = int(np.floor((emax - emin)/estep + 1.e-6)) + 1
+    return emin + estep*np.arange(npts)
+
+def interp_rows(xs, ys, grid, kind='linear'):
+    """interpolate many curves y(x) onto one grid, for all curves at once
+
+    Arguments
+    ----------
+    xs:     2-D array (ncurves, npts), NaN-padded at the end of each row,
+            or list of 1-D arrays of different lengths
+    ys:     2-D array or list of 1-D arrays, matching xs
+    grid:   1-D array of x values to interpolate to
+    kind:   'linear' or 'cubic' ['linear']
+
+    Returns
+    -------
+      2-D array (ncurves, len(grid)), with NaN outside the range of x
+      of each curve.
+
+    Notes
+    -----
+     1 The points of all curves are put in one sorted array, each row
+       shifted so that rows do not overlap, so that a single searchsorted()
+       finds the interval for every curve and grid point.
+     2 'cubic' uses cubic Hermite interpolation, with slopes from finite
+       differences of neighboring points (Catmull-Rom for unequal steps).
+    """
+    if kind not in ('linear', 'cubic'):
+        raise ValueError("interp_rows: kind must be 'linear' or 'cubic'")
+    xblock, npts = _as_block(xs)
+    yblock, _npts = _as_block(ys)
+    if xblock.shape != yblock.shape:
+        raise ValueError('interp_rows: xs and ys do not match')
+    if npts is None:
+        npts = np.isfinite(xblock).sum(axis=1)
+    grid = np.asarray(grid, dtype=np.float64)
+    nrows, width = xblock.shape
+    rows = np.arange(nrows)
+    valid = np.arange(width)[None, :] < npts[:, None]
+    xblock[~valid] = np.nan
+
+    # sort each row by x, leaving padding at the end
+    if np.any(np.diff(xblock, axis=1) < 0):
+        order = np.argsort(xblock, axis=1)
+        xblock = np.take_along_axis(xblock, order, axis=1)
+        yblock = np.take_along_axis(yblock, order, axis=1)
+
+    xlo = xblock[:, 0]
+    xhi = xblock[rows, np.maximum(npts-1, 0)]
+    span = (max(np.nanmax(xhi), grid.max()) -
+            min(np.nanmin(xlo), grid.min()) + 1.0)
+    offset = span*rows
+    flatx = (xblock + offset[:, None])[valid]
+    flaty = yblock[valid]
+    start = np.cumsum(npts) - npts
+
+    query = grid[None, :] + offset[:, None]
+    idx = np.searchsorted(flatx, query.ravel()).reshape(query.shape)
+    first = start[:, None] + 1
+    last = (start + npts - 1)[:, None]
+    hi = np.clip(idx, first, np.maximum(last, first))
+    lo = hi - 1
+    hi = np.minimum(hi, len(flatx)-1)
+
+    x0, x1 = flatx[lo], flatx[hi]
+    y0, y1 = flaty[lo], flaty[hi]
+    dx = x1 - x0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = (query - x0)/dx
+        if kind == 'linear':
+            out = y0 + frac*(y1 - y0)
+        else:
+            # slopes at each point, one-sided at the ends of each row
+            prev = np.maximum(np.arange(len(flatx)) - 1, np.repeat(start, npts))
+            succ = np.minimum(np.arange(len(flatx)) + 1,
+                              np.repeat(start + npts - 1, npts))
+            slope = (flaty[succ] - flaty[prev])/(flatx[succ] - flatx[prev])
+            m0, m1 = slope[lo]*dx, slope[hi]*dx
+            f2 = frac*frac
+            f3 = f2*frac
+            out = ((2*f3 - 3*f2 + 1)*y0 + (f3 - 2*f2 + frac)*m0 +
+                   (-2*f3 + 3*f2)*y1 + (f3 - f2)*m1)
+    outside = ((grid[None, :] < xlo[:, None]) | (grid[None, :] > xhi[:, None]) |
+               (npts[:, None] < 2))
+    out[outside] = np.nan
+    return out
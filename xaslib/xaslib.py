@@ -8,27 +8,44 @@ Main Class:  XASDataLibrary
 """
 
 import os
+import re
 import sys
 import time
 import random
 import json
+import zlib
+import struct
+import fnmatch
 import logging
 import numpy as np
+import scipy.constants as consts
 from datetime import datetime
+from collections import OrderedDict
 
 from base64 import b64encode
-from hashlib import pbkdf2_hmac
+from hashlib import pbkdf2_hmac, sha256
 
-from sqlalchemy import MetaData, create_engine, text, and_
+from sqlalchemy import (MetaData, LargeBinary, create_engine, inspect, select,
+                        text, func, and_, or_)
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import SingletonThreadPool
 
-from larch.io import XDIFile, read_ascii
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from larch.utils import debugtime
+from larch.math import remove_dups, remove_nans2
+from larch.xafs.pre_edge import preedge, TINY_ENERGY
 
 from . import initialdata
-from .simpledb import (SimpleDB, isSimpleDB, isotime,
-                       hash_password, test_password)
+from .simpledb import (SimpleDB, isSimpleDB, isotime, keyset_clause,
+                       keyset_order, hash_password, test_password)
+from .xafs_resample import make_grid, interp_rows
+from .xafs_lcf import lcf_combinations
+from .xafs_pca import IncrementalPCA
+from .xafs_autobk import autobk, xftf
 
 
 def isXASDataLibrary(dbname):
@@ -50,6 +67,457 @@ def json_encode(val):
         val = val.flatten().tolist()
     return  json.dumps(val)
 
+# array columns of the spectrum table
+SPECTRUM_ARRAYS = ('energy', 'i0', 'itrans', 'ifluor', 'irefer',
+                   'energy_stderr', 'i0_stderr', 'itrans_stderr',
+                   'ifluor_stderr', 'irefer_stderr')
+
+# binary array blobs:  magic, flags, dtype string (eg '<f8'), ndim,
+# followed by ndim uint32 dimensions, and then the array data
+ARRAY_MAGIC = b'XDLA'
+ARRAY_HEADER = struct.Struct('<4sB3sB')
+ARRAY_ZLIB = 1
+
+def encode_array(val, compress=True):
+    """encode an array as a typed, little-endian binary blob,
+    optionally compressed with zlib.  Returns None for None, and
+    values that are already encoded unchanged"""
+    if val is None:
+        return None
+    if isinstance(val, bytes) and val[:4] == ARRAY_MAGIC:
+        return val
+    arr = np.asarray(val)
+    if arr.dtype.kind not in 'iuf':
+        arr = arr.astype(np.float64)
+    dtype = arr.dtype.newbyteorder('<')
+    if len(dtype.str) != 3:
+        dtype = np.dtype('<f8')
+    arr = np.ascontiguousarray(arr, dtype=dtype)
+    data = arr.tobytes()
+    flags = 0
+    if compress:
+        data = zlib.compress(data, 6)
+        flags |= ARRAY_ZLIB
+    header = ARRAY_HEADER.pack(ARRAY_MAGIC, flags, dtype.str.encode('ascii'),
+                               arr.ndim)
+    shape = struct.pack('<%dI' % arr.ndim, *arr.shape)
+    return header + shape + data
+
+def decode_array(val):
+    """decode an array column to a numpy array, from either a binary
+    blob made by encode_array() or a JSON string.
+    Returns None for None or empty values"""
+    if val is None:
+        return None
+    if isinstance(val, memoryview):
+        val = val.tobytes()
+    if isinstance(val, bytes) and val[:4] == ARRAY_MAGIC:
+        magic, flags, dtype, ndim = ARRAY_HEADER.unpack_from(val)
+        offset = ARRAY_HEADER.size
+        shape = struct.unpack_from('<%dI' % ndim, val, offset)
+        data = val[offset + 4*ndim:]
+        if flags & ARRAY_ZLIB:
+            data = zlib.decompress(data)
+        return np.frombuffer(bytearray(data),
+                             dtype=dtype.decode('ascii')).reshape(shape)
+    if isinstance(val, bytes):
+        val = val.decode('utf-8')
+    val = val.strip()
+    if len(val) < 1:
+        return None
+    return np.array(json.loads(val))
+
+# file text blobs:  magic, compression (TEXT_RAW, TEXT_ZLIB, or
+# TEXT_ZSTD, which needs the zstandard package), then the UTF-8 text
+TEXT_MAGIC = b'XDLT'
+TEXT_RAW, TEXT_ZLIB, TEXT_ZSTD = 0, 1, 2
+TEXT_COMPRESSION = {'none': TEXT_RAW, 'zlib': TEXT_ZLIB, 'zstd': TEXT_ZSTD}
+
+def encode_text(val, compress='zlib'):
+    """encode file text as a binary blob, compressed with 'zlib',
+    'zstd', or 'none'.  Returns None for None, and values that are
+    already encoded unchanged"""
+    if val is None:
+        return None
+    if isinstance(val, memoryview):
+        val = val.tobytes()
+    if isinstance(val, bytes) and val[:4] == TEXT_MAGIC:
+        return val
+    if isinstance(val, str):
+        val = val.encode('utf-8')
+    method = TEXT_COMPRESSION.get(compress, None)
+    if method is None:
+        raise ValueError(f"unknown text compression '{compress}'")
+    if method == TEXT_ZLIB:
+        val = zlib.compress(val, 6)
+    elif method == TEXT_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        val = zstandard.ZstdCompressor(level=9).compress(val)
+    return TEXT_MAGIC + bytes([method]) + val
+
+def decode_text(val):
+    """decode file text from either a binary blob made by encode_text()
+    or plain text.  Returns None for None"""
+    if val is None or isinstance(val, str):
+        return val
+    if isinstance(val, memoryview):
+        val = val.tobytes()
+    if val[:4] == TEXT_MAGIC:
+        method, val = val[4], val[5:]
+        if method == TEXT_ZLIB:
+            val = zlib.decompress(val)
+        elif method == TEXT_ZSTD:
+            if zstandard is None:
+                raise ValueError("zstd compressed text needs the zstandard package")
+            val = zstandard.ZstdDecompressor().decompress(val)
+        elif method != TEXT_RAW:
+            raise ValueError(f"unknown text compression {method}")
+    return val.decode('utf-8')
+
+def text_header(text):
+    """return the header of XDI file text: the lines starting with '#',
+    as stored in spectrum.fileheader"""
+    if text is None:
+        return None
+    return '\n'.join([line for line in text.split('\n') if line.startswith('#')])
+
+# columns left out of spectrum listings
+SPECTRUM_HEAVY_COLUMNS = SPECTRUM_ARRAYS + ('energy_ev', 'filetext', 'fileheader')
+
+# h*c in eV*Angstrom, for monochromator angles
+PLANCK_HC = 1.e10 * consts.Planck * consts.c / consts.e
+
+def mono_deg2ev(angle, d_spacing):
+    "convert monochromator angle (degrees) to energy (eV), for a d-spacing in Angstroms"
+    return PLANCK_HC / (2*d_spacing*np.sin(angle*np.pi/180))
+
+def energy_to_ev(energy, units='eV', d_spacing=-1):
+    """return array of energies in eV, from energies in units of 'eV',
+    'keV', or 'degrees' (monochromator angle, using d_spacing).
+    Returns None for None, or for angles without a d-spacing"""
+    if energy is None:
+        return None
+    energy = np.asarray(energy, dtype=np.float64)
+    units = 'ev' if units is None else units.lower()
+    if units.startswith('kev'):
+        return 1000.0*energy
+    if units.startswith('deg'):
+        if d_spacing is None or float(d_spacing) <= 0:
+            return None
+        return mono_deg2ev(energy, float(d_spacing))
+    return energy
+
+# small, rarely changing tables that are cached in memory,
+# with the columns they can be looked up by
+REFERENCE_TABLES = {'element': ('z', 'symbol', 'name'),
+                    'edge': ('id', 'name'),
+                    'mode': ('id', 'name'),
+                    'energy_units': ('id', 'units'),
+                    'reference_mode': ('id', 'name')}
+
+# seconds between checks of info.modify_date, for changes made
+# to the reference tables by other processes
+REFCACHE_TTL = 10.0
+
+# columns of tables that are used in the full text search index:
+# updating these will re-index the affected spectra
+SEARCH_SOURCES = {'spectrum': ('name', 'description', 'comments', 'notes',
+                               'sample_id', 'beamline_id', 'person_id'),
+                  'sample': ('name', 'formula'),
+                  'beamline': ('name',),
+                  'person': ('name', 'email')}
+
+# default parameters for pre-edge subtraction and normalization with
+# larch's preedge(), as stored with results in the spectrum_product table
+PREEDGE_PARAMS = {'e0': None, 'step': None, 'nnorm': None, 'nvict': 0,
+                  'pre1': None, 'pre2': None, 'norm1': None, 'norm2': None}
+
+# columns of the spectrum table that stored products are derived from:
+# updating these will clear the stored products for the affected spectra
+PRODUCT_SOURCES = SPECTRUM_ARRAYS + ('energy_ev', 'energy_units_id', 'd_spacing',
+                                     'mode_id', 'reference_mode_id')
+
+# columns of the spectrum table that energy_ev is derived from
+ENERGY_SOURCES = ('energy', 'energy_units_id', 'd_spacing')
+
+# compression of stored file text, 'zlib', 'zstd', or 'none'
+FILETEXT_COMPRESSION = 'zlib'
+
+# columns of the spectrum table that content_hash and data_fingerprint
+# are derived from
+HASH_SOURCES = PRODUCT_SOURCES + ('filetext',)
+
+# number of spectra to select or compute products for at a time
+PRODUCT_CHUNK = 500
+
+# default e0-relative energy grid for resampling normalized spectra, and
+# the fraction of spectra of an element and edge that grids should cover
+RESAMPLE_GRID = {'emin': -50.0, 'emax': 150.0, 'estep': 0.5}
+GRID_COVERAGE = 0.9
+
+# e0-relative energy grid for the XANES feature vectors of find_similar()
+FEATURE_GRID = {'emin': -20.0, 'emax': 80.0, 'estep': 1.0}
+
+# default e0-relative energy grid for linear combination fits, and number
+# of most similar spectra to use as standards when none are given
+LCF_GRID = {'emin': -20.0, 'emax': 60.0, 'estep': 0.5}
+LCF_CANDIDATES = 20
+
+# default number of principal components kept by pca()
+PCA_COMPONENTS = 10
+
+# number of spectra kept in memory by get_spectrum_arrays()
+ARRAYS_CACHE_SIZE = 64
+
+# default parameters for EXAFS background subtraction (rbkg, kmin, kmax,
+# kweight, kstep) and for Fourier transforms of chi(k) (ft_*, rmax), as
+# stored with chi(k) and chi(R) in the spectrum_product table
+EXAFS_PARAMS = {'rbkg': 1.0, 'kmin': 0.0, 'kmax': None, 'kweight': 2,
+                'kstep': 0.05, 'ft_kmin': 2.0, 'ft_kmax': None, 'ft_dk': 1.0,
+                'ft_kweight': 2, 'rmax': 10.0}
+
+# what ingesting a spectrum that duplicates one in the library does:
+# add it anyway, link to the existing spectrum instead, or raise an error
+DUPLICATE_ACTIONS = ('add', 'link', 'error')
+
+def preedge_params(**kws):
+    "return full dict of pre-edge parameters, with defaults from PREEDGE_PARAMS"
+    for key in kws:
+        if key not in PREEDGE_PARAMS:
+            raise ValueError(f"unknown pre-edge parameter '{key}'")
+    params = dict(PREEDGE_PARAMS)
+    params.update(kws)
+    return params
+
+def exafs_params(**kws):
+    "return full dict of EXAFS parameters, with defaults from EXAFS_PARAMS"
+    for key in kws:
+        if key not in EXAFS_PARAMS:
+            raise ValueError(f"unknown EXAFS parameter '{key}'")
+    params = dict(EXAFS_PARAMS)
+    params.update(kws)
+    return params
+
+def hash_params(params):
+    "hash of a dict of parameters, as used to key stored spectrum products"
+    return sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+class SpectrumArrays(object):
+    """arrays of a spectrum, decoded when first used and put in order of
+    increasing energy, with mu(E) and mu(E) of the reference channel
+    computed once for each mode.  For rows of the spectrum table, energy
+    is taken from energy_ev, in eV, where available.
+
+    >>> arrays = db.get_spectrum_arrays(spectrum_id)
+    >>> energy, mu = arrays.energy, arrays.mu()
+
+    Arrays may be given as encoded column values or as numpy arrays.
+    Modes are names from the mode and reference_mode tables: mu(E) is
+    -log(itrans/i0) for 'transmission' modes and ifluor/i0 for others, or
+    itrans or ifluor for 'mutrans' or 'mufluor', for data given as mu(E).
+    Infinite values of mu(E) are replaced with NaN.
+    """
+    def __init__(self, mode='transmission', refmode='none', **arrays):
+        self.mode = mode.lower()
+        self.refmode = refmode.lower()
+        self._encoded = arrays
+        self._arrays = {}
+        self._order = None
+        self._mu = {}
+        self._murefer = {}
+
+    @classmethod
+    def from_row(cls, row, mode='transmission', refmode='none'):
+        "SpectrumArrays for a row of the spectrum table"
+        arrays = {name: getattr(row, name) for name in SPECTRUM_ARRAYS
+                  if hasattr(row, name)}
+        if getattr(row, 'energy_ev', None) is not None:
+            arrays['energy'] = row.energy_ev
+        return cls(mode=mode, refmode=refmode, **arrays)
+
+    def get(self, name):
+        "return array by name, or None if not available"
+        if name not in self._arrays:
+            val = self._encoded.get(name, None)
+            if not isinstance(val, np.ndarray):
+                val = decode_array(val)
+            if val is not None and name != 'energy':
+                order = self.order()
+                if order is not None and len(val) == len(order):
+                    val = val[order]
+            elif val is not None:
+                val = np.asarray(val, dtype=np.float64)
+                if np.any(np.diff(val) < 0):
+                    self._order = np.argsort(val, kind='stable')
+                    val = val[self._order]
+            self._arrays[name] = val
+        return self._arrays[name]
+
+    def order(self):
+        """return index array that puts the stored arrays in order of
+        increasing energy, or None if they are in order already"""
+        self.get('energy')
+        return self._order
+
+    def __getattr__(self, name):
+        if name in SPECTRUM_ARRAYS:
+            return self.get(name)
+        raise AttributeError(name)
+
+    def mu(self, mode=None):
+        "return mu(E) for a mode [the spectrum's mode], or None"
+        mode = self.mode if mode is None else mode.lower()
+        if mode not in self._mu:
+            i0, itrans, ifluor = self.get('i0'), self.get('itrans'), self.get('ifluor')
+            mu = None
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if mode.startswith('mutrans'):
+                    mu = itrans
+                elif mode.startswith('mufluor'):
+                    mu = ifluor
+                elif mode.startswith('trans'):
+                    if itrans is not None and i0 is not None:
+                        mu = -np.log(itrans/i0)
+                elif ifluor is not None and i0 is not None:
+                    mu = ifluor/i0
+            self._mu[mode] = _finite_or_nan(mu)
+        return self._mu[mode]
+
+    def mu_refer(self, refmode=None):
+        """return mu(E) of the reference channel for a reference mode
+        [the spectrum's reference mode], or None"""
+        refmode = self.refmode if refmode is None else refmode.lower()
+        if refmode not in self._murefer:
+            irefer = self.get('irefer')
+            i0, itrans = self.get('i0'), self.get('itrans')
+            murefer = None
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if irefer is None or refmode.startswith('none'):
+                    murefer = None
+                elif refmode.startswith('mu'):
+                    murefer = irefer
+                elif refmode.startswith('trans') and itrans is not None:
+                    murefer = -np.log(irefer/itrans)
+                elif 'itrans' in refmode and itrans is not None:
+                    murefer = irefer/itrans
+                elif i0 is not None:
+                    murefer = irefer/i0
+            self._murefer[refmode] = _finite_or_nan(murefer)
+        return self._murefer[refmode]
+
+    def valid(self, mode=None, refer=False):
+        """return boolean array of points with finite energy and mu(E),
+        or None if energy or mu(E) is not available"""
+        energy = self.get('energy')
+        mu = self.mu_refer() if refer else self.mu(mode)
+        if energy is None or mu is None or energy.shape != mu.shape:
+            return None
+        return np.isfinite(energy) & np.isfinite(mu)
+
+def _finite_or_nan(val):
+    "array with infinite values replaced by NaN, or None for None"
+    if val is None:
+        return None
+    val = np.asarray(val, dtype=np.float64)
+    return np.where(np.isinf(val), np.nan, val)
+
+def normalized_on_grid(energy, mu, grid, **params):
+    """return normalized mu(E) for arrays of energy and mu, interpolated
+    onto a grid of e0-relative energies, and e0.  Both are NaN for
+    arrays that cannot be normalized (see valid_preedge)"""
+    result = preedge_products([energy], [mu], **params)[0]
+    if not valid_preedge(result):
+        return np.full(len(grid), np.nan), np.nan
+    with np.errstate(all='ignore'):
+        data = interp_rows([result['energy'] - result['e0']], [result['norm']], grid)
+    return data[0], result['e0']
+
+def fill_gaps(data):
+    """fill NaN values in each row of a 2-D array with the nearest finite
+    value before them in the row, or after them for leading NaNs.
+    Rows with no finite values are left as NaN"""
+    data = np.asarray(data, dtype=np.float64)
+    rows = np.arange(data.shape[0])[:, None]
+    cols = np.arange(data.shape[1])
+    valid = np.isfinite(data)
+    before = np.maximum.accumulate(np.where(valid, cols, 0), axis=1)
+    after = np.minimum.accumulate(np.where(valid, cols, data.shape[1]-1)[:, ::-1],
+                                  axis=1)[:, ::-1]
+    out = data[rows, before]
+    return np.where(np.isfinite(out), out, data[rows, after])
+
+def preedge_products(energies, mus, **params):
+    """run pre-edge subtraction and normalization with larch's preedge()
+    for many spectra, returning a list of results, one per spectrum, as
+    dicts with 'e0', 'edge_step', 'precoefs', 'norm_coefs', the fit
+    ranges, and arrays 'energy' (with NaNs and repeated values removed)
+    and 'norm', or None for spectra that cannot be normalized"""
+    params = preedge_params(**params)
+    results = []
+    for energy, mu in zip(energies, mus):
+        try:
+            with np.errstate(all='ignore'):
+                energy, mu = remove_nans2(np.asarray(energy, dtype=np.float64),
+                                          np.asarray(mu, dtype=np.float64))
+                energy = remove_dups(energy, tiny=TINY_ENERGY)
+                out = preedge(energy, mu, **params)
+        except (ValueError, TypeError, IndexError, np.linalg.LinAlgError):
+            results.append(None)
+            continue
+        result = {'e0': out['e0'], 'edge_step': out['edge_step'],
+                  'precoefs': np.asarray(out['precoefs']).tolist(),
+                  'norm_coefs': np.asarray(out['norm_coefs']).tolist(),
+                  'nnorm': int(out['nnorm']), 'nvict': out['nvict']}
+        for key in ('pre1', 'pre2', 'norm1', 'norm2'):
+            result[key] = out[key]
+        result['energy'] = energy
+        result['norm'] = out['norm']
+        results.append(result)
+    return results
+
+def valid_preedge(result):
+    """whether a pre-edge result (see preedge_products) is usable for
+    comparing spectra: with a positive edge step and finite norm"""
+    return (result is not None and np.isfinite(result['edge_step']) and
+            result['edge_step'] > 0 and np.all(np.isfinite(result['norm'])))
+
+def preedge_row(result):
+    "return spectrum_product row (without spectrum_id) for a pre-edge result"
+    text = json.dumps({key: val for key, val in result.items()
+                       if key not in ('energy', 'norm')})
+    return {'result': text, 'xdata': encode_array(result['energy']),
+            'ydata': encode_array(result['norm'])}
+
+def feature_rows(results):
+    """return spectrum_product rows (without spectrum_id) of XANES feature
+    vectors for a list of pre-edge results, with None for spectra that do
+    not cover the FEATURE_GRID or are not valid (see valid_preedge)"""
+    rows = [None]*len(results)
+    good = [i for i, result in enumerate(results) if valid_preedge(result)]
+    if len(good) == 0:
+        return rows
+    grid = make_grid(**FEATURE_GRID)
+    with np.errstate(all='ignore'):
+        data = fill_gaps(interp_rows([results[i]['energy'] - results[i]['e0']
+                                      for i in good],
+                                     [results[i]['norm'] for i in good], grid))
+    xdata = encode_array(grid)
+    for i, vec in zip(good, data):
+        if np.all(np.isfinite(vec)):
+            rows[i] = {'xdata': xdata, 'ydata': encode_array(vec),
+                       'result': json.dumps({'e0': results[i]['e0']})}
+    return rows
+
+def flatten_text(val):
+    """flatten nested dicts/lists (as from JSON) to text of
+    'key: value' words, for the search index"""
+    if isinstance(val, dict):
+        return ' '.join(['%s: %s' % (k, flatten_text(v)) for k, v in val.items()])
+    if isinstance(val, (list, tuple)):
+        return ' '.join([flatten_text(v) for v in val])
+    return '' if val is None else str(val)
+
 def valid_score(score, smin=0, smax=5):
     """ensure that the input score is an integr
     in the range [smin, smax]  (inclusive)"""
@@ -101,16 +569,65 @@ class XASDataLibrary(SimpleDB):
     def __init__(self, dbname=None, server= 'sqlite', user='', password='',
                  host='', port=5432, dialect=None, logfile=None):
 
+        self._refcache = {}
+        self._refcache_stamp = None
+        self._refcache_checked = 0.0
+        self._grids = {}
+        self._simindex = {}
+        self._pca = {}
+        self._arrays = OrderedDict()
+        self._blguess = {}
         SimpleDB.__init__(self, dbname=dbname, server=server, user=user,
                           password=password, host=host, port=port, dialect=dialect,
                           logfile=logfile)
 
         self.session = None
 
+    def table_modified(self, tablename):
+        "clear cached reference tables, beamlines and energy grids when written"
+        if tablename in REFERENCE_TABLES:
+            self._refcache = {}
+        elif tablename in ('beamline', 'facility'):
+            self._blguess = {}
+        elif tablename == 'spectrum':
+            self._grids = {}
+
+    def refcache(self, tablename):
+        """return in-memory copy of a small reference table (see
+        REFERENCE_TABLES), as a dict with 'rows' holding all rows, and
+        a dict of {value: row} for each lookup column.
+
+        The cache is cleared when a reference table is written here, and
+        when info.modify_date changes, checked every REFCACHE_TTL seconds.
+        """
+        now = time.time()
+        if now > self._refcache_checked + REFCACHE_TTL:
+            self._refcache_checked = now
+            row = self.get_rows('info', where={'key': 'modify_date'},
+                                limit_one=True, none_if_empty=True)
+            stamp = None if row is None else row.value
+            if stamp != self._refcache_stamp:
+                self._refcache = {}
+                self._refcache_stamp = stamp
+
+        cache = self._refcache.get(tablename, None)
+        if cache is None:
+            rows = self.get_rows(tablename)
+            cache = {'rows': rows}
+            for key in REFERENCE_TABLES[tablename]:
+                cache[key] = {getattr(row, key): row for row in rows}
+            self._refcache[tablename] = cache
+        return cache
+
+    def get_refrow(self, tablename, val, key='id'):
+        """return row of a cached reference table by value of a column,
+        or None if not found"""
+        return self.refcache(tablename)[key].get(val, None)
+
     def included_elements(self, retval='symbol'):
         """return a list of elements with one or more spectra"""
         zvals = []
-        for s in self.get_rows('spectrum'):
+        for s in self.get_rows('spectrum', columns=('element_z',)):
             ez = s.element_z
             if ez not in zvals:
                 zvals.append(ez)
@@ -141,26 +658,43 @@ class XASDataLibrary(SimpleDB):
             key = 'z'
         elif len(val) > 2:
             key = 'name'
-        kws = {key: val}
-        return self.get_rows('element', where=kws, limit_one=True, none_if_empty=True)
+        return self.get_refrow('element', val, key=key)
 
     def get_elements(self):
         """return list of elements z, name, symbol"""
-        return self.get_rows('element')
+        return self.refcache('element')['rows']
+
+    def get_mode(self, val):
+        """return measurement mode by name or id"""
+        key = 'id' if isinstance(val, int) else 'name'
+        return self.get_refrow('mode', val, key=key)
 
     def get_modes(self):
         """return list of measurement modes"""
-        return self.get_rows('mode')
+        return self.refcache('mode')['rows']
+
+    def get_reference_mode(self, val):
+        """return reference mode by name or id"""
+        key = 'id' if isinstance(val, int) else 'name'
+        return self.get_refrow('reference_mode', val, key=key)
+
+    def get_energy_units(self, val):
+        """return energy units by name (eg, 'eV') or id"""
+        key = 'id' if isinstance(val, int) else 'units'
+        return self.get_refrow('energy_units', val, key=key)
 
     def get_edge(self, val, key='name'):
         """return edge by name  or id"""
         if isinstance(val, int):
             key = 'id'
-        return self.get_rows('edge', where={key: val}, limit_one=True, none_if_empty=True)
+        if key not in REFERENCE_TABLES['edge']:
+            return self.get_rows('edge', where={key: val}, limit_one=True,
+                                 none_if_empty=True)
+        return self.get_refrow('edge', val, key=key)
 
     def get_edges(self):
         """return list of edges"""
-        return self.get_rows('edge')
+        return self.refcache('edge')['rows']
 
     def get_beamline(self, val, key='name'):
         """return beamline by name  or id"""
@@ -229,6 +763,14 @@ class XASDataLibrary(SimpleDB):
             key = 'id'
         return self.get_rows('person', where={key: val}, limit_one=True, none_if_empty=True)
 
+    def get_person_id(self, person, funcname='get_person_id'):
+        """return id of a person given by email or id, raising
+        ValueError if person is None or not found"""
+        row = None if person is None else self.get_person(person)
+        if row is None:
+            raise ValueError(f"{funcname}(): a valid person is required, not '{person}'")
+        return row.id
+
     def get_persons(self, **kws):
         """return list of people"""
         return self.get_rows('person', where=kws)
@@ -286,9 +828,10 @@ class XASDataLibrary(SimpleDB):
                             person_id=person_id, **kws)
 
     def del_suite(self, suite_id):
-        self.delete_rows('suite', {'id': suite_id})
-        self.delete_rows('suite_rating', {'id': suite_id})
-        self.delete_rows('spectrum_suite', {'suite_id': suite_id})
+        with self.transaction():
+            self.delete_rows('suite', {'id': suite_id})
+            self.delete_rows('suite_rating', {'suite_id': suite_id})
+            self.delete_rows('spectrum_suite', {'suite_id': suite_id})
 
 
     def remove_spectrum_from_suite(self, suite_id, spectrum_id):
@@ -296,9 +839,15 @@ class XASDataLibrary(SimpleDB):
                                             'spectrum_id': spectrum_id})
 
     def del_spectrum(self, sid):
-        self.delete_rows('spectrum', {'id:', sid})
-        self.delete_rows('spectrum_rating', {'id:', sid})
-        self.delete_rows('spectrum_suite', {'spectrum_id:', sid})
+        with self.transaction():
+            self.delete_rows('spectrum', {'id': sid})
+            self._arrays.pop(int(sid), None)
+            self.delete_rows('spectrum_rating', {'spectrum_id': sid})
+            self.delete_rows('spectrum_suite', {'spectrum_id': sid})
+            self.clear_products([sid])
+            self.unindex_spectra([sid])
+            if self.has_manifest():
+                self.delete_rows('ingest_manifest', {'spectrum_id': sid})
 
 
     def set_suite_rating(self, person_id, suite_id, score, comments=None):
@@ -332,33 +881,50 @@ class XASDataLibrary(SimpleDB):
     def set_spectrum_rating(self, person_id, spectrum_id, score, comments=None):
         """add a score to a spectrum: person_id, spectrum_id, score, comment
         score is an integer value 0 to 5"""
-        if comments is not None:
+        if comments is None:
             comments = ''
-        valss = {'score': valid_score(score),
-                 'datetime': datetime.now(),
-                 'comments': comments}
+        vals = {'score': valid_score(score),
+                'datetime': datetime.now(),
+                'comments': comments}
         where = {'spectrum_id': spectrum_id, 'person_id': person_id}
 
-
-        row = self.get_rows('spectrum_rating', where=where, none_if_empty=True)
-        if rows is None:
-            vals.update(where)
-            self.add_row('spectrum_rating', **vals)
-        else:
-            self.update('spectrum_rating', where=where, **vals)
-
-        # recompute average rating for spectrum
-        sum = 0.0
-        for row in self.get_rows('suite_rating', where={'spectrum_id': spectrum_id}):
-            sum += 1.0*float(row.score)
-
-        rating = 'No ratings'
-        if len(rows) > 0:
-            rating = '%.1f (%d ratings)' % (sum/len(rows), len(rows))
-        self.update('spectrum', where=where, rating_summary=rating)
-
-
-    def add_spectrum(self, name, description=None, notes='', d_spacing=-1,
+        with self.transaction():
+            rows = self.get_rows('spectrum_rating', where=dict(where),
+                                 none_if_empty=True)
+            if rows is None:
+                vals.update(where)
+                self.add_row('spectrum_rating', **vals)
+            else:
+                self.update('spectrum_rating', where=dict(where), **vals)
+            self.update_spectrum_ratings(spectrum_id)
+
+    def update_spectrum_ratings(self, spectrum_id=None):
+        """recompute average rating and rating summary for one spectrum,
+        or for all spectra if spectrum_id is None"""
+        rtab = self.tables['spectrum_rating']
+        query = select(rtab.c.spectrum_id, func.avg(rtab.c.score),
+                       func.count(rtab.c.score)).group_by(rtab.c.spectrum_id)
+        if spectrum_id is not None:
+            query = query.where(rtab.c.spectrum_id==spectrum_id)
+        with self.transaction():
+            ratings = {row[0]: (row[1], row[2])
+                       for row in self.execute(query).fetchall()}
+            if spectrum_id is None:
+                spectrum_ids = [row.id for row in self.get_rows('spectrum',
+                                                                columns=('id',))]
+            else:
+                spectrum_ids = [spectrum_id]
+            for sid in spectrum_ids:
+                rating, summary = None, 'No ratings'
+                if sid in ratings:
+                    rating, count = ratings[sid]
+                    rating = float(rating)
+                    summary = '%.1f (%d ratings)' % (rating, count)
+                self.update('spectrum', where={'id': sid}, rating=rating,
+                            rating_summary=summary)
+
+
+    def spectrum_row(self, name, description=None, notes='', d_spacing=-1,
                      energy_units=None, edge='K', element=None,
                      mode='transmission', reference_sample='none',
                      reference_mode='transmission', temperature=None,
@@ -369,14 +935,11 @@ class XASDataLibrary(SimpleDB):
                      itrans_notes='', ifluor_notes='', irefer_notes='',
                      submission_date=None, collection_date=None, person=None,
                      sample=None, beamline=None, citation=None, **kws):
-
-        """add spectrum: name required
-        returns Spectrum instance"""
-        spectrum_names = [s.name for s in self.get_rows('spectrum')]
-
-        if name in spectrum_names:
-            raise ValueError(f"a spectrum named '{name}' already exists")
-
+        """return dict of column values for a new row of the spectrum
+        table, as for add_spectrum(), without adding it.  Arrays may be
+        given already encoded, and energy_ev, content_hash and
+        data_fingerprint may be given to avoid computing them"""
+        from .ingest import spectrum_hashes
         if description is None:
             description = name
         dlocal = locals()
@@ -388,13 +951,8 @@ class XASDataLibrary(SimpleDB):
             kws[attr] = dlocal.get(attr, '')
 
         # arrays
-        for attr in ('energy', 'i0', 'itrans', 'ifluor', 'irefer',
-                     'energy_stderr', 'i0_stderr', 'itrans_stderr',
-                     'ifluor_stderr', 'irefer_stderr'):
-            val = ''
-            if dlocal[attr] is not None:
-                val = json_encode(dlocal.get(attr, ''))
-            kws[attr] = val
+        for attr in SPECTRUM_ARRAYS:
+            kws[attr] = encode_array(dlocal.get(attr, None))
 
         # simple pointers
         for attr in ('person', 'sample', 'citation'):
@@ -416,24 +974,235 @@ class XASDataLibrary(SimpleDB):
 
         # more complicated foreign keys, pointers to other tables
 
-        bline = self.guess_beamline(beamline)
-        if bline is not None:
-            kws['beamline_id'] = bline.id
+        bline = None if beamline is None else self.guess_beamline(beamline)
+        kws['beamline_id'] = None if bline is None else bline.id
 
         if bline is None:
             print("Add Spectrum : No beamline found = ",name,  beamline)
 
         kws['edge_id'] = self.get_edge(edge).id
-        kws['mode_id'] = self.lookup('mode', name=mode)[0].id
+        kws['mode_id'] = self.get_mode(mode).id
         if irefer is None:
             reference_mode = 'none'
         try:
-            kws['reference_mode_id'] = self.lookup('reference_mode', name=reference_mode)[0].id
+            kws['reference_mode_id'] = self.get_reference_mode(reference_mode).id
         except:
             kws['reference_mode_id'] = 0
         kws['element_z'] = self.get_element(element).z
-        kws['energy_units_id'] = self.lookup('energy_units', name=energy_units)[0].id
-        return self.add_row('spectrum',   **kws)
+        eunits = self.get_energy_units(energy_units)
+        kws['energy_units_id'] = eunits.id
+        if 'energy_ev' not in self.tables['spectrum'].c:
+            kws.pop('energy_ev', None)
+        elif 'energy_ev' not in kws:
+            energy = decode_array(kws['energy'])
+            kws['energy_ev'] = encode_array(energy_to_ev(energy, eunits.units,
+                                                         d_spacing))
+        else:
+            kws['energy_ev'] = encode_array(kws['energy_ev'])
+        if 'data_fingerprint' not in self.tables['spectrum'].c:
+            kws.pop('content_hash', None)
+            kws.pop('data_fingerprint', None)
+        elif 'content_hash' not in kws or 'data_fingerprint' not in kws:
+            arrays = {name: kws[name] for name in SPECTRUM_ARRAYS}
+            if kws.get('energy_ev', None) is not None:
+                arrays['energy'] = kws['energy_ev']
+            arrays = SpectrumArrays(mode=self.get_mode(mode).name, **arrays)
+            hashes = spectrum_hashes(decode_text(kws.get('filetext', None)), arrays)
+            kws.setdefault('content_hash', hashes[0])
+            kws.setdefault('data_fingerprint', hashes[1])
+        if 'filetext' in kws:
+            kws.update(self.filetext_columns(kws['filetext'],
+                                             header=kws.pop('fileheader', None)))
+        if 'modify_date' in self.tables['spectrum'].c:
+            kws['modify_date'] = datetime.now()
+        return kws
+
+    def filetext_columns(self, filetext, header=None):
+        """return dict of spectrum column values for file text: filetext
+        compressed with FILETEXT_COMPRESSION (see encode_text), and its
+        header (see text_header) as fileheader, or plain filetext for
+        libraries without a fileheader column.  filetext may be given
+        already encoded, and header to avoid finding it again"""
+        if 'fileheader' not in self.tables['spectrum'].c:
+            return {'filetext': decode_text(filetext)}
+        if header is None:
+            header = text_header(decode_text(filetext))
+        return {'filetext': encode_text(filetext, compress=FILETEXT_COMPRESSION),
+                'fileheader': header}
+
+    def get_filetext(self, spectrum_id):
+        "return file text of a spectrum, or None"
+        row = self.get_spectrum(spectrum_id, columns=('filetext',))
+        return None if row is None else decode_text(row.filetext)
+
+    def get_fileheader(self, spectrum_id):
+        """return header of the file text of a spectrum, without reading
+        the full file text where the header is stored, or None"""
+        if 'fileheader' in self.tables['spectrum'].c:
+            row = self.get_spectrum(spectrum_id, columns=('fileheader',))
+            if row is not None and row.fileheader is not None:
+                return row.fileheader
+        return text_header(self.get_filetext(spectrum_id))
+
+    def convert_filetext(self, compress=None):
+        """compress the file text of existing spectra (see encode_text),
+        and store their headers as fileheader.
+
+        For PostgreSQL, the filetext column is first changed to 'bytea'.
+        Returns the number of spectra converted.
+        """
+        if compress is None:
+            compress = FILETEXT_COMPRESSION
+        tab = self.tables['spectrum']
+        if 'fileheader' not in tab.c:
+            return 0
+        if (self.engine.dialect.name.startswith('postgres') and
+            not isinstance(tab.c.filetext.type, LargeBinary)):
+            self.execute(text("alter table spectrum alter column filetext "
+                              "type bytea using convert_to(filetext, 'UTF8')"))
+            self.refresh_tables()
+            tab = self.tables['spectrum']
+
+        spectrum_ids = [row.id for row in self.get_rows('spectrum', columns=('id',))]
+        nconv = 0
+        for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[i:i+PRODUCT_CHUNK]
+            query = select(tab.c.id, tab.c.filetext,
+                           tab.c.fileheader).where(tab.c.id.in_(chunk))
+            with self.transaction():
+                for row in self.execute(query).fetchall():
+                    val = row.filetext
+                    if isinstance(val, memoryview):
+                        val = val.tobytes()
+                    if val is None or (isinstance(val, bytes) and
+                                       val[:4] == TEXT_MAGIC and
+                                       row.fileheader is not None):
+                        continue
+                    filetext = decode_text(val)
+                    SimpleDB.update(self, 'spectrum', where=row.id,
+                                    filetext=encode_text(filetext, compress=compress),
+                                    fileheader=text_header(filetext))
+                    nconv += 1
+        return nconv
+
+    def add_spectrum(self, name, **kws):
+        """add spectrum: name required, other arguments as for spectrum_row()
+        returns spectrum id"""
+        with self.transaction():
+            if len(self.lookup('spectrum', columns=('id',), name=name)) > 0:
+                raise ValueError(f"a spectrum named '{name}' already exists")
+
+            spectrum_id = self.add_row('spectrum', **self.spectrum_row(name, **kws))
+            self.index_spectra([spectrum_id])
+            self.compute_preedge([spectrum_id])
+            if kws.get('irefer', None) is not None:
+                self.compute_preedge([spectrum_id], refer=True)
+            self.compute_features([spectrum_id])
+            return spectrum_id
+
+    def convert_array_columns(self, compress=True):
+        """convert JSON-encoded array columns of existing spectra
+        to binary arrays (see encode_array).
+
+        For PostgreSQL, the array columns are first changed to 'bytea'.
+        Returns the number of spectra converted.
+        """
+        tab = self.tables['spectrum']
+        cols = [c for c in SPECTRUM_ARRAYS if c in tab.c]
+        if self.engine.dialect.name.startswith('postgres'):
+            for col in cols:
+                if not isinstance(tab.c[col].type, LargeBinary):
+                    self.execute(text(f"alter table spectrum alter column {col} "
+                                      f"type bytea using convert_to({col}, 'UTF8')"))
+            self.refresh_tables()
+            tab = self.tables['spectrum']
+
+        nconv = 0
+        query = select(tab.c.id, *[tab.c[col] for col in cols])
+        for row in self.execute(query).fetchall():
+            kws = {}
+            for col in cols:
+                val = getattr(row, col)
+                if isinstance(val, memoryview):
+                    val = val.tobytes()
+                if val is None or (isinstance(val, bytes) and
+                                   val[:4] == ARRAY_MAGIC):
+                    continue
+                kws[col] = encode_array(decode_array(val), compress=compress)
+            if len(kws) > 0:
+                self.update('spectrum', where=row.id, **kws)
+                nconv += 1
+        return nconv
+
+    def upgrade_schema(self):
+        """bring a library made with an older version up to date:
+        add missing tables and columns (see creator.ADDED_TABLES and
+        creator.ADDED_COLUMNS) and fill them in, then add any missing
+        indexes and the full text search index.
+
+        Returns list of names of tables, columns and indexes added.
+        """
+        from .creator import ADDED_TABLES, ADDED_COLUMNS, create_search_index
+        inspector = inspect(self.engine)
+        added = []
+        for tname, maketable in ADDED_TABLES:
+            if tname in self.tables:
+                continue
+            maketable(self.metadata).create(bind=self.engine)
+            added.append(tname)
+
+        for tname, colname, coltype in ADDED_COLUMNS:
+            current = [col['name'] for col in inspector.get_columns(tname)]
+            if colname in current:
+                continue
+            ctype = coltype().compile(dialect=self.engine.dialect)
+            self.execute(text(f"alter table {tname} add column {colname} {ctype}"))
+            added.append(f"{tname}.{colname}")
+
+        if len(added) > 0:
+            self.refresh_tables()
+        if 'spectrum.energy_ev' in added:
+            self.clear_products(self.set_energy_ev())
+        if 'spectrum_product' in added:
+            self.compute_preedge()
+            self.compute_preedge(refer=True)
+        if 'spectrum.rating' in added:
+            self.update_spectrum_ratings()
+        if 'spectrum.data_fingerprint' in added:
+            self.set_hashes()
+        if 'spectrum.fileheader' in added:
+            self.convert_filetext()
+        added.extend(self.ensure_indexes())
+
+        if not self.has_search_index():
+            with self.engine.begin() as conn:
+                made = create_search_index(conn, self.engine.dialect.name)
+            if made:
+                self.refresh_tables()
+                self.index_spectra()
+                added.append('spectrum_fts')
+        return added
+
+    def ensure_indexes(self):
+        """create any missing secondary indexes (see creator.INDEXES),
+        for upgrading existing libraries.  Indexes that already exist,
+        by name or by the same columns, are left alone.
+
+        Returns list of names of the indexes created.
+        """
+        from .creator import make_indexes
+        inspector = inspect(self.engine)
+        created = []
+        for index in make_indexes(self.tables):
+            tname = index.table.name
+            colnames = [c.name for c in index.columns]
+            current = inspector.get_indexes(tname)
+            if any((ix['name'] == index.name or
+                    list(ix['column_names']) == colnames) for ix in current):
+                continue
+            index.create(bind=self.engine)
+            created.append(index.name)
+        return created
 
     def get_beamlines(self, facility=None, order_by='id'):
         """get all beamlines for a facility
@@ -489,7 +1258,14 @@ class XASDataLibrary(SimpleDB):
 
 
     def guess_beamline(self, name, facility=None):
-        """return best guess of beamline by name"""
+        """return best guess of beamline by name, remembering guesses
+        until the beamline or facility tables are written"""
+        key = (name, facility)
+        if key not in self._blguess:
+            self._blguess[key] = self._guess_beamline(name, facility=facility)
+        return self._blguess[key]
+
+    def _guess_beamline(self, name, facility=None):
         bline = self.get_rows('beamline', where={'name':name}, none_if_empty=True, limit_one=True)
         if bline is not None:
             return bline
@@ -537,29 +1313,158 @@ class XASDataLibrary(SimpleDB):
             sid = spectrum
         return self.lookup('spectrum_rating', spectrum_id=sid)
 
-    def get_spectrum(self, spectrum_id):
+    def get_spectrum(self, spectrum_id, columns=None, exclude=None):
+        """return spectrum by id, optionally selecting only some columns"""
         return self.get_rows('spectrum', where={'id':spectrum_id},
+                             columns=columns, exclude=exclude,
                              limit_one=True, none_if_empty=True)
 
 
     def get_spectrum_mode(self, spectrum_id):
         """return name of mode for a spectrum"""
-        spect = self.get_spectrum(spectrum_id)
+        spect = self.get_spectrum(spectrum_id, columns=('mode_id',))
         if spect is not None:
-            mode_id = spect.mode_id
-            return self.lookup('mode', id=mode_id)[0].name
+            return self.get_mode(spect.mode_id).name
 
     def get_spectrum_refmode(self, spectrum_id):
         """return name of refernce mode for a spectrum"""
-        spect = self.get_spectrum(spectrum_id)
+        spect = self.get_spectrum(spectrum_id, columns=('reference_mode_id',))
         if spect is not None:
-            mode_id = spect.reference_mode_id
-            return self.lookup('reference_mode', id=mode_id)[0].name
+            return self.get_reference_mode(spect.reference_mode_id).name
+
+    def row_arrays(self, row):
+        """return SpectrumArrays for a row of the spectrum table, with
+        mode_id, reference_mode_id, and the array columns"""
+        mode = self.get_refrow('mode', row.mode_id)
+        refmode = self.get_refrow('reference_mode', row.reference_mode_id)
+        return SpectrumArrays.from_row(row, mode=getattr(mode, 'name', ''),
+                                       refmode=getattr(refmode, 'name', 'none'))
+
+    def array_columns(self):
+        """return names of the columns of the spectrum table used by
+        row_arrays()"""
+        cols = ('id', 'mode_id', 'reference_mode_id') + SPECTRUM_ARRAYS
+        if 'energy_ev' in self.tables['spectrum'].c:
+            cols = cols + ('energy_ev',)
+        return cols
+
+    def set_energy_ev(self, spectrum_ids=None):
+        """store energies in eV (see energy_to_ev) as energy_ev for spectra
+        [None, all spectra], from their energy, energy units and d-spacing.
+
+        Returns list of ids of spectra with energy not in eV.
+        """
+        spec = self.tables['spectrum']
+        if 'energy_ev' not in spec.c:
+            return []
+        if spectrum_ids is None:
+            spectrum_ids = [row.id for row in self.get_rows('spectrum', columns=('id',))]
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        cols = [spec.c.id, spec.c.energy, spec.c.energy_units_id, spec.c.d_spacing]
+        converted = []
+        with self.transaction():
+            for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+                query = select(*cols).where(spec.c.id.in_(spectrum_ids[i:i+PRODUCT_CHUNK]))
+                for row in self.execute(query).fetchall():
+                    units = getattr(self.get_refrow('energy_units', row.energy_units_id),
+                                    'units', 'eV')
+                    energy = energy_to_ev(decode_array(row.energy), units,
+                                          row.d_spacing)
+                    SimpleDB.update(self, 'spectrum', where=row.id,
+                                    energy_ev=encode_array(energy))
+                    if not units.lower().startswith('ev'):
+                        converted.append(row.id)
+        return converted
+
+    def set_hashes(self, spectrum_ids=None):
+        """store content hashes and data fingerprints (see spectrum_hashes)
+        for spectra [None, all spectra]"""
+        from .ingest import spectrum_hashes
+        spec = self.tables['spectrum']
+        if 'data_fingerprint' not in spec.c:
+            return
+        if spectrum_ids is None:
+            spectrum_ids = [row.id for row in self.get_rows('spectrum', columns=('id',))]
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        cols = [spec.c[c] for c in self.array_columns() + ('filetext',)]
+        with self.transaction():
+            for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+                query = select(*cols).where(spec.c.id.in_(spectrum_ids[i:i+PRODUCT_CHUNK]))
+                for row in self.execute(query).fetchall():
+                    chash, fingerprint = spectrum_hashes(decode_text(row.filetext),
+                                                         self.row_arrays(row))
+                    SimpleDB.update(self, 'spectrum', where=row.id,
+                                    content_hash=chash,
+                                    data_fingerprint=fingerprint)
+
+    def find_duplicates(self, hashes):
+        """find spectra in the library with the same content hash or data
+        fingerprint, for a list of (content_hash, data_fingerprint).
+
+        Returns list of dicts of 'id' and 'name' of the spectrum and
+        'match' ('file' for the same file text, or 'data' for the same
+        data), or None for no match, in the order given.  Lookups use
+        the indexes on both columns, in chunks of PRODUCT_CHUNK.
+        """
+        out = [None]*len(hashes)
+        spec = self.tables['spectrum']
+        if 'data_fingerprint' not in spec.c:
+            return out
+        cols = (spec.c.id, spec.c.name, spec.c.content_hash,
+                spec.c.data_fingerprint)
+        for match, col, index in (('file', spec.c.content_hash, 0),
+                                  ('data', spec.c.data_fingerprint, 1)):
+            keys = list(set(h[index] for h in hashes if h[index] is not None))
+            found = {}
+            for i in range(0, len(keys), PRODUCT_CHUNK):
+                query = select(*cols).where(col.in_(keys[i:i+PRODUCT_CHUNK]))
+                for row in self.execute(query).fetchall():
+                    key = row.content_hash if index == 0 else row.data_fingerprint
+                    if key not in found or row.id < found[key]['id']:
+                        found[key] = {'id': row.id, 'name': row.name, 'match': match}
+            for i, h in enumerate(hashes):
+                if out[i] is None and h[index] in found:
+                    out[i] = found[h[index]]
+        return out
+
+    def find_duplicate(self, content_hash=None, data_fingerprint=None):
+        """find a spectrum with the same content hash or data fingerprint,
+        returning dict as for find_duplicates(), or None"""
+        return self.find_duplicates([(content_hash, data_fingerprint)])[0]
+
+    def get_spectrum_arrays(self, spectrum_id):
+        """return SpectrumArrays for a spectrum, or None if not found.
+
+        The last ARRAYS_CACHE_SIZE spectra used are kept in memory, and
+        reused until the modify_date of the spectrum changes.
+        """
+        spectrum_id = int(spectrum_id)
+        spec = self.tables['spectrum']
+        cols = [spec.c.id]
+        if 'modify_date' in spec.c:
+            cols.append(spec.c.modify_date)
+        row = self.execute(select(*cols).where(spec.c.id == spectrum_id)).fetchone()
+        if row is None:
+            self._arrays.pop(spectrum_id, None)
+            return None
+        stamp = getattr(row, 'modify_date', None)
+        cached = self._arrays.get(spectrum_id, None)
+        if cached is not None and cached[0] == stamp:
+            self._arrays.move_to_end(spectrum_id)
+            return cached[1]
+
+        row = self.get_spectrum(spectrum_id, columns=self.array_columns())
+        arrays = self.row_arrays(row)
+        self._arrays[spectrum_id] = (stamp, arrays)
+        self._arrays.move_to_end(spectrum_id)
+        while len(self._arrays) > ARRAYS_CACHE_SIZE:
+            self._arrays.popitem(last=False)
+        return arrays
 
     def get_spectrum_beamline(self, spectrum_id):
         "return id, desc for beamline for aa spectrum"
         blid, desc  = -1, 'unknown'
-        spect = self.get_spectrum(spectrum_id)
+        spect = self.get_spectrum(spectrum_id, columns=('beamline_id', 'notes'))
         if spect is not None:
             bl = self.lookup('beamline', id=spect.beamline_id)[0]
             if bl is not None:
@@ -574,213 +1479,1367 @@ class XASDataLibrary(SimpleDB):
 
     # done through here, I think
 
-    def get_spectra(self, edge=None, element=None, beamline=None,
-                    person=None, mode=None, facility=None,
-                    # sample=None, suite=None, citation=None, ligand=None,
-                    order_by='id'):
-        """get all spectra matching some set of criteria
+    def has_products(self):
+        "whether the library has a table of stored spectrum products"
+        return 'spectrum_product' in self.tables
+
+    def clear_products(self, spectrum_ids=None, kind=None, param_hash=None):
+        """delete stored products for spectra (all spectra if spectrum_ids
+        is None), optionally only of one kind and parameter hash.
+        Clearing products of all kinds also drops the similarity indexes
+        and PCA results"""
+        if kind is None:
+            self._simindex = {}
+            self._pca = {}
+        if not self.has_products():
+            return
+        tab = self.tables['spectrum_product']
+        clauses = []
+        if kind is not None:
+            clauses.append(tab.c.kind == kind)
+        if param_hash is not None:
+            clauses.append(tab.c.param_hash == param_hash)
+        if spectrum_ids is None:
+            self.delete_rows('spectrum_product', and_(True, *clauses))
+            return
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[i:i+PRODUCT_CHUNK]
+            self.delete_rows('spectrum_product',
+                             and_(tab.c.spectrum_id.in_(chunk), *clauses))
+
+    def get_products(self, spectrum_ids, kind, param_hash):
+        """return stored products of one kind and parameter hash for
+        spectra, as dict of {spectrum_id: row}"""
+        out = {}
+        if not self.has_products():
+            return out
+        tab = self.tables['spectrum_product']
+        cols = (tab.c.spectrum_id, tab.c.result, tab.c.xdata, tab.c.ydata)
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[i:i+PRODUCT_CHUNK]
+            query = select(*cols).where(and_(tab.c.spectrum_id.in_(chunk),
+                                             tab.c.kind == kind,
+                                             tab.c.param_hash == param_hash))
+            for row in self.execute(query).fetchall():
+                out[row.spectrum_id] = row
+        return out
 
-        Parameters
+    def store_products(self, kind, params, rows):
+        """store products of one kind, made with a dict of parameters, for
+        spectra, replacing any stored with the same parameters.  rows is a
+        list of dicts with 'spectrum_id', 'result', 'xdata', and 'ydata'"""
+        if not self.has_products() or len(rows) == 0:
+            return
+        phash = hash_params(params)
+        ptext = json.dumps(params)
+        now = datetime.now()
+        for row in rows:
+            row.update({'kind': kind, 'param_hash': phash, 'params': ptext,
+                        'create_date': now})
+        with self.transaction():
+            self.clear_products([row['spectrum_id'] for row in rows],
+                                kind=kind, param_hash=phash)
+            self.add_rows('spectrum_product', rows, return_ids=False)
+
+    def compute_preedge(self, spectrum_ids=None, refer=False, **params):
+        """run pre-edge subtraction and normalization with larch's
+        preedge() for many spectra (see preedge_products), for mu(E) of
+        the data or, with refer=True, of the reference channel, and store
+        the results in the spectrum_product table.
+
+        Arguments
         ----------
-        edge       by Name
-        element    by Z, Symbol, or Name
-        person     by email
-        beamline   by name
-        facility
-        mode
-        # sample
-        # citation
-        # ligand
-        # suite
-        """
-        where = {}
-        def getval(row, key='id', default=None):
-            if row is None:
-                return default
-            return getattr(row, key, default)
+        spectrum_ids  list of spectrum ids [None, all spectra]
+        refer         whether to use the reference channel [False]
+        params        parameters for preedge(), see PREEDGE_PARAMS
 
-        # edge
-        if edge is not None:
-            where['edge_id'] = getval(self.get_edge(edge))
+        Returns
+        -------
+        dict of {spectrum_id: result}, as for get_preedges(), leaving
+        out spectra without usable arrays or that cannot be normalized.
+        """
+        kind = 'preedge_refer' if refer else 'preedge'
+        params = preedge_params(**params)
+        if spectrum_ids is None:
+            spectrum_ids = [row.id for row in self.get_rows('spectrum', columns=('id',))]
+        spectrum_ids = [int(i) for i in spectrum_ids]
+
+        spec = self.tables['spectrum']
+        cols = [spec.c.id, spec.c.mode_id, spec.c.reference_mode_id]
+        cols.extend([spec.c[c] for c in ('energy', 'i0', 'itrans', 'ifluor', 'irefer')])
+        if 'energy_ev' in spec.c:
+            cols.append(spec.c.energy_ev)
+        results = {}
+        for ichunk in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[ichunk:ichunk+PRODUCT_CHUNK]
+            ids, energies, mus = [], [], []
+            query = select(*cols).where(spec.c.id.in_(chunk))
+            for row in self.execute(query).fetchall():
+                arrays = self.row_arrays(row)
+                try:
+                    valid = arrays.valid(refer=refer)
+                except (TypeError, ValueError):
+                    continue
+                if valid is None or valid.sum() < 3:
+                    continue
+                mu = arrays.mu_refer() if refer else arrays.mu()
+                ids.append(row.id)
+                energies.append(arrays.energy[valid])
+                mus.append(mu[valid])
+            if len(ids) == 0:
+                continue
 
-        # element
-        if element is not None:
-            where['element_z'] = getval(self.get_element(element), key='z')
+            rows = []
+            for spid, result in zip(ids, preedge_products(energies, mus, **params)):
+                if result is None:
+                    continue
+                row = preedge_row(result)
+                row['spectrum_id'] = spid
+                rows.append(row)
+                results[spid] = result
+            self.store_products(kind, params, rows)
+        return results
 
-        # beamline
-        if beamline is not None:
-            where['beamline_id'] = getval(self.get_beamline(name=beamline))
+    def get_preedges(self, spectrum_ids, refer=False, **params):
+        """return results of pre-edge subtraction and normalization for
+        spectra, using stored results where available, and computing and
+        storing the others with compute_preedge().
 
-        # person
-        if person is not None:
-            where['person_id'] = getval(self.get_person(person))
+        Returns dict of {spectrum_id: result}, with result a dict with
+        'e0', 'edge_step', 'precoefs', 'norm_coefs', the fit ranges, and
+        arrays 'energy' and 'norm'.  Spectra without usable arrays are
+        left out.
+        """
+        kind = 'preedge_refer' if refer else 'preedge'
+        params = preedge_params(**params)
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        results = {}
+        stored = self.get_products(spectrum_ids, kind, hash_params(params))
+        for spid, row in stored.items():
+            result = json.loads(row.result)
+            result['energy'] = decode_array(row.xdata)
+            result['norm'] = decode_array(row.ydata)
+            results[spid] = result
+
+        missing = [i for i in spectrum_ids if i not in results]
+        if len(missing) > 0:
+            results.update(self.compute_preedge(missing, refer=refer, **params))
+        return results
 
-        # mode
-        if mode is not None:
-            where['mode_id'] = getval(self.get_mode(mode))
+    def get_preedge(self, spectrum_id, refer=False, **params):
+        """return results of pre-edge subtraction and normalization for
+        a spectrum, as for get_preedges(), or None for a spectrum without
+        usable arrays"""
+        out = self.get_preedges([spectrum_id], refer=refer, **params)
+        return out.get(int(spectrum_id), None)
 
-        results = self.get_rows('spectrum', where=where, order_by=order_by)
+    def compute_exafs(self, spectrum_ids, **params):
+        """run EXAFS background subtraction (see xafs_autobk.autobk) and
+        Fourier transforms of chi(k) for spectra, from their normalized
+        mu(E), and store chi(k) and |chi(R)| in the spectrum_product table.
 
-        # facility filter is post-query
-        if facility is not None:
-            bl_ids = [bl.id for bl in self.get_beamlines(facility=facility)]
-            results = [row for row in results if row.beamline_id in bl_ids]
+        Arguments
+        ----------
+        spectrum_ids  list of spectrum ids
+        params        parameters for autobk and the Fourier transform,
+                      see EXAFS_PARAMS
 
+        Returns
+        -------
+        dict of {spectrum_id: result}, as for get_chis(), leaving out
+        spectra with too short a range of data for EXAFS.
+        """
+        params = exafs_params(**params)
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        results = {}
+        for ichunk in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[ichunk:ichunk+PRODUCT_CHUNK]
+            krows, rrows = [], []
+            for spid, group in self.get_preedges(chunk).items():
+                try:
+                    with np.errstate(all='ignore'):
+                        bkg = autobk(group['energy'], group['norm'], group['e0'],
+                                     rbkg=params['rbkg'], kmin=params['kmin'],
+                                     kmax=params['kmax'], kweight=params['kweight'],
+                                     kstep=params['kstep'])
+                except ValueError:
+                    continue
+                if not np.all(np.isfinite(bkg['chi'])):
+                    continue
+                ft_kmax = bkg['kmax']
+                if params['ft_kmax'] is not None:
+                    ft_kmax = min(ft_kmax, params['ft_kmax'])
+                rval, chir = xftf(bkg['k'], bkg['chi'], kmin=params['ft_kmin'],
+                                  kmax=ft_kmax, dk=params['ft_dk'],
+                                  kweight=params['ft_kweight'], rmax=params['rmax'])
+                chir_mag = np.abs(chir)
+                result = {'e0': group['e0'], 'kmax': float(bkg['kmax']),
+                          'nspl': bkg['nspl'], 'ft_kmax': float(ft_kmax)}
+                rtext = json.dumps(result)
+                krows.append({'spectrum_id': spid, 'result': rtext,
+                              'xdata': encode_array(bkg['k']),
+                              'ydata': encode_array(bkg['chi'])})
+                rrows.append({'spectrum_id': spid, 'result': rtext,
+                              'xdata': encode_array(rval),
+                              'ydata': encode_array(chir_mag)})
+                result.update({'k': bkg['k'], 'chi': bkg['chi'], 'r': rval,
+                               'chir_mag': chir_mag})
+                results[spid] = result
+            self.store_products('chik', params, krows)
+            self.store_products('chir', params, rrows)
         return results
 
+    def get_chis(self, spectrum_ids, **params):
+        """return EXAFS chi(k) and |chi(R)| for spectra, using stored
+        results where available, and computing and storing the others with
+        compute_exafs().
 
-    def add_xdifile(self, fname, spectrum_name=None, description=None,
-                    person=None, reuse_sample=True, mode=None, commit=True,
-                    verbose=False, **kws):
+        Returns dict of {spectrum_id: result}, with result a dict with
+        'e0', 'kmax', 'nspl', 'ft_kmax', and arrays 'k', 'chi', 'r', and
+        'chir_mag'.  Spectra with too short a range of data for EXAFS are
+        left out.
+        """
+        params = exafs_params(**params)
+        phash = hash_params(params)
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        results = {}
+        chik = self.get_products(spectrum_ids, 'chik', phash)
+        chir = self.get_products(list(chik.keys()), 'chir', phash)
+        for spid, row in chir.items():
+            result = json.loads(row.result)
+            result['k'] = decode_array(chik[spid].xdata)
+            result['chi'] = decode_array(chik[spid].ydata)
+            result['r'] = decode_array(row.xdata)
+            result['chir_mag'] = decode_array(row.ydata)
+            results[spid] = result
+
+        missing = [i for i in spectrum_ids if i not in results]
+        if len(missing) > 0:
+            results.update(self.compute_exafs(missing, **params))
+        return results
 
-        try:
-            fh  = open(fname, 'r')
-            filetext  = fh.read()
-        except:
-            filetext = ''
-        finally:
-            fh.close()
+    def get_chi(self, spectrum_id, **params):
+        """return EXAFS chi(k) and |chi(R)| for a spectrum, as for
+        get_chis(), or None for a spectrum with too short a range of data
+        for EXAFS"""
+        out = self.get_chis([spectrum_id], **params)
+        return out.get(int(spectrum_id), None)
 
-        xfile = XDIFile(fname)
-        try:
-            afile = read_ascii(fname)
-        except:
-            afile = None
+    def energy_grid(self, element, edge='K'):
+        """return e0-relative energy grid for resampling spectra of an
+        element and edge.  This is the RESAMPLE_GRID range, narrowed to the
+        range covered by GRID_COVERAGE of the spectra in the library, with
+        their median energy step near the edge (between 0.1 and 1 eV).
 
-        path, fname = os.path.split(fname)
-        now = isotime()
+        Grids are cached until spectra are added, changed, or deleted.
+        """
+        elem = self.get_element(element)
+        edge = self.get_edge(edge)
+        if elem is None or edge is None:
+            raise ValueError(f"unknown element or edge: {element}, {edge}")
+        key = (elem.z, edge.id)
+        if key in self._grids:
+            return self._grids[key]
+
+        emin, emax = RESAMPLE_GRID['emin'], RESAMPLE_GRID['emax']
+        estep = RESAMPLE_GRID['estep']
+        rows = self.get_rows('spectrum', where={'element_z': elem.z,
+                                                'edge_id': edge.id},
+                             columns=('id',))
+        ids = [row.id for row in rows]
+        lo, hi, steps = [], [], []
+        for i in range(0, len(ids), PRODUCT_CHUNK):
+            for group in self.get_preedges(ids[i:i+PRODUCT_CHUNK]).values():
+                energy = group['energy'] - group['e0']
+                lo.append(energy[0])
+                hi.append(energy[-1])
+                near = energy[(energy > -20) & (energy < 30)]
+                if len(near) > 1:
+                    steps.append(np.median(np.diff(near)))
+        if len(lo) > 0:
+            gmin = max(emin, np.quantile(lo, GRID_COVERAGE))
+            gmax = min(emax, np.quantile(hi, 1-GRID_COVERAGE))
+            if gmax > gmin:
+                emin, emax = gmin, gmax
+            if len(steps) > 0:
+                estep = min(1.0, max(0.1, round(np.median(steps), 2)))
+        grid = make_grid(emin, emax, estep)
+        self._grids[key] = grid
+        return grid
+
+    def resample(self, spectrum_ids, grid=None, kind='linear', out=None,
+                 **params):
+        """put normalized mu(E) for many spectra onto one e0-relative
+        energy grid, as rows of one dense array, for comparing spectra.
+
+        Arguments
+        ----------
+        spectrum_ids  list of spectrum ids
+        grid          e0-relative energies, as an array or tuple of
+                      (emin, emax, estep), or None to use energy_grid()
+                      for the element and edge of most of the spectra [None]
+        kind          'linear' or 'cubic' interpolation ['linear']
+        out           None for a new array, an array to fill, or the name
+                      of a .npy file to create as a memory-mapped array [None]
+        params        parameters for pre-edge subtraction, see PREEDGE_PARAMS
 
-        if spectrum_name is None:
-            spectrum_name = fname
-        if spectrum_name.endswith('.xdi'):
-            spectrum_name = spectrum_name[:-4]
+        Returns
+        -------
+        dict with 'grid' (e0-relative energies), 'e0' (array of e0 for
+        each spectrum), and 'data' (2-D array, one row per spectrum, in
+        the order given).  Rows for spectra without usable arrays and
+        points outside the energy range of a spectrum are NaN.
+        """
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        if grid is None:
+            spec = self.tables['spectrum']
+            rows = self.get_rows('spectrum', columns=('element_z', 'edge_id'),
+                                 where=spec.c.id.in_(spectrum_ids[:PRODUCT_CHUNK]))
+            counts = {}
+            for row in rows:
+                key = (row.element_z, row.edge_id)
+                counts[key] = counts.get(key, 0) + 1
+            if len(counts) == 0:
+                raise ValueError("resample: no spectra found")
+            element_z, edge_id = max(counts, key=counts.get)
+            grid = self.energy_grid(element_z, edge_id)
+        elif isinstance(grid, tuple):
+            grid = make_grid(*grid)
+        grid = np.asarray(grid, dtype=np.float64)
+
+        shape = (len(spectrum_ids), len(grid))
+        if out is None:
+            out = np.empty(shape)
+        elif isinstance(out, str):
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=np.float64,
+                                            shape=shape)
+        elif out.shape != shape:
+            raise ValueError(f"resample: out must have shape {shape}")
+
+        e0 = np.full(len(spectrum_ids), np.nan)
+        for i in range(0, len(spectrum_ids), PRODUCT_CHUNK):
+            chunk = spectrum_ids[i:i+PRODUCT_CHUNK]
+            out[i:i+len(chunk)] = np.nan
+            groups = self.get_preedges(chunk, **params)
+            found = [j for j, spid in enumerate(chunk) if spid in groups]
+            if len(found) == 0:
+                continue
+            found_groups = [groups[chunk[j]] for j in found]
+            rows = i + np.array(found)
+            e0[rows] = [g['e0'] for g in found_groups]
+            out[rows] = interp_rows([g['energy'] - g['e0'] for g in found_groups],
+                                    [g['norm'] for g in found_groups],
+                                    grid, kind=kind)
+        return {'grid': grid, 'e0': e0, 'data': out}
+
+    def compute_features(self, spectrum_ids):
+        """compute XANES feature vectors for spectra, as normalized mu(E)
+        on the FEATURE_GRID of e0-relative energies, and store them in the
+        spectrum_product table.
+
+        Returns dict of {spectrum_id: feature vector}, leaving out spectra
+        without usable arrays.
+        """
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        out = self.resample(spectrum_ids, grid=make_grid(**FEATURE_GRID))
+        data = fill_gaps(out['data'])
+        grid = encode_array(out['grid'])
+        results, rows = {}, []
+        for spid, e0, vec in zip(spectrum_ids, out['e0'], data):
+            if not np.all(np.isfinite(vec)):
+                continue
+            results[spid] = vec
+            rows.append({'spectrum_id': spid, 'xdata': grid,
+                         'ydata': encode_array(vec),
+                         'result': json.dumps({'e0': float(e0)})})
+        self.store_products('xanes_features', FEATURE_GRID, rows)
+        return results
 
-        if description is None:
-            description  = spectrum_name
+    def get_features(self, spectrum_ids):
+        """return XANES feature vectors for spectra, using stored
+        vectors where available, and computing and storing the others
+        with compute_features().
 
+        Returns dict of {spectrum_id: feature vector}, leaving out spectra
+        without usable arrays.
+        """
+        spectrum_ids = [int(i) for i in spectrum_ids]
+        stored = self.get_products(spectrum_ids, 'xanes_features',
+                                   hash_params(FEATURE_GRID))
+        results = {spid: decode_array(row.ydata) for spid, row in stored.items()}
+        missing = [i for i in spectrum_ids if i not in results]
+        if len(missing) > 0:
+            results.update(self.compute_features(missing))
+        return results
 
-        all_spect_names = [s.name for s in self.get_rows('spectrum')]
-        spectrum_name = unique_name(spectrum_name, all_spect_names)
+    def edge_stamp(self, element_z, edge_id):
+        """return number of spectra and largest spectrum id for an element
+        and edge, to tell when results cached for them are out of date"""
+        spec = self.tables['spectrum']
+        query = select(func.count(spec.c.id), func.max(spec.c.id))
+        query = query.where(and_(spec.c.element_z == element_z,
+                                 spec.c.edge_id == edge_id))
+        count, maxid = self.execute(query).fetchone()
+        return count, (0 if maxid is None else maxid)
+
+    def similarity_index(self, element, edge='K'):
+        """return in-memory index of XANES feature vectors for spectra of
+        an element and edge, as a dict with 'ids' and 'features' (one row
+        per spectrum), and 'unit' and 'sqnorm' (unit vectors and squared
+        norms of the rows) for find_similar().
+
+        Spectra added since the index was built are appended to it.
+        It is rebuilt if spectra have been removed.
+        """
+        elem = self.get_element(element)
+        edge = self.get_edge(edge)
+        if elem is None or edge is None:
+            raise ValueError(f"unknown element or edge: {element}, {edge}")
+        key = (elem.z, edge.id)
+        spec = self.tables['spectrum']
+        where = and_(spec.c.element_z == elem.z, spec.c.edge_id == edge.id)
+        count, maxid = self.edge_stamp(elem.z, edge.id)
+
+        index = self._simindex.get(key, None)
+        if index is not None and index['count'] == count and index['maxid'] == maxid:
+            return index
+        if index is None or count < index['count'] or maxid < index['maxid']:
+            npts = len(make_grid(**FEATURE_GRID))
+            index = {'ids': np.zeros(0, dtype=int),
+                     'features': np.zeros((0, npts)),
+                     'unit': np.zeros((0, npts)),
+                     'sqnorm': np.zeros(0), 'maxid': 0}
+
+        query = select(spec.c.id).where(and_(where, spec.c.id > index['maxid']))
+        new_ids = [row.id for row in self.execute(query.order_by(spec.c.id)).fetchall()]
+        features = self.get_features(new_ids)
+        new_ids = [i for i in new_ids if i in features]
+        if len(new_ids) > 0:
+            feats = np.array([features[i] for i in new_ids])
+            sqnorm = (feats*feats).sum(axis=1)
+            unit = feats/np.sqrt(np.where(sqnorm > 0, sqnorm, 1.0))[:, None]
+            index['ids'] = np.concatenate((index['ids'], new_ids))
+            index['features'] = np.vstack((index['features'], feats))
+            index['unit'] = np.vstack((index['unit'], unit))
+            index['sqnorm'] = np.concatenate((index['sqnorm'], sqnorm))
+        index['count'] = count
+        index['maxid'] = maxid
+        self._simindex[key] = index
+        return index
+
+    def find_similar(self, spectrum, k=10, element=None, edge=None,
+                     metric='cosine'):
+        """find the spectra in the library most similar to a spectrum,
+        comparing normalized XANES on the FEATURE_GRID.
+
+        Arguments
+        ----------
+        spectrum  spectrum id, or tuple of (energy, mu) arrays
+        k         number of spectra to return [10]
+        element   element of spectra to search [None, element of spectrum]
+        edge      edge of spectra to search [None, edge of spectrum or 'K']
+        metric    'cosine' (cosine similarity) or 'l2' (distance) ['cosine']
 
-        try:
-            c_date = xfile.attrs['scan']['start_time']
-        except:
-            c_date = 'collection date unknown'
-        d_spacing = xfile.dspacing
-        energy    = xfile.energy
-        edge      = xfile.edge.decode('utf-8')
-        element   = xfile.element.decode('utf-8')
-        comments  = ''
-        if hasattr(xfile, 'comments'):
-            comments = xfile.comments.decode('utf-8')
-        # prefer to get comments from original header, if possible
-        header = getattr(afile, 'header', None)
-        if header is not None:
-            comment_lines = []
-            slashes_found = False
-            for hline in header:
-                hline = hline.strip()
-                if slashes_found:
-                    if hline.startswith('#'):
-                        hline = hline[1:].strip()
-                    if len(hline) > 0:
-                        comment_lines.append(hline)
-                slashes_found = hline.startswith('# //')
-                if hline.startswith('#---'):
-                    break
-            if len(comment_lines) > 0:
-                comments = '\n'.join(comment_lines)
-
-        i0  = getattr(xfile, 'i0', getattr(xfile, 'io', np.ones(len(energy))*1.0))
-
-        itrans = getattr(xfile, 'itrans', getattr(xfile, 'i1', None))
-        ifluor = getattr(xfile, 'ifluor', getattr(xfile, 'if', None))
-        irefer = getattr(xfile, 'irefer', getattr(xfile, 'i2', None))
-
-        if hasattr(xfile, 'mutrans'):
-            itrans = i0 * np.exp(-xfile.mutrans)
-        if hasattr(xfile, 'mufluor'):
-            ifluor = i0 * xfile.mufluor
-
-        if mode is None:
-            mode = 'fluorescence'
-            if itrans is not None:
-                mode = 'transmission'
-        if mode == 'transmission' and itrans is None:
-            raise ValueError("cannot find transmission data")
-        elif mode == 'fluoresence' and ifluor is None:
-            raise ValueError("cannot find fluorescence data")
-
-        reference_mode = 'none' if irefer is None else 'transmission'
-
-        en_units = 'eV'
-        for index, value in xfile.attrs['column'].items():
-            words = value.split()
-            if len(words) > 1:
-                if (value.lower().startswith('energy') or
-                    value.lower().startswith('angle') ):
-                    en_units = words[1]
+        Returns
+        -------
+        list of dicts with 'id', 'name', and 'score', most similar first,
+        leaving out the spectrum itself.
+        """
+        if metric not in ('cosine', 'l2'):
+            raise ValueError("find_similar: metric must be 'cosine' or 'l2'")
+        exclude = None
+        if isinstance(spectrum, (int, np.integer)):
+            row = self.get_spectrum(int(spectrum), columns=('id', 'element_z', 'edge_id'))
+            if row is None:
+                raise ValueError(f"no spectrum #{spectrum} found")
+            element = row.element_z if element is None else element
+            edge = row.edge_id if edge is None else edge
+            exclude = row.id
+            vec = self.get_features([row.id]).get(row.id, None)
+        else:
+            if element is None:
+                raise ValueError("find_similar: element is needed for arrays")
+            energy, mu = spectrum
+            vec, e0 = normalized_on_grid(energy, mu, make_grid(**FEATURE_GRID))
+            vec = fill_gaps(vec[None, :])[0]
+        if edge is None:
+            edge = 'K'
+        if vec is None or not np.all(np.isfinite(vec)):
+            return []
+
+        index = self.similarity_index(element, edge)
+        if metric == 'cosine':
+            score = index['unit'] @ (vec/max(np.sqrt(vec @ vec), 1.e-12))
+            rank = -score
+        else:
+            dist2 = index['sqnorm'] - 2*(index['features'] @ vec) + vec @ vec
+            score = rank = np.sqrt(np.maximum(dist2, 0))
+        if exclude is not None:
+            rank = np.where(index['ids'] == exclude, np.inf, rank)
+        k = min(k, int(np.isfinite(rank).sum()))
+        if k < 1:
+            return []
+        top = np.argpartition(rank, k-1)[:k]
+        top = top[np.argsort(rank[top])]
+
+        ids = [int(index['ids'][i]) for i in top]
+        spec = self.tables['spectrum']
+        names = {row.id: row.name for row in
+                 self.get_rows('spectrum', where=spec.c.id.in_(ids),
+                               columns=('id', 'name'))}
+        return [{'id': spid, 'name': names.get(spid, ''), 'score': float(score[i])}
+                for spid, i in zip(ids, top)]
+
+    def lcf(self, target, candidates=None, max_components=3, element=None,
+            edge=None, grid=None, sum_to_one=False, nbest=20, workers=None):
+        """linear combination fits of a spectrum to spectra of the library,
+        with non-negative weights, for all combinations of up to
+        max_components candidates (see xafs_lcf.lcf_combinations).
+
+        Arguments
+        ----------
+        target          spectrum id, or tuple of (energy, mu) arrays
+        candidates      list of spectrum ids of standards [None, the
+                        LCF_CANDIDATES spectra most similar to target]
+        max_components  largest number of standards in a fit [3]
+        element         element, needed for arrays if candidates is None
+        edge            edge, for arrays if candidates is None ['K']
+        grid            e0-relative energies to fit over, as array or
+                        tuple of (emin, emax, estep) [None, LCF_GRID]
+        sum_to_one      whether weights must add to 1 [False]
+        nbest           number of fits to return [20]
+        workers         number of processes to use [None, this process]
+
+        Returns
+        -------
+        list of dicts with 'ids', 'names', 'weights', 'rss' and 'rfactor',
+        best fit first.  Candidates that do not cover the energy range
+        of the fit or that cannot be normalized (see valid_preedge) are
+        left out, and targets that cannot be normalized have no fits.
+        """
+        if grid is None:
+            grid = make_grid(**LCF_GRID)
+        elif isinstance(grid, tuple):
+            grid = make_grid(*grid)
+        grid = np.asarray(grid, dtype=np.float64)
+
+        exclude = None
+        if isinstance(target, (int, np.integer)):
+            exclude = int(target)
+            if not valid_preedge(self.get_preedge(exclude)):
+                return []
+            ydata = self.resample([exclude], grid=grid)['data'][0]
+        else:
+            ydata = normalized_on_grid(target[0], target[1], grid)[0]
+        if candidates is None:
+            similar = self.find_similar(target, k=LCF_CANDIDATES,
+                                        element=element, edge=edge)
+            candidates = [s['id'] for s in similar]
+        candidates = [int(i) for i in candidates if int(i) != exclude]
+        groups = self.get_preedges(candidates)
+        candidates = [i for i in candidates if valid_preedge(groups.get(i, None))]
+        use = np.isfinite(ydata)
+        if use.sum() < 2 or len(candidates) == 0:
+            return []
+
+        basis = self.resample(candidates, grid=grid[use])['data']
+        good = np.all(np.isfinite(basis), axis=1)
+        candidates = [spid for spid, ok in zip(candidates, good) if ok]
+        fits = lcf_combinations(ydata[use], basis[good],
+                                max_components=max_components,
+                                sum_to_one=sum_to_one, nbest=nbest,
+                                workers=workers)
+        spec = self.tables['spectrum']
+        names = {row.id: row.name for row in
+                 self.get_rows('spectrum', where=spec.c.id.in_(candidates),
+                               columns=('id', 'name'))}
+        for fit in fits:
+            fit['ids'] = [candidates[i] for i in fit.pop('components')]
+            fit['names'] = [names.get(spid, '') for spid in fit['ids']]
+        return fits
+
+    def pca(self, element, edge='K', ncomps=PCA_COMPONENTS):
+        """principal component analysis of normalized XANES for all
+        spectra of an element and edge, on energy_grid(element, edge),
+        fitted from blocks of PRODUCT_CHUNK spectra at a time (see
+        xafs_pca.IncrementalPCA).
+
+        Results are cached: spectra added since are fitted into the
+        cached components, which are recomputed if spectra were removed.
+
+        Returns dict with 'grid', 'mean', 'components' (one row per
+        component), 'explained_variance', 'explained_variance_ratio',
+        'ids', and 'scores' (one row per spectrum, in the order of ids).
+        Spectra that do not cover the grid are left out.
+        """
+        elem = self.get_element(element)
+        edge = self.get_edge(edge)
+        if elem is None or edge is None:
+            raise ValueError(f"unknown element or edge: {element}, {edge}")
+        key = (elem.z, edge.id, ncomps)
+        count, maxid = self.edge_stamp(elem.z, edge.id)
+        cached = self._pca.get(key, None)
+        if cached is not None and cached['count'] == count and cached['maxid'] == maxid:
+            return cached['result']
+        if cached is None or count < cached['count'] or maxid < cached['maxid']:
+            cached = {'model': IncrementalPCA(ncomps=ncomps), 'maxid': 0,
+                      'grid': self.energy_grid(elem.z, edge.id)}
+        model, grid = cached['model'], cached['grid']
+
+        spec = self.tables['spectrum']
+        where = and_(spec.c.element_z == elem.z, spec.c.edge_id == edge.id)
+        query = select(spec.c.id).where(where).order_by(spec.c.id)
+        all_ids = [row.id for row in self.execute(query).fetchall()]
+        new_ids = [i for i in all_ids if i > cached['maxid']]
+        for i in range(0, len(new_ids), PRODUCT_CHUNK):
+            data = fill_gaps(self.resample(new_ids[i:i+PRODUCT_CHUNK], grid=grid)['data'])
+            model.partial_fit(data[np.all(np.isfinite(data), axis=1)])
+
+        ids, scores = [], []
+        if model.nrows > 0:
+            for i in range(0, len(all_ids), PRODUCT_CHUNK):
+                chunk = all_ids[i:i+PRODUCT_CHUNK]
+                data = fill_gaps(self.resample(chunk, grid=grid)['data'])
+                good = np.all(np.isfinite(data), axis=1)
+                ids.extend([spid for spid, ok in zip(chunk, good) if ok])
+                scores.append(model.transform(data[good]))
+            scores = np.vstack(scores)
+            result = {'grid': grid, 'mean': model.mean,
+                      'components': model.components,
+                      'explained_variance': model.explained_variance,
+                      'explained_variance_ratio': model.explained_variance_ratio,
+                      'ids': ids, 'scores': scores}
+        else:
+            result = {'grid': grid, 'mean': None, 'components': None,
+                      'explained_variance': None,
+                      'explained_variance_ratio': None,
+                      'ids': ids, 'scores': None}
+        cached.update({'count': count, 'maxid': maxid, 'result': result})
+        self._pca[key] = cached
+        return result
+
+    def spectrum_filters(self, edge=None, element=None, beamline=None,
+                         person=None, mode=None, facility=None,
+                         rating_min=None, search=None):
+        """return list of SQL clauses on the spectrum table for filters
+        used by get_spectra() and list_spectra_summary().
+
+        Each filter can be a single value or a list of values to match
+        any of.  Values that are not found will match no spectra.
+        """
+        spec = self.tables['spectrum']
+        bline = self.tables['beamline']
+        fac = self.tables['facility']
+        person_tab = self.tables['person']
+
+        def aslist(val):
+            if isinstance(val, (list, tuple, set)):
+                return list(val)
+            return [val]
+
+        def ids_or_names(val):
+            ids, names = [], []
+            for v in aslist(val):
+                if isinstance(v, int):
+                    ids.append(v)
+                else:
+                    names.append(v)
+            return ids, names
+
+        def ref_ids(val, getter, key='id'):
+            out = []
+            for v in aslist(val):
+                row = getter(v)
+                if row is not None:
+                    out.append(getattr(row, key))
+            return out
+
+        clauses = []
+        if edge is not None:
+            clauses.append(spec.c.edge_id.in_(ref_ids(edge, self.get_edge)))
+        if element is not None:
+            clauses.append(spec.c.element_z.in_(ref_ids(element, self.get_element,
+                                                        key='z')))
+        if mode is not None:
+            clauses.append(spec.c.mode_id.in_(ref_ids(mode, self.get_mode)))
 
+        if beamline is not None:
+            ids, names = ids_or_names(beamline)
+            blids = select(bline.c.id).where(bline.c.name.in_(names))
+            clauses.append(or_(spec.c.beamline_id.in_(ids),
+                               spec.c.beamline_id.in_(blids)))
+        if facility is not None:
+            ids, names = ids_or_names(facility)
+            blids = select(bline.c.id).join(fac, bline.c.facility_id==fac.c.id)
+            blids = blids.where(or_(fac.c.id.in_(ids), fac.c.name.in_(names)))
+            clauses.append(spec.c.beamline_id.in_(blids))
         if person is not None:
-            person_id = self.get_person(person).id
-
-        beamline = None
-        temperature = None
-        reference_sample = None
-        sample_id = 0
-        if 'sample' in xfile.attrs:
-            sample_attrs  = xfile.attrs['sample']
-            if 'temperature' in sample_attrs:
-                temperature = sample_attrs['temperature']
-            if 'name' in sample_attrs:
-                sample_name = sample_attrs.pop('name')
-
-            if 'reference' in sample_attrs:
-                reference_sample = sample_attrs['reference']
-
-            sample_notes = "sample for '%s', uploaded %s" % (fname, now)
-            sample_kws = {}
-            for attr in ('preparation', 'formula'):
-                shortname = attr[:4]
-                if shortname in sample_attrs:
-                    sample_kws[attr] = sample_attrs.pop(shortname)
-                elif attr in sample_attrs:
-                    sample_kws[attr] = sample_attrs.pop(attr)
-
-            if len(sample_attrs) > 0:
-                sample_notes = '%s\n%s' % (sample_notes, json_encode(sample_attrs))
-            if reuse_sample:
-                srow = self.lookup('sample', name=sample_name, person_id=person_id)
-                if len(srow) > 0:
-                    sample_id = srow[0].id
-            if sample_id == 0:
-                sample_id = self.add_sample(sample_name, person_id,
-                                            notes=sample_notes, **sample_kws)
-        self.session.commit()
-        time.sleep(0.025)
-        if reference_mode != 'none':
-            if reference_sample is None:
-                reference_sample = 'unknown'
+            ids, emails = ids_or_names(person)
+            pids = select(person_tab.c.id).where(person_tab.c.email.in_(emails))
+            clauses.append(or_(spec.c.person_id.in_(ids),
+                               spec.c.person_id.in_(pids)))
+        if rating_min is not None:
+            clauses.append(spec.c.rating >= rating_min)
+        if search is not None:
+            clause = self.search_clause(search)
+            if clause is not None:
+                clauses.append(clause)
+        return clauses
+
+    def update(self, tablename, where=None, **kws):
+        """update rows of a table, as for SimpleDB.update, re-index
+        affected spectra when searchable columns are changed, and clear
+        their stored products when their arrays or modes are changed.
+        File text of spectra is compressed as by filetext_columns().
+        Updating spectra also sets their modify_date, energy_ev when
+        their energy, energy units or d-spacing are changed, and their
+        content hash and data fingerprint when their file text, arrays
+        or mode are changed"""
+        if (tablename == 'spectrum' and 'modify_date' not in kws and
+            'modify_date' in self.tables['spectrum'].c):
+            kws['modify_date'] = datetime.now()
+        if tablename == 'spectrum' and 'filetext' in kws:
+            kws.update(self.filetext_columns(kws['filetext']))
+        cols = SEARCH_SOURCES.get(tablename, ())
+        reindex = any(key in cols for key in kws)
+        arrays = (tablename == 'spectrum' and
+                  any(key in PRODUCT_SOURCES for key in kws))
+        rehash = (tablename == 'spectrum' and 'data_fingerprint' not in kws and
+                  any(key in HASH_SOURCES for key in kws))
+        if not (reindex or arrays or rehash):
+            return SimpleDB.update(self, tablename, where=where, **kws)
+
+        with self.transaction():
+            if isinstance(where, dict):
+                where = dict(where)
+            rows = self.get_rows(tablename, where=where, columns=('id',))
+            ids = [row.id for row in rows]
+            SimpleDB.update(self, tablename, where=where, **kws)
+            if arrays:
+                if any(key in ENERGY_SOURCES for key in kws):
+                    self.set_energy_ev(ids)
+                self.clear_products(ids)
+                for spid in ids:
+                    self._arrays.pop(spid, None)
+            if rehash:
+                self.set_hashes(ids)
+            if not reindex:
+                return
+            if tablename != 'spectrum':
+                spec = self.tables['spectrum']
+                fkey = getattr(spec.c, f'{tablename}_id')
+                query = select(spec.c.id).where(fkey.in_(ids))
+                ids = [row.id for row in self.execute(query).fetchall()]
+            self.index_spectra(ids)
+
+    def has_search_index(self):
+        "whether the library has a full text search index"
+        return 'spectrum_fts' in self.tables
+
+    def search_documents(self, spectrum_ids=None):
+        """return text to index for full text search of spectra, as a
+        list of dicts with keys 'id' and creator.SEARCH_COLUMNS"""
+        spec = self.tables['spectrum']
+        sample = self.tables['sample']
+        bline = self.tables['beamline']
+        person = self.tables['person']
+        query = select(spec.c.id, spec.c.name, spec.c.description,
+                       spec.c.comments, spec.c.notes,
+                       sample.c.name.label('sample_name'), sample.c.formula,
+                       bline.c.name.label('beamline_name'),
+                       person.c.name.label('person_name'), person.c.email)
+        query = query.select_from(
+            spec.outerjoin(sample, spec.c.sample_id==sample.c.id)
+            .outerjoin(bline, spec.c.beamline_id==bline.c.id)
+            .outerjoin(person, spec.c.person_id==person.c.id))
+        if spectrum_ids is not None:
+            query = query.where(spec.c.id.in_(spectrum_ids))
+
+        docs = []
+        for row in self.execute(query).fetchall():
+            try:
+                metadata = flatten_text(json.loads(row.notes))
+            except (TypeError, ValueError):
+                metadata = row.notes or ''
+            docs.append({'id': row.id,
+                         'name': row.name or '',
+                         'description': row.description or '',
+                         'sample': flatten_text([row.sample_name, row.formula]),
+                         'comments': row.comments or '',
+                         'beamline': row.beamline_name or '',
+                         'person': flatten_text([row.person_name, row.email]),
+                         'metadata': metadata})
+        return docs
+
+    def unindex_spectra(self, spectrum_ids=None):
+        """remove spectra from the full text search index,
+        all spectra if spectrum_ids is None"""
+        if not self.has_search_index():
+            return
+        key = 'rowid' if self.engine.dialect.name == 'sqlite' else 'spectrum_id'
+        if spectrum_ids is None:
+            self.execute(text("delete from spectrum_fts"))
+        elif len(spectrum_ids) > 0:
+            ids = ', '.join(['%d' % int(i) for i in spectrum_ids])
+            self.execute(text(f"delete from spectrum_fts where {key} in ({ids})"))
+
+    def index_spectra(self, spectrum_ids=None):
+        """add or replace spectra in the full text search index,
+        all spectra if spectrum_ids is None"""
+        if not self.has_search_index():
+            return
+        from .creator import SEARCH_COLUMNS
+        with self.transaction():
+            self.unindex_spectra(spectrum_ids)
+            docs = self.search_documents(spectrum_ids)
+            if len(docs) == 0:
+                return
+            if self.engine.dialect.name == 'sqlite':
+                cols = ', '.join(SEARCH_COLUMNS)
+                vals = ', '.join([f':{c}' for c in SEARCH_COLUMNS])
+                query = text(f"insert into spectrum_fts (rowid, {cols}) values (:id, {vals})")
+            else:
+                query = text("""insert into spectrum_fts (spectrum_id, document)
+                values (:id, to_tsvector('simple', :document))""")
+                for doc in docs:
+                    doc['document'] = ' '.join([doc[c] for c in SEARCH_COLUMNS])
+            self.execute(query, docs)
+
+    def search_clause(self, phrase):
+        """return SQL clause on spectrum.id for a search phrase, matching
+        spectra with all words of the phrase (as word prefixes), or None
+        for an empty phrase.  Without a search index, this matches the
+        phrase within name, description, or comments."""
+        spec = self.tables['spectrum']
+        words = re.findall(r'\w+', phrase)
+        if len(words) == 0:
+            return None
+        if not self.has_search_index():
+            pattern = '%%%s%%' % phrase.strip()
+            return or_(spec.c.name.ilike(pattern),
+                       spec.c.description.ilike(pattern),
+                       spec.c.comments.ilike(pattern))
+        if self.engine.dialect.name == 'sqlite':
+            fts = ' '.join(['"%s"*' % w for w in words])
+            query = text("""select rowid from spectrum_fts
+            where spectrum_fts match :fts_query""")
         else:
-            reference_sample = 'none'
-        beamline_name  = xfile.attrs['beamline']['name']
-        notes = json_encode(xfile.attrs)
-        if verbose:
-            print(f"adding {fname}: {element} {edge}, '{mode}' {len(energy):d} points")
-
-        return self.add_spectrum(spectrum_name, description=description,
-                                 d_spacing=d_spacing, collection_date=c_date,
-                                 person=person_id, beamline=beamline_name,
-                                 edge=edge, element=element, mode=mode,
-                                 energy=energy, energy_units=en_units,
-                                 i0=i0, itrans=itrans, ifluor=ifluor,
-                                 irefer=irefer, sample=sample_id,
-                                 comments=comments, notes=notes,
-                                 filetext=filetext,
-                                 reference_sample=reference_sample,
-                                 reference_mode=reference_mode,
-                                 temperature=temperature,
-                                 commit=commit)
+            fts = ' & '.join(['%s:*' % w for w in words])
+            query = text("""select spectrum_id from spectrum_fts
+            where document @@ to_tsquery('simple', :fts_query)""")
+        query = query.bindparams(fts_query=fts).columns(spec.c.id)
+        return spec.c.id.in_(query)
+
+    def get_spectra(self, edge=None, element=None, beamline=None,
+                    person=None, mode=None, facility=None, rating_min=None,
+                    search=None,
+                    # sample=None, suite=None, citation=None, ligand=None,
+                    order_by='id', light=True, limit=None, offset=None,
+                    after=None, after_id=None, reverse=False):
+        """get all spectra matching some set of criteria
+
+        Parameters
+        ----------
+        edge       by Name
+        element    by Z, Symbol, or Name
+        person     by email or id
+        beamline   by name or id
+        facility   by name or id
+        mode       by name
+        rating_min minimum average rating
+        search     words to search for in the full text search index
+        # sample
+        # citation
+        # ligand
+        # suite
+        light      whether to leave out array and raw file columns [True]
+        limit, offset, after, after_id, reverse: for pages of results,
+                   as for get_rows()
+
+        Each of edge, element, person, beamline, facility, and mode
+        can also be a list of values.
+        """
+        clauses = self.spectrum_filters(edge=edge, element=element,
+                                        beamline=beamline, person=person,
+                                        mode=mode, facility=facility,
+                                        rating_min=rating_min, search=search)
+        where = and_(*clauses) if len(clauses) > 0 else None
+        exclude = SPECTRUM_HEAVY_COLUMNS if light else None
+        return self.get_rows('spectrum', where=where, order_by=order_by,
+                             exclude=exclude, limit=limit, offset=offset,
+                             after=after, after_id=after_id, reverse=reverse)
+
+    def count_spectra(self, **filters):
+        """return number of spectra matching filters, as for get_spectra"""
+        spec = self.tables['spectrum']
+        query = select(func.count(spec.c.id))
+        clauses = self.spectrum_filters(**filters)
+        if len(clauses) > 0:
+            query = query.where(and_(*clauses))
+        return self.execute(query).scalar()
+
+    def list_spectra_summary(self, filters=None, order_by='id', limit=None,
+                             offset=None, after=None, reverse=False):
+        """get summary of spectra for listings, with names of edge,
+        element, mode, person, and beamline, all from a single query.
+
+        Parameters
+        ----------
+        filters    dict of filters, with keys as for get_spectra:
+                   edge, element, beamline, facility, person, mode,
+                   rating_min, search
+        order_by   column to sort by: one of 'id', 'name', 'element_z',
+                   'edge', 'mode', 'beamline', 'rating_summary'
+        limit      maximum number of spectra to return [None, all]
+        offset     number of spectra to skip [None]
+        after      (sort_key, id) of the last spectrum of the previous page,
+                   for keyset pagination [None]
+        reverse    whether to sort in descending order [False]
+
+        Returns
+        -------
+        list of dicts with keys id, name, description, element_z, elem_sym,
+        edge_id, edge, mode_id, mode, beamline_id, beamline_name,
+        person_id, person_name, person_email, rating, rating_summary,
+        and sort_key, the value sorted by.
+
+        Spectra are ordered by (sort_key, id), with NULL values first,
+        or last if reverse=True.
+        """
+        spec = self.tables['spectrum']
+        elem = self.tables['element']
+        edge = self.tables['edge']
+        mode = self.tables['mode']
+        bline = self.tables['beamline']
+        person = self.tables['person']
+
+        query = select(spec.c.id, spec.c.name, spec.c.description,
+                       spec.c.element_z, elem.c.symbol.label('elem_sym'),
+                       spec.c.edge_id, edge.c.name.label('edge'),
+                       spec.c.mode_id, mode.c.name.label('mode'),
+                       spec.c.beamline_id, bline.c.name.label('beamline_name'),
+                       spec.c.person_id, person.c.name.label('person_name'),
+                       person.c.email.label('person_email'),
+                       spec.c.rating, spec.c.rating_summary)
+        query = query.select_from(
+            spec.outerjoin(elem, spec.c.element_z==elem.c.z)
+            .outerjoin(edge, spec.c.edge_id==edge.c.id)
+            .outerjoin(mode, spec.c.mode_id==mode.c.id)
+            .outerjoin(bline, spec.c.beamline_id==bline.c.id)
+            .outerjoin(person, spec.c.person_id==person.c.id))
+
+        if filters is None:
+            filters = {}
+        where = self.spectrum_filters(**filters)
+        if len(where) > 0:
+            query = query.where(and_(*where))
+
+        sort_cols = {'edge': edge.c.name, 'mode': mode.c.name,
+                     'beamline': bline.c.name, 'element': spec.c.element_z,
+                     'rating_summary': spec.c.rating}
+        sort_col = sort_cols.get(order_by, spec.c.get(order_by, None))
+        if sort_col is None:
+            self.table_error(f"no column '{order_by}'", 'spectrum',
+                             'list_spectra_summary')
+        query = query.add_columns(sort_col.label('sort_key'))
+        if after is not None:
+            query = query.where(keyset_clause(sort_col, spec.c.id, after[0],
+                                              after[1], reverse=reverse))
+        query = query.order_by(*keyset_order(sort_col, spec.c.id,
+                                             reverse=reverse))
+        if limit is not None:
+            query = query.limit(limit)
+        if offset is not None:
+            query = query.offset(offset)
+
+        return [dict(row._mapping) for row in self.execute(query).fetchall()]
+
+
+    def add_xdifile(self, fname, spectrum_name=None, description=None,
+                    person=None, reuse_sample=True, mode=None,
+                    on_duplicate='add', verbose=False):
+        """add spectrum from an XDI file, with its sample (see xdi_record()),
+        for a person (email or id, required), returns spectrum id.
+
+        on_duplicate sets what to do if the file text or data match a
+        spectrum in the library (see find_duplicates()): 'add' the file
+        anyway, 'link' to the existing spectrum, returning its id, or
+        raise a ValueError for 'error' ['add']
+        """
+        from .ingest import (xdi_record, record_arrays, spectrum_hashes,
+                             duplicate_message, file_stamp)
+        if on_duplicate not in DUPLICATE_ACTIONS:
+            raise ValueError(f"on_duplicate must be one of {DUPLICATE_ACTIONS}")
+        person_id = self.get_person_id(person, funcname='add_xdifile')
+        rec = xdi_record(fname, mode=mode)
+        spect, sample = rec['spectrum'], rec['sample']
+        spect['content_hash'], spect['data_fingerprint'] = spectrum_hashes(
+            spect['filetext'], record_arrays(spect))
+        if on_duplicate != 'add':
+            dup = self.find_duplicate(spect['content_hash'], spect['data_fingerprint'])
+            if dup is not None and on_duplicate == 'error':
+                raise ValueError(duplicate_message(fname, dup))
+            elif dup is not None:
+                self.set_manifest(file_stamp(fname), status='linked',
+                                  message=duplicate_message(fname, dup),
+                                  spectrum_id=dup['id'])
+                return dup['id']
+        if spectrum_name is not None:
+            spect['name'] = spectrum_name
+        if description is not None:
+            spect['description'] = description
+        else:
+            spect['description'] = spect['name']
+
+        # sample and spectrum are added in a single transaction
+        with self.transaction():
+            all_spect_names = [s.name for s in self.get_rows('spectrum',
+                                                             columns=('name',))]
+            spect['name'] = unique_name(spect['name'], all_spect_names)
+
+            sample_id = 0
+            if sample is not None:
+                if reuse_sample:
+                    srow = self.lookup('sample', name=sample['name'], person_id=person_id)
+                    if len(srow) > 0:
+                        sample_id = srow[0].id
+                if sample_id == 0:
+                    sample_id = self.add_sample(person_id=person_id, **sample)
+            if verbose:
+                print(f"adding {os.path.split(fname)[1]}: {spect['element']} {spect['edge']}, '{spect['mode']}' {len(spect['energy']):d} points")
+
+            spectrum_id = self.add_spectrum(person=person_id, sample=sample_id, **spect)
+            self.set_manifest(file_stamp(fname), status='added', message='',
+                              spectrum_id=spectrum_id)
+            return spectrum_id
+
+    def has_manifest(self):
+        "whether the library has a manifest of ingested files"
+        return 'ingest_manifest' in self.tables
+
+    def get_manifest(self, paths):
+        """return manifest rows for files, as dict of {path: row},
+        leaving out files that are not in the manifest"""
+        out = {}
+        if not self.has_manifest():
+            return out
+        tab = self.tables['ingest_manifest']
+        paths = list(paths)
+        for i in range(0, len(paths), PRODUCT_CHUNK):
+            query = tab.select().where(tab.c.path.in_(paths[i:i+PRODUCT_CHUNK]))
+            for row in self.execute(query).fetchall():
+                out[row.path] = row
+        return out
+
+    def set_manifest(self, stamp, status=None, message=None, spectrum_id=None,
+                     current=None):
+        """record a file (a dict from file_stamp()) in the manifest,
+        replacing any row for the same path (current, if known), and
+        keeping the status, message and spectrum of that row when None"""
+        if not self.has_manifest():
+            return
+        if current is None:
+            current = self.get_manifest([stamp['path']]).get(stamp['path'], None)
+        vals = dict(stamp)
+        vals['ingest_date'] = datetime.now()
+        for key, val in (('status', status), ('message', message),
+                         ('spectrum_id', spectrum_id)):
+            if val is not None or current is None:
+                vals[key] = val
+        if current is None:
+            self.add_row('ingest_manifest', **vals)
+        else:
+            SimpleDB.update(self, 'ingest_manifest', where=current.id, **vals)
+
+    def ingest_files(self, fnames, person, workers=None, mode=None,
+                     reuse_sample=True, incremental=False, on_duplicate='add',
+                     chunk_size=20, batch_size=500, progress=False):
+        """add spectra from many XDI files, reading files and computing
+        stored products in a pool of processes, with all writes to the
+        database made here, in one transaction per batch of files.
+
+        Arguments
+        ----------
+        fnames        list of XDI file names
+        person        email (or id) of person adding the spectra
+        workers       number of processes to use, or None to read files
+                      in this process [None]
+        mode          mode of the spectra, or None to guess for each file [None]
+        reuse_sample  whether to use existing samples of the person with
+                      the same name [True]
+        incremental   whether to skip files already in the manifest and not
+                      changed since, and replace the spectra of changed
+                      files in place [False]
+        on_duplicate  what to do with files whose text or data match a
+                      spectrum in the library or an earlier file:
+                      'add' anyway, 'link' to the existing spectrum, or
+                      'error' to list the file as failed ['add']
+        chunk_size    number of files read by a process at a time [20]
+        batch_size    number of spectra added per transaction [500]
+        progress      True to print throughput and estimated time left
+                      after each batch, or a function to call with a dict
+                      of 'done', 'total', 'added', 'updated', 'linked',
+                      'skipped', 'failed', 'rate' (files per second), and
+                      'eta' (seconds) [False]
+
+        Returns
+        -------
+        dict with 'added' and 'updated' (lists of spectrum ids), 'linked'
+        (list of (file name, spectrum id) for duplicates), 'skipped'
+        (number of unchanged files), 'failed' (list of (file name, error
+        message)), and 'elapsed' (seconds).
+
+        Notes
+        -----
+         Spectrum names are made unique as for add_xdifile(), and samples
+         are named from the XDI metadata, or after the spectrum.  Files
+         that cannot be read are listed in 'failed'.
+
+         Every file read is recorded in the ingest_manifest table in the
+         same transaction as its spectrum, so that an incremental ingest
+         after a crash starts after the last complete batch.  Files with
+         the size and modification time recorded are not read again, and
+         files with the SHA-256 recorded are not parsed again.  Files that
+         failed are tried again only once they change.
+        """
+        from .ingest import read_xdi_chunks, duplicate_message
+        if on_duplicate not in DUPLICATE_ACTIONS:
+            raise ValueError(f"on_duplicate must be one of {DUPLICATE_ACTIONS}")
+        t0 = time.time()
+        fnames = list(dict.fromkeys(os.path.abspath(f) for f in fnames))
+        ntotal = len(fnames)
+        person_id = self.get_person_id(person, funcname='ingest_files')
+        summary = {'added': [], 'updated': [], 'linked': [], 'skipped': 0,
+                   'failed': [], 'elapsed': 0.0}
+
+        manifest = self.get_manifest(fnames)
+        known = {}
+        if incremental:
+            if not self.has_manifest():
+                raise ValueError("incremental ingest needs an ingest_manifest table:"
+                                 " run upgrade_schema()")
+            todo = []
+            for fname in fnames:
+                row = manifest.get(fname, None)
+                if row is not None:
+                    try:
+                        stat = os.stat(fname)
+                    except OSError:
+                        stat = None
+                    if (stat is not None and stat.st_size == row.size and
+                        stat.st_mtime == row.mtime):
+                        summary['skipped'] += 1
+                        continue
+                    known[fname] = row.sha256
+                todo.append(fname)
+            fnames = todo
+
+        chunks = []
+        for i in range(0, len(fnames), chunk_size):
+            names = fnames[i:i+chunk_size]
+            chunks.append((names, mode,
+                           {f: known[f] for f in names if f in known}))
+        spectrum_names = set(s.name for s in self.get_rows('spectrum',
+                                                           columns=('name',)))
+        samples = {}
+        if reuse_sample:
+            for row in self.lookup('sample', columns=('id', 'name'),
+                                   person_id=person_id):
+                samples.setdefault(row.name, row.id)
+
+        state = {'done': summary['skipped']}
+        # hashes of files added in this run: {hash: record}
+        seen = {}
+
+        def write_batch(records):
+            good = []
+            for rec in records:
+                if 'error' in rec:
+                    summary['failed'].append((rec['fname'], rec['error']))
+                elif rec.get('unchanged', False):
+                    summary['skipped'] += 1
+                else:
+                    good.append(rec)
+
+            replace = {}
+            if incremental:
+                spids = [manifest[r['fname']].spectrum_id for r in good
+                         if r['fname'] in manifest]
+                spec = self.tables['spectrum']
+                current = set()
+                for i in range(0, len(spids), PRODUCT_CHUNK):
+                    query = select(spec.c.id).where(spec.c.id.in_(spids[i:i+PRODUCT_CHUNK]))
+                    current.update(row.id for row in self.execute(query).fetchall())
+                for rec in good:
+                    row = manifest.get(rec['fname'], None)
+                    if row is not None and row.spectrum_id in current:
+                        replace[rec['fname']] = row.spectrum_id
+
+            links, dropped = [], set()
+            if on_duplicate != 'add':
+                adding = [r for r in good if r['fname'] not in replace]
+                hashes = [(r['spectrum']['content_hash'],
+                           r['spectrum']['data_fingerprint']) for r in adding]
+                for rec, hash_pair, dup in zip(adding, hashes,
+                                               self.find_duplicates(hashes)):
+                    if dup is None:
+                        for key, match in zip(hash_pair, ('file', 'data')):
+                            if key is not None and key in seen:
+                                other = seen[key]
+                                dup = {'id': None, 'match': match, 'record': other,
+                                       'name': other['spectrum']['name']}
+                                break
+                    if dup is None:
+                        for key in hash_pair:
+                            if key is not None:
+                                seen.setdefault(key, rec)
+                        continue
+                    dropped.add(id(rec))
+                    message = duplicate_message(rec['fname'], dup)
+                    if on_duplicate == 'error':
+                        rec['error'] = message
+                        summary['failed'].append((rec['fname'], message))
+                    else:
+                        rec.update({'linked': dup, 'message': message})
+                        links.append(rec)
+                good = [rec for rec in good if id(rec) not in dropped]
+
+            with self.transaction():
+                new_samples, owners = [], []
+                for rec in good:
+                    sample = rec['sample']
+                    rec['sample_id'] = 0
+                    if sample is None:
+                        continue
+                    if reuse_sample and sample['name'] in samples:
+                        rec['sample_id'] = None
+                        continue
+                    samples[sample['name']] = len(new_samples)
+                    new_samples.append(dict(person_id=person_id, **sample))
+                    owners.append(rec)
+                sample_ids = self.add_rows('sample', new_samples)
+                for rec, sid in zip(owners, sample_ids):
+                    rec['sample_id'] = sid
+                    if reuse_sample:
+                        samples[rec['sample']['name']] = sid
+                for rec in good:
+                    if rec['sample_id'] is None:
+                        rec['sample_id'] = samples[rec['sample']['name']]
+
+                new, rows = [], []
+                for rec in good:
+                    spect = rec['spectrum']
+                    spid = replace.get(rec['fname'], None)
+                    if spid is not None:
+                        row = self.spectrum_row(person=person_id,
+                                                sample=rec['sample_id'], **spect)
+                        for key in ('name', 'submission_date'):
+                            row.pop(key)
+                        self.update('spectrum', where=spid, **row)
+                        rec['spectrum_id'] = spid
+                        summary['updated'].append(spid)
+                        continue
+                    spect['name'] = unique_name(spect['name'], spectrum_names)
+                    spectrum_names.add(spect['name'])
+                    new.append(rec)
+                    rows.append(self.spectrum_row(person=person_id,
+                                                  sample=rec['sample_id'], **spect))
+                columns = set()
+                for row in rows:
+                    columns.update(row.keys())
+                for row in rows:
+                    for col in columns:
+                        row.setdefault(col, None)
+                ids = self.add_rows('spectrum', rows)
+                for rec, spid in zip(new, ids):
+                    rec['spectrum_id'] = spid
+                for rec in links:
+                    dup = rec['linked']
+                    if dup['id'] is None:
+                        dup['id'] = dup['record']['spectrum_id']
+                    rec['spectrum_id'] = dup['id']
+                    summary['linked'].append((rec['fname'], dup['id']))
+
+                if self.has_products():
+                    now = datetime.now()
+                    products = []
+                    for rec in good:
+                        for kind, params, row in rec['products']:
+                            row.update({'spectrum_id': rec['spectrum_id'],
+                                        'kind': kind,
+                                        'param_hash': hash_params(params),
+                                        'params': json.dumps(params),
+                                        'create_date': now})
+                            products.append(row)
+                    self.add_rows('spectrum_product', products, return_ids=False)
+                self.index_spectra(ids)
+
+                for rec in records:
+                    if rec.get('stamp', None) is None:
+                        continue
+                    status = message = spid = None
+                    if 'error' in rec:
+                        status, message = 'failed', rec['error']
+                    elif 'linked' in rec:
+                        status, message = 'linked', rec['message']
+                        spid = rec['spectrum_id']
+                    elif not rec.get('unchanged', False):
+                        status, message = 'added', ''
+                        spid = rec['spectrum_id']
+                    self.set_manifest(rec['stamp'], status=status,
+                                      message=message, spectrum_id=spid,
+                                      current=manifest.get(rec['fname'], None))
+            summary['added'].extend(ids)
+
+            state['done'] += len(records)
+            elapsed = time.time() - t0
+            rate = (state['done'] - summary['skipped'])/max(elapsed, 1.e-9)
+            status = {'done': state['done'], 'total': ntotal,
+                      'added': len(summary['added']),
+                      'updated': len(summary['updated']),
+                      'linked': len(summary['linked']),
+                      'skipped': summary['skipped'],
+                      'failed': len(summary['failed']), 'rate': rate,
+                      'eta': (ntotal - state['done'])/max(rate, 1.e-9)}
+            if callable(progress):
+                progress(status)
+            elif progress:
+                print("ingest: %(done)d/%(total)d files, %(added)d added, "
+                      "%(updated)d updated, %(linked)d linked, "
+                      "%(skipped)d unchanged, "
+                      "%(failed)d failed, %(rate).1f files/s, "
+                      "%(eta).0f s left" % status)
+
+        results = read_xdi_chunks(chunks, workers=workers)
+        try:
+            batch = []
+            for records in results:
+                batch.extend(records)
+                if len(batch) >= batch_size:
+                    write_batch(batch)
+                    batch = []
+            if len(batch) > 0:
+                write_batch(batch)
+        finally:
+            results.close()
+        summary['elapsed'] = time.time() - t0
+        return summary
+
+    def ingest_directory(self, path, person, workers=None, pattern='*.xdi',
+                         exclude=('nonxafs', 'upload'), **kws):
+        """add spectra from all XDI files in a directory and its
+        subdirectories, leaving out files with any of the words in
+        exclude in their path.  Other arguments are as for ingest_files()"""
+        fnames = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for fname in sorted(fnmatch.filter(filenames, pattern)):
+                fname = os.path.join(dirpath, fname)
+                if not any(word in fname for word in exclude):
+                    fnames.append(fname)
+        return self.ingest_files(fnames, person, workers=workers, **kws)
 
 
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+  read XAS Data Interchange (XDI) files in a single pass over their text
+"""
+
+import io
+import numpy as np
+
+class XDIData(object):
+    """contents of an XDI file
+
+    text        full text of the file
+    version     XDI version and any extra version words
+    attrs       dict of {family: {field: value}} of the header metadata,
+                with lower-case family and field names
+    comments    user comments, between the '///' and '---' header lines
+    labels      list of array names, from the Column.N metadata
+    units       list of array units, '' if not given
+    data        2-D array of data, one row per array
+
+    Arrays are looked up by name with get(), as for dicts.
+    """
+    def __init__(self, text='', version='', attrs=None, comments='',
+                 labels=None, units=None, data=None):
+        self.text = text
+        self.version = version
+        self.attrs = {} if attrs is None else attrs
+        self.comments = comments
+        self.labels = [] if labels is None else labels
+        self.units = [] if units is None else units
+        self.data = np.zeros((0, 0)) if data is None else data
+
+    def get(self, label, default=None):
+        "return array by name, or default"
+        label = label.lower()
+        if label in self.labels:
+            return self.data[self.labels.index(label)]
+        return default
+
+    def _meta(self, family, field):
+        "metadata value, without any '||' address, or None"
+        value = self.attrs.get(family, {}).get(field, None)
+        if value is not None and '||' in value:
+            value = value.split('||', 1)[0]
+        return None if value is None else value.strip()
+
+    @property
+    def element(self):
+        return self._meta('element', 'symbol')
+
+    @property
+    def edge(self):
+        return self._meta('element', 'edge')
+
+    @property
+    def dspacing(self):
+        "mono d-spacing in Angstroms, or -1 if not given"
+        value = self._meta('mono', 'd_spacing')
+        if value is None:
+            value = self._meta('monochromator', 'd_spacing')
+        try:
+            return float(value.split()[0])
+        except (AttributeError, IndexError, ValueError):
+            return -1.0
+
+    @property
+    def energy_label(self):
+        "name of the energy array: 'energy', or 'angle', or None"
+        for label in ('energy', 'angle'):
+            if label in self.labels:
+                return label
+        return None
+
+    @property
+    def energy_units(self):
+        "units of the energy array, 'eV' if not given"
+        label = self.energy_label
+        if label is None:
+            return 'eV'
+        units = self.units[self.labels.index(label)]
+        return units if len(units) > 0 else 'eV'
+
+def parse_xdi(text, filename='XDI text'):
+    """parse the text of an XDI file, returning an XDIData.
+
+    The header is read line by line, and all data lines are parsed
+    together with numpy.loadtxt.  Raises ValueError for text that is
+    not valid XDI.
+    """
+    lines = text.split('\n')
+    line0 = lines[0].strip().lstrip('#').strip()
+    if not line0.startswith('XDI/'):
+        raise ValueError(f"{filename}: not an XDI file")
+    version = line0[4:].strip()
+
+    attrs = {'column': {}}
+    columns = {}
+    comments = []
+    in_comments = False
+    ndata = len(lines)
+    for iline, line in enumerate(lines[1:], start=1):
+        sline = line.strip()
+        if not sline.startswith('#'):
+            ndata = iline
+            break
+        hline = sline[1:].strip()
+        if hline.startswith('---'):
+            in_comments = False
+            continue
+        if hline.startswith('//'):
+            in_comments = True
+            continue
+        if in_comments:
+            if len(hline) > 0:
+                comments.append(hline)
+            continue
+        if ':' not in hline:
+            continue
+        name, value = [w.strip() for w in hline.split(':', 1)]
+        name = name.lower()
+        if '.' not in name:
+            continue
+        family, field = name.split('.', 1)
+        attrs.setdefault(family, {})[field] = value
+        if family == 'column':
+            words = value.split('#', 1)[0].split()
+            try:
+                if len(words) > 0:
+                    columns[int(field)] = words
+            except ValueError:
+                pass
+
+    try:
+        data = np.loadtxt(io.StringIO('\n'.join(lines[ndata:])), ndmin=2,
+                          comments='#', dtype=np.float64).T
+    except ValueError as exc:
+        raise ValueError(f"{filename}: could not read data: {exc}")
+    if data.size == 0:
+        raise ValueError(f"{filename}: no data")
+
+    labels, units = [], []
+    for icol in range(data.shape[0]):
+        words = columns.get(icol+1, [f'col{icol+1:d}'])
+        labels.append(words[0].lower())
+        units.append(words[1] if len(words) > 1 and words[1] != '||' else '')
+    return XDIData(text=text, version=version, attrs=attrs,
+                   comments='\n'.join(comments), labels=labels, units=units,
+                   data=data)
+
+def read_xdi(fname):
+    "read an XDI file, returning an XDIData (see parse_xdi)"
+    with open(fname, 'r') as fh:
+        text = fh.read()
+    return parse_xdi(text, filename=fname)